@@ -34,16 +34,661 @@ def arredondar_valores(dados, casas_decimais=2):
 
 app = Flask(__name__)
 
+
+# INÍCIO DISJUNTOR POR DOMÍNIO E CACHE NEGATIVO
+# Quando o site do produtor cai ou nos bloqueia, cada critério de página tentava de novo e
+# esperava o tempo limite inteiro. Agora todo download passa por um disjuntor por domínio:
+# FALHAS_PARA_ABRIR_DISJUNTOR falhas em JANELA_FALHAS_DISJUNTOR segundos abrem o disjuntor e,
+# por ESPERA_DISJUNTOR segundos, os downloads do domínio falham na hora. Depois da espera,
+# uma única tentativa de teste decide se ele fecha ou volta a abrir. A falha de cada URL
+# também fica guardada por TTL_CACHE_NEGATIVO segundos (cache negativo).
+# O estado mora no cache compartilhado (SQLite), então vale para todos os workers e para o
+# agendador de acompanhamento: um domínio fora do ar custa os tempos limite uma vez só.
+# Se o SQLite falhar, o download segue sem disjuntor.
+import os
+import json
+import logging
+import sqlite3
+import time
+from urllib.parse import urlparse
+
+FALHAS_PARA_ABRIR_DISJUNTOR = int(os.environ.get("FALHAS_PARA_ABRIR_DISJUNTOR", 3))
+JANELA_FALHAS_DISJUNTOR = int(os.environ.get("JANELA_FALHAS_DISJUNTOR", 60))
+ESPERA_DISJUNTOR = int(os.environ.get("ESPERA_DISJUNTOR", 120))
+TTL_CACHE_NEGATIVO = int(os.environ.get("TTL_CACHE_NEGATIVO", 60))
+# Prazo da tentativa de teste: se o worker que a reservou morrer, outro pode testar depois dele
+VALIDADE_TENTATIVA_TESTE = 60
+# Respostas HTTP que indicam site fora do ar ou bloqueando o acesso (além de 5xx)
+STATUS_FALHA_DOMINIO = (403, 408, 429)
+
+# Tabelas do cache compartilhado (ver conexao_cache_compartilhado)
+ESQUEMA_DISJUNTORES = (
+    "CREATE TABLE IF NOT EXISTS disjuntores ("
+    "dominio TEXT PRIMARY KEY, falhas TEXT NOT NULL DEFAULT '[]', "
+    "aberto_ate REAL NOT NULL DEFAULT 0, testando_ate REAL NOT NULL DEFAULT 0)",
+    "CREATE TABLE IF NOT EXISTS falhas_urls (url TEXT PRIMARY KEY, motivo TEXT NOT NULL, expira_em REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_falhas_urls_expira_em ON falhas_urls (expira_em)",
+)
+
+
+class PaginaInacessivel(requests.RequestException):
+    """
+    Download recusado sem acessar a rede: disjuntor do domínio aberto ou falha recente da URL.
+    """
+
+
+def dominio_url(url):
+    return (urlparse(url).hostname or "").lower()
+
+
+def mensagem_disjuntor_aberto(dominio, aberto_ate, agora):
+    return (
+        f"O site {dominio} está fora do ar ou bloqueando o acesso (falhas seguidas); "
+        f"nova tentativa em até {max(1, int(aberto_ate - agora))} s."
+    )
+
+
+def motivo_disjuntor_aberto(dominio):
+    """
+    Mensagem se o disjuntor do domínio está aberto (ou em teste por outro worker); só leitura.
+    """
+    agora = time.time()
+    try:
+        disjuntor = conexao_cache_compartilhado().execute(
+            "SELECT aberto_ate, testando_ate FROM disjuntores WHERE dominio = ? AND (aberto_ate > ? OR testando_ate > ?)",
+            (dominio, agora, agora)
+        ).fetchone()
+    except sqlite3.Error:
+        return None
+    return mensagem_disjuntor_aberto(dominio, max(disjuntor), agora) if disjuntor else None
+
+
+def verificar_acesso(url):
+    """
+    Levanta PaginaInacessivel se a URL falhou há pouco ou se o disjuntor do domínio está aberto.
+    Com a espera cumprida, só o worker que reservar a tentativa de teste passa.
+    """
+    agora = time.time()
+    dominio = dominio_url(url)
+    try:
+        conexao = conexao_cache_compartilhado()
+        falha = conexao.execute(
+            "SELECT motivo FROM falhas_urls WHERE url = ? AND expira_em > ?", (url, agora)
+        ).fetchone()
+        if falha:
+            raise PaginaInacessivel(falha[0])
+        disjuntor = conexao.execute(
+            "SELECT aberto_ate, testando_ate FROM disjuntores WHERE dominio = ?", (dominio,)
+        ).fetchone()
+        if not disjuntor or not disjuntor[0]:
+            return
+        aberto_ate, testando_ate = disjuntor
+        if aberto_ate <= agora and testando_ate <= agora:
+            # Espera cumprida: reserva a tentativa de teste (as demais continuam falhando na hora)
+            with transacao_imediata(conexao):
+                cursor = conexao.execute(
+                    "UPDATE disjuntores SET testando_ate = ? "
+                    "WHERE dominio = ? AND aberto_ate > 0 AND aberto_ate <= ? AND testando_ate <= ?",
+                    (agora + VALIDADE_TENTATIVA_TESTE, dominio, agora, agora)
+                )
+            if cursor.rowcount == 1:
+                return
+        raise PaginaInacessivel(mensagem_disjuntor_aberto(dominio, max(aberto_ate, testando_ate), agora))
+    except sqlite3.Error as e:
+        logging.error(f"[ERRO] Disjuntor indisponível, baixando {url} sem ele: {e}")
+
+
+def registrar_falha_download(url, motivo, falha_dominio=True):
+    """
+    Guarda a falha da URL no cache negativo e, se a falha é do site (rede, 5xx, bloqueio),
+    conta para o disjuntor do domínio.
+    """
+    agora = time.time()
+    dominio = dominio_url(url)
+    try:
+        with transacao_imediata(conexao_cache_compartilhado()) as conexao:
+            conexao.execute("DELETE FROM falhas_urls WHERE expira_em <= ?", (agora,))
+            conexao.execute(
+                "INSERT OR REPLACE INTO falhas_urls (url, motivo, expira_em) VALUES (?, ?, ?)",
+                (url, motivo, agora + TTL_CACHE_NEGATIVO)
+            )
+            if not falha_dominio:
+                # O site respondeu (ex.: 404): o domínio está de pé
+                conexao.execute("DELETE FROM disjuntores WHERE dominio = ?", (dominio,))
+                return
+
+            linha = conexao.execute(
+                "SELECT falhas, aberto_ate, testando_ate FROM disjuntores WHERE dominio = ?", (dominio,)
+            ).fetchone()
+            falhas, aberto_ate, testando_ate = (json.loads(linha[0]), linha[1], linha[2]) if linha else ([], 0, 0)
+            falhas = [momento for momento in falhas if momento >= agora - JANELA_FALHAS_DISJUNTOR] + [agora]
+            if testando_ate or len(falhas) >= FALHAS_PARA_ABRIR_DISJUNTOR:
+                falhas, aberto_ate, testando_ate = [], agora + ESPERA_DISJUNTOR, 0
+                logging.warning(f"[DOWNLOAD] Disjuntor aberto para {dominio} por {ESPERA_DISJUNTOR} s: {motivo}")
+            conexao.execute(
+                "INSERT OR REPLACE INTO disjuntores (dominio, falhas, aberto_ate, testando_ate) VALUES (?, ?, ?, ?)",
+                (dominio, json.dumps(falhas), aberto_ate, testando_ate)
+            )
+    except sqlite3.Error as e:
+        logging.error(f"[ERRO] Falha ao registrar erro de download de {url} no disjuntor: {e}")
+
+
+def registrar_sucesso_download(url):
+    """
+    Limpa a falha guardada da URL e fecha o disjuntor do domínio (só escreve se houver o que limpar).
+    """
+    dominio = dominio_url(url)
+    try:
+        conexao = conexao_cache_compartilhado()
+        if conexao.execute("SELECT 1 FROM falhas_urls WHERE url = ?", (url,)).fetchone():
+            conexao.execute("DELETE FROM falhas_urls WHERE url = ?", (url,))
+        if conexao.execute("SELECT 1 FROM disjuntores WHERE dominio = ?", (dominio,)).fetchone():
+            conexao.execute("DELETE FROM disjuntores WHERE dominio = ?", (dominio,))
+            logging.debug(f"[DEBUG] Disjuntor de {dominio} fechado.")
+    except sqlite3.Error as e:
+        logging.error(f"[ERRO] Falha ao limpar o disjuntor de {dominio}: {e}")
+
+
+def motivo_falha_recente(url):
+    """
+    Motivo da última falha da URL (se ainda no cache negativo), para exibir no resultado.
+    """
+    try:
+        falha = conexao_cache_compartilhado().execute(
+            "SELECT motivo FROM falhas_urls WHERE url = ? AND expira_em > ?", (url, time.time())
+        ).fetchone()
+    except sqlite3.Error:
+        return None
+    return falha[0] if falha else None
+
+
+def descrever_falha_download(erro):
+    if isinstance(erro, requests.Timeout):
+        return "Tempo esgotado ao acessar a página."
+    if isinstance(erro, requests.ConnectionError):
+        return "Não foi possível conectar ao site da página."
+    return f"Erro ao acessar a página: {erro}"
+
+# FIM DISJUNTOR POR DOMÍNIO E CACHE NEGATIVO
+
+
+# INÍCIO DOWNLOAD DE PÁGINAS
+# Todas as páginas de vendas são baixadas em streaming, com limite de bytes e
+# verificação de Content-Type, para limitar memória e tempo em páginas inchadas.
+import os
+import logging
+
+# Limite de bytes lidos por página (configurável pela variável de ambiente LIMITE_BYTES_HTML)
+LIMITE_BYTES_HTML = int(os.environ.get("LIMITE_BYTES_HTML", 2 * 1024 * 1024))
+# O timeout do requests vale por leitura; este limite vale para o download inteiro
+# (um servidor que manda um byte por vez não segura a análise indefinidamente)
+TEMPO_MAXIMO_DOWNLOAD = float(os.environ.get("TEMPO_MAXIMO_DOWNLOAD", 20))
+TAMANHO_BLOCO_DOWNLOAD = 16 * 1024
+TIPOS_CONTEUDO_HTML = ("text/html", "application/xhtml+xml")
+FIM_HEAD = b"</head>"
+
+# Detecção de encoding: cabeçalho HTTP, <meta charset> nos primeiros KB, BOM e, por último, detecção completa
+import codecs
+import time
+from charset_normalizer import from_bytes
+
+BYTES_SNIFF_META_CHARSET = 4096
+CHARSET_HEADER_REGEX = re.compile(r"charset\s*=\s*[\"']?\s*([\w.:-]+)", re.IGNORECASE)
+META_CHARSET_REGEX = re.compile(rb"<meta[^>]+charset\s*=\s*[\"']?\s*([\w.:-]+)", re.IGNORECASE)
+BOMS_ENCODING = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def conteudo_html(response):
+    """
+    Verifica pelo cabeçalho Content-Type se a resposta é HTML.
+    Respostas sem Content-Type são aceitas.
+    """
+    tipo = response.headers.get("Content-Type", "")
+    if not tipo:
+        return True
+    return tipo.split(";")[0].strip().lower() in TIPOS_CONTEUDO_HTML
+
+
+def encoding_valido(nome):
+    """
+    Retorna o nome do encoding se o Python o reconhece, ou None.
+    """
+    if not nome:
+        return None
+    if isinstance(nome, bytes):
+        nome = nome.decode("ascii", errors="ignore")
+    try:
+        return codecs.lookup(nome.strip()).name
+    except LookupError:
+        return None
+
+
+def detectar_encoding(conteudo, content_type=""):
+    """
+    Identifica o encoding da página pelo caminho mais barato disponível.
+    Retorna (encoding, fonte), onde fonte indica qual etapa resolveu.
+    """
+    # 1. Cabeçalho HTTP
+    charset_header = CHARSET_HEADER_REGEX.search(content_type or "")
+    encoding = encoding_valido(charset_header.group(1)) if charset_header else None
+    if encoding:
+        return encoding, "header"
+
+    # 2. <meta charset> ou <meta http-equiv> nos primeiros KB
+    meta = META_CHARSET_REGEX.search(conteudo[:BYTES_SNIFF_META_CHARSET])
+    encoding = encoding_valido(meta.group(1)) if meta else None
+    if encoding:
+        return encoding, "meta"
+
+    # 3. BOM
+    for bom, encoding in BOMS_ENCODING:
+        if conteudo.startswith(bom):
+            return encoding, "bom"
+
+    # 4. Último recurso: detecção completa sobre o conteúdo
+    melhor = from_bytes(conteudo).best()
+    if melhor and encoding_valido(melhor.encoding):
+        return melhor.encoding, "deteccao"
+    return "utf-8", "padrao"
+
+
+def decodificar_html(conteudo, content_type=""):
+    """
+    Decodifica os bytes da página e mede o tempo gasto na detecção do encoding.
+    """
+    inicio = time.perf_counter()
+    encoding, fonte = detectar_encoding(conteudo, content_type)
+    tempo_deteccao_ms = (time.perf_counter() - inicio) * 1000
+    texto = conteudo.decode(encoding, errors="replace")
+    return texto, encoding, fonte, tempo_deteccao_ms
+
+
+def baixar_html(url, timeout=10, limite_bytes=None, ate_head=False):
+    """
+    Baixa a página em blocos, parando no limite de bytes ou, com ate_head=True,
+    assim que o fechamento do <head> for lido.
+    Retorna um dicionário com o conteúdo ou None se a página não for HTML válido.
+    Levanta PaginaInacessivel, sem acessar a rede, se o domínio ou a URL falharam há pouco.
+    """
+    limite_bytes = limite_bytes or LIMITE_BYTES_HTML
+    verificar_acesso(url)
+    inicio = time.perf_counter()
+    try:
+        with requests.get(url, timeout=timeout, stream=True) as response:
+            if response.status_code != 200:
+                print(f"Página não carregou corretamente. Status: {response.status_code}")
+                registrar_falha_download(
+                    url, f"A página respondeu com o status HTTP {response.status_code}.",
+                    falha_dominio=response.status_code >= 500 or response.status_code in STATUS_FALHA_DOMINIO
+                )
+                return None
+            if not conteudo_html(response):
+                print(f"Conteúdo rejeitado (não é HTML): {response.headers.get('Content-Type')}")
+                registrar_falha_download(url, "O endereço não é uma página HTML.", falha_dominio=False)
+                return None
+
+            blocos = []
+            total = 0
+            truncado = False
+            cauda = b""
+            for bloco in response.iter_content(chunk_size=TAMANHO_BLOCO_DOWNLOAD):
+                if time.perf_counter() - inicio > TEMPO_MAXIMO_DOWNLOAD:
+                    raise requests.Timeout(f"Download de {url} passou de {TEMPO_MAXIMO_DOWNLOAD:.0f} s.")
+                if not bloco:
+                    continue
+                if total + len(bloco) > limite_bytes:
+                    blocos.append(bloco[:limite_bytes - total])
+                    total = limite_bytes
+                    truncado = True
+                    break
+                blocos.append(bloco)
+                total += len(bloco)
+
+                # Procura o </head> também na fronteira entre dois blocos
+                if ate_head:
+                    janela = (cauda + bloco).lower()
+                    if FIM_HEAD in janela:
+                        break
+                    cauda = janela[-len(FIM_HEAD):]
+
+            content_type = response.headers.get("Content-Type", "")
+    except requests.RequestException as e:
+        registrar_falha_download(url, descrever_falha_download(e))
+        raise
+    registrar_sucesso_download(url)
+
+    if truncado:
+        logging.warning(f"[DOWNLOAD] Página {url} truncada em {limite_bytes} bytes.")
+
+    conteudo = b"".join(blocos)
+    tempo_download_ms = (time.perf_counter() - inicio) * 1000
+
+    # O texto decodificado fica guardado junto com os bytes originais
+    texto, encoding, fonte_encoding, tempo_deteccao_ms = decodificar_html(conteudo, content_type)
+    logging.debug(
+        f"[METRICA] {url}: download={tempo_download_ms:.1f}ms "
+        f"deteccao_encoding={tempo_deteccao_ms:.2f}ms ({fonte_encoding}: {encoding})"
+    )
+
+    return {
+        "url": url,
+        "status": 200,
+        "content_type": content_type,
+        "conteudo": conteudo,
+        "texto": texto,
+        "encoding": encoding,
+        "fonte_encoding": fonte_encoding,
+        "bytes_lidos": total,
+        "truncado": truncado,
+        "tempo_download_ms": tempo_download_ms,
+        "tempo_deteccao_encoding_ms": tempo_deteccao_ms
+    }
+
+
+
+def download_de_bytes(url, conteudo, content_type=""):
+    """
+    Monta o mesmo dicionário de baixar_html a partir de bytes já baixados
+    (usado quando o HTML chega de outro processo ou de outra etapa).
+    """
+    texto, encoding, fonte_encoding, tempo_deteccao_ms = decodificar_html(conteudo, content_type)
+    return {
+        "url": url,
+        "status": 200,
+        "content_type": content_type,
+        "conteudo": conteudo,
+        "texto": texto,
+        "encoding": encoding,
+        "fonte_encoding": fonte_encoding,
+        "bytes_lidos": len(conteudo),
+        "truncado": False,
+        "tempo_download_ms": 0.0,
+        "tempo_deteccao_encoding_ms": tempo_deteccao_ms
+    }
+
+# FIM DOWNLOAD DE PÁGINAS
+
+
+# INÍCIO EXTRAÇÃO DE TEXTO VISÍVEL
+# Os critérios de página trabalham apenas sobre o texto que o visitante realmente vê.
+# Scripts, estilos, JSON-LD e blocos ocultos ficam de fora das buscas por palavras-chave.
+from bs4 import Comment, Declaration, Doctype, CData, ProcessingInstruction, NavigableString, Tag
+
+# Tags cujo conteúdo nunca é renderizado como texto na página
+TAGS_NAO_RENDERIZADAS = {
+    "head", "script", "style", "noscript", "template", "svg", "canvas",
+    "iframe", "object", "embed", "video", "audio"
+}
+
+# Nós de texto que não fazem parte do conteúdo visível
+TIPOS_TEXTO_IGNORADOS = (Comment, Declaration, Doctype, CData, ProcessingInstruction)
+
+ESTILO_OCULTO_REGEX = re.compile(r"display\s*:\s*none|visibility\s*:\s*hidden", re.IGNORECASE)
+ESPACOS_REGEX = re.compile(r"\s+")
+
+
+def elemento_oculto(elemento):
+    """
+    Verifica se o elemento está marcado como oculto (atributo hidden, aria-hidden ou estilo inline).
+    """
+    if elemento.name in TAGS_NAO_RENDERIZADAS:
+        return True
+    if elemento.name == "input" and elemento.get("type", "").lower() == "hidden":
+        return True
+    if elemento.has_attr("hidden"):
+        return True
+    if str(elemento.get("aria-hidden", "")).lower() == "true":
+        return True
+    estilo = elemento.get("style")
+    return bool(estilo and ESTILO_OCULTO_REGEX.search(estilo))
+
+
+def extrair_texto_visivel(soup):
+    """
+    Extrai apenas o texto renderizado da página, com espaços colapsados.
+    Não altera o soup, que continua disponível para as verificações de tags.
+    """
+    partes = []
+    pilha = [soup]
+    while pilha:
+        no = pilha.pop()
+        if isinstance(no, NavigableString):
+            if not isinstance(no, TIPOS_TEXTO_IGNORADOS):
+                partes.append(no)
+            continue
+        if isinstance(no, Tag) and no is not soup and elemento_oculto(no):
+            continue
+        # Empilha os filhos em ordem reversa para manter a ordem do documento
+        pilha.extend(reversed(no.contents))
+
+    return ESPACOS_REGEX.sub(" ", " ".join(partes)).strip()
+
+
+def carregar_pagina(url, timeout=5):
+    """
+    Baixa e interpreta a página uma única vez para todos os critérios de página.
+    Retorna um dicionário com o soup e o texto visível, ou None se a página não carregar.
+    """
+    download = baixar_html(url, timeout=timeout)
+    if not download:
+        return None
+    return interpretar_pagina(url, download)
+
+
+def interpretar_pagina(url, download):
+    """
+    Interpreta o HTML já baixado, gerando o soup e o texto visível.
+    """
+    soup = BeautifulSoup(download["texto"], 'html.parser')
+    return {
+        "url": url,
+        "soup": soup,
+        "texto_visivel": extrair_texto_visivel(soup)
+    }
+
+# FIM EXTRAÇÃO DE TEXTO VISÍVEL
+
+
+# INÍCIO IMPRESSÃO DIGITAL DO CONTEÚDO
+# A maioria das páginas de vendas não muda entre uma análise e outra, mas os bytes mudam
+# (datas, horários, tokens de sessão, "?v=123" nos scripts). A impressão digital da página
+# usa o texto, a sequência de tags e as metatags, sem scripts, estilos e atributos, e com
+# os tokens voláteis trocados por "0". O hash SHA-256 desse texto é a chave de conteúdo do
+# memo de critérios; o SimHash de 64 bits permite reaproveitar os critérios de texto quando
+# a nova versão da mesma URL difere da anterior em poucos bits. Preço, faixa de preço e SEO
+# básico mudam com poucas palavras (trocar R$197 por R$97 mexe 1 ou 2 bits) e só são
+# reaproveitados com o hash exato. A versão de referência de cada URL fica no cache
+# compartilhado, para que todos os workers usem a mesma chave e só um indexe a página.
+from html import unescape
+import hashlib
+import numpy as np
+
+# Até quantos bits de diferença no SimHash a página é considerada a mesma (0 desliga)
+DISTANCIA_MAXIMA_SIMHASH = int(os.environ.get("DISTANCIA_MAXIMA_SIMHASH", 3))
+# Critérios que uma versão quase igual da página pode herdar da versão de referência
+CRITERIOS_REAPROVEITADOS_SIMHASH = ("qualidade_pagina", "copywriting", "beneficios_ofertas")
+# Páginas quase vazias (ex.: montadas por JavaScript) usam o hash dos bytes, sem SimHash
+MINIMO_TOKENS_IMPRESSAO = 50
+TAMANHO_SHINGLE = 3
+# URLs com versão de referência guardada (as usadas há mais tempo saem primeiro)
+LIMITE_IMPRESSOES_PAGINAS = int(os.environ.get("LIMITE_IMPRESSOES_PAGINAS", 100000))
+
+# Tabela do cache compartilhado (ver conexao_cache_compartilhado); o SimHash vai em
+# hexadecimal porque não cabe num INTEGER do SQLite (64 bits sem sinal)
+ESQUEMA_IMPRESSOES_PAGINAS = (
+    "CREATE TABLE IF NOT EXISTS impressoes_paginas ("
+    "url TEXT PRIMARY KEY, hash TEXT NOT NULL, simhash TEXT, usado_em REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_impressoes_paginas_usado_em ON impressoes_paginas (usado_em)",
+)
+
+BLOCOS_IGNORADOS_REGEX = re.compile(
+    r"<(script|style|noscript|template|svg)\b.*?</\1\s*>|<!--.*?-->", re.IGNORECASE | re.DOTALL
+)
+META_REGEX = re.compile(r"<meta\b[^>]*>", re.IGNORECASE)
+ATRIBUTO_META_REGEX = re.compile(r"\b(name|property|http-equiv|content)\s*=\s*[\"']([^\"']*)", re.IGNORECASE)
+NOME_TAG_REGEX = re.compile(r"<([a-zA-Z][\w-]*)")
+TAGS_REGEX = re.compile(r"<[^>]*>")
+# Datas, horários e tokens longos com dígitos (ids de sessão, nonces, hashes de build)
+TOKENS_VOLATEIS_REGEX = re.compile(
+    r"\b\d{1,4}[/.-]\d{1,2}[/.-]\d{1,4}(?:t\d{1,2}:\d{2}(?::\d{2})?\S*)?"
+    r"|\b\d{1,2}:\d{2}(?::\d{2})?\b"
+    r"|\b(?=[\w-]*\d)[\w-]{16,}\b"
+)
+BITS_SIMHASH = np.arange(64, dtype=np.uint64)
+# MinHash: 64 funções de hash (multiplicador ímpar + deslocamento, fixos para que as assinaturas
+# gravadas continuem comparáveis entre processos e reinícios)
+PERMUTACOES_MINHASH = 64
+_gerador_minhash = np.random.default_rng(20240501)
+MULTIPLICADORES_MINHASH = _gerador_minhash.integers(0, 2 ** 63, PERMUTACOES_MINHASH, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+DESLOCAMENTOS_MINHASH = _gerador_minhash.integers(0, 2 ** 63, PERMUTACOES_MINHASH, dtype=np.uint64)
+
+
+def texto_impressao_digital(html):
+    """
+    Texto normalizado da página para a impressão digital: tags (estrutura), metatags e texto,
+    em minúsculas, sem scripts/estilos/comentários e com os tokens voláteis neutralizados.
+    """
+    html = BLOCOS_IGNORADOS_REGEX.sub(" ", html)
+    metas = [
+        " ".join(f"{nome.lower()}={valor}" for nome, valor in ATRIBUTO_META_REGEX.findall(meta))
+        for meta in META_REGEX.findall(html)
+    ]
+    estrutura = " ".join(f"<{nome}>" for nome in NOME_TAG_REGEX.findall(html))
+    texto = unescape(TAGS_REGEX.sub(" ", html))
+    normalizado = TOKENS_VOLATEIS_REGEX.sub("0", f"{estrutura} {' '.join(metas)} {texto}".lower())
+    return ESPACOS_REGEX.sub(" ", normalizado).strip()
+
+
+def rotacionar_bits(valores, bits):
+    return (valores << np.uint64(bits)) | (valores >> np.uint64(64 - bits))
+
+
+def hashes_shingles(tokens):
+    """
+    Hashes de 64 bits (distintos) dos shingles de TAMANHO_SHINGLE tokens. Cada token distinto
+    é hasheado uma vez; o hash do shingle combina os hashes dos tokens rotacionados pela
+    posição, tudo em NumPy.
+    """
+    ids = {}
+    posicoes = np.fromiter((ids.setdefault(token, len(ids)) for token in tokens), dtype=np.int64, count=len(tokens))
+    hashes_tokens = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big") for token in ids),
+        dtype=np.uint64, count=len(ids)
+    )[posicoes]
+    tamanho = min(TAMANHO_SHINGLE, len(hashes_tokens))
+    quantidade = len(hashes_tokens) - tamanho + 1
+    hashes = np.zeros(quantidade, dtype=np.uint64)
+    for deslocamento in range(tamanho):
+        hashes ^= rotacionar_bits(hashes_tokens[deslocamento:deslocamento + quantidade], deslocamento * 21 + 1)
+    return np.unique(hashes)
+
+
+def calcular_simhash(hashes):
+    """
+    SimHash de 64 bits sobre o conjunto de shingles (sem peso por frequência: CTAs e
+    rodapés repetidos não abafam mudanças no resto).
+    """
+    # Quantos shingles têm cada bit ligado (em blocos, para limitar memória); vale a maioria
+    ligados = np.zeros(64, dtype=np.int64)
+    for inicio in range(0, len(hashes), 4096):
+        ligados += ((hashes[inicio:inicio + 4096, None] >> BITS_SIMHASH) & np.uint64(1)).sum(axis=0, dtype=np.int64)
+    return sum(1 << bit for bit in range(64) if 2 * ligados[bit] > len(hashes))
+
+
+def calcular_minhash(hashes):
+    """
+    Assinatura MinHash (PERMUTACOES_MINHASH valores uint64) do conjunto de shingles:
+    a fração de posições iguais entre duas assinaturas estima a similaridade de Jaccard.
+    """
+    assinatura = np.full(PERMUTACOES_MINHASH, np.iinfo(np.uint64).max, dtype=np.uint64)
+    for inicio in range(0, len(hashes), 4096):
+        valores = hashes[inicio:inicio + 4096, None] * MULTIPLICADORES_MINHASH + DESLOCAMENTOS_MINHASH
+        valores ^= valores >> np.uint64(29)
+        np.minimum(assinatura, valores.min(axis=0), out=assinatura)
+    return assinatura
+
+
+def distancia_hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def impressao_digital_pagina(download):
+    """
+    Retorna {"hash", "simhash", "assinatura"} da página baixada. Em páginas quase vazias
+    simhash e assinatura (MinHash, usada no índice de duplicatas) são None.
+    """
+    texto = texto_impressao_digital(download["texto"])
+    tokens = texto.split()
+    if len(tokens) < MINIMO_TOKENS_IMPRESSAO:
+        return {"hash": hashlib.sha256(download["conteudo"]).hexdigest(), "simhash": None, "assinatura": None}
+    hashes = hashes_shingles(tokens)
+    return {
+        "hash": hashlib.sha256(texto.encode("utf-8")).hexdigest(),
+        "simhash": calcular_simhash(hashes),
+        "assinatura": calcular_minhash(hashes)
+    }
+
+
+def chave_conteudo_pagina(url, impressao):
+    """
+    Chave de conteúdo dos critérios de texto (CRITERIOS_REAPROVEITADOS_SIMHASH) no memo.
+    Se a versão de referência da URL (no cache compartilhado) tem o mesmo hash ou um
+    SimHash a até DISTANCIA_MAXIMA_SIMHASH bits, a chave dela é reaproveitada; caso
+    contrário a nova versão passa a ser a referência. Os demais critérios usam sempre
+    impressao["hash"]. Retorna (chave, nova_referencia): nova_referencia só é True para
+    o worker que gravou a versão, mesmo com vários baixando a página ao mesmo tempo.
+    """
+    agora = time.time()
+    try:
+        with transacao_imediata(conexao_cache_compartilhado()) as conexao:
+            referencia = conexao.execute(
+                "SELECT hash, simhash FROM impressoes_paginas WHERE url = ?", (url,)
+            ).fetchone()
+            if referencia:
+                hash_referencia, simhash_referencia = referencia
+                distancia = None
+                if hash_referencia != impressao["hash"] and simhash_referencia and impressao["simhash"] is not None:
+                    distancia = distancia_hamming(int(simhash_referencia, 16), impressao["simhash"])
+                if hash_referencia == impressao["hash"] or (distancia is not None and distancia <= DISTANCIA_MAXIMA_SIMHASH):
+                    conexao.execute("UPDATE impressoes_paginas SET usado_em = ? WHERE url = ?", (agora, url))
+                    if distancia is not None:
+                        logging.debug(f"[DEBUG] {url}: conteúdo quase igual ao anterior ({distancia} bit(s)); critérios reaproveitados.")
+                    return hash_referencia, False
+            simhash = format(impressao["simhash"], "016x") if impressao["simhash"] is not None else None
+            conexao.execute(
+                "INSERT OR REPLACE INTO impressoes_paginas (url, hash, simhash, usado_em) VALUES (?, ?, ?, ?)",
+                (url, impressao["hash"], simhash, agora)
+            )
+            conexao.execute(
+                "DELETE FROM impressoes_paginas WHERE url IN ("
+                "SELECT url FROM impressoes_paginas ORDER BY usado_em DESC LIMIT -1 OFFSET ?)",
+                (LIMITE_IMPRESSOES_PAGINAS,)
+            )
+    except sqlite3.Error as e:
+        # Sem a referência, os critérios de texto usam o hash exato e a página não é indexada
+        logging.error(f"[ERRO] Falha ao consultar a impressão digital de referência de {url}: {e}")
+        return impressao["hash"], False
+    return impressao["hash"], True
+
+# FIM IMPRESSÃO DIGITAL DO CONTEÚDO
+
+
 # Função para avaliar Critério 1 de 16 - Qualidade da Página de Vendas
-def qualidade_pagina(url):
+def qualidade_pagina(url, pagina=None):
     try:
         print(f"Verificando qualidade da página para URL: {url}")
-        response = requests.get(url, timeout=5)
-        if response.status_code != 200:
+        pagina = pagina or carregar_pagina(url, timeout=5)
+        if not pagina:
             print("Página não carregou corretamente.")
             return 0
 
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = pagina["soup"]
         # Adicione aqui o código da meta descrição
         meta_description_tag = soup.find("meta", attrs={"name": "description"})
         meta_description = meta_description_tag["content"] if meta_description_tag and "content" in meta_description_tag.attrs else ""
@@ -52,7 +697,7 @@ def qualidade_pagina(url):
         meta_description_normalizado = normalizar_texto_para_comparacao(meta_description)
 
 
-        copy_text = soup.get_text(separator=" ").lower()
+        copy_text = pagina["texto_visivel"].lower()
         pontuacao = 0
 
         # Subcritérios e seus pesos ajustados
@@ -129,15 +774,15 @@ def qualidade_pagina(url):
         return 0
 
 # Função para avaliar Critério 2 de 16 - Copywriting (clareza e persuasão)
-def copywriting_pontuacao(url):
+def copywriting_pontuacao(url, pagina=None):
     try:
         print(f"Analisando copywriting para URL: {url}")
-        response = requests.get(url, timeout=5)
-        if response.status_code != 200:
+        pagina = pagina or carregar_pagina(url, timeout=5)
+        if not pagina:
             print("Página não carregou corretamente.")
             return 0
 
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = pagina["soup"]
         # Adicione aqui o código da meta descrição
         # Extração de meta descrição
         meta_description_tag = soup.find("meta", attrs={"name": "description"})
@@ -147,7 +792,7 @@ def copywriting_pontuacao(url):
         meta_description_normalizado = normalizar_texto_para_comparacao(meta_description)
 
 
-        copy_text = soup.get_text(separator=" ").lower()
+        copy_text = pagina["texto_visivel"].lower()
 
         # Lista de palavras persuasivas em inglês
         palavras_persuasivas = [
@@ -449,15 +1094,15 @@ def pontuacao_emocoes_positivas(copy_text):
     return pontuacao
 
 # Função para avaliar Critério 3 de 16 - Benefícios e Ofertas Especiais
-def pontuacao_beneficios_ofertas_especiais(url):
+def pontuacao_beneficios_ofertas_especiais(url, pagina=None):
     try:
         print(f"Analisando benefícios e ofertas para URL: {url}")
-        response = requests.get(url, timeout=5)
-        if response.status_code != 200:
+        pagina = pagina or carregar_pagina(url, timeout=5)
+        if not pagina:
             print("Página não carregou corretamente.")
             return 0
 
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = pagina["soup"]
        # Extração de meta descrição
         meta_description_tag = soup.find("meta", attrs={"name": "description"})
         meta_description = meta_description_tag["content"] if meta_description_tag and "content" in meta_description_tag.attrs else ""
@@ -466,7 +1111,7 @@ def pontuacao_beneficios_ofertas_especiais(url):
         meta_description_normalizado = normalizar_texto_para_comparacao(meta_description)
 
 
-        copy_text = soup.get_text(separator=" ").lower()
+        copy_text = pagina["texto_visivel"].lower()
     
 
         # Dicionário de subcritérios e categorias
@@ -645,15 +1290,15 @@ def processar_produto(index, nome_produto, url_produto, permissao_trafego_pago,
     return produto
 
 # Função para avaliar Critério 4 de 16 - Preço e Valor Percebido
-def preco_valor_percebido_pontuacao(url, categoria):
+def preco_valor_percebido_pontuacao(url, categoria, pagina=None):
     try:
         print(f"Analisando Preço e Valor Percebido para URL: {url}")
-        response = requests.get(url, timeout=10)
-        if response.status_code != 200:
+        pagina = pagina or carregar_pagina(url, timeout=10)
+        if not pagina:
             print("Página não carregou corretamente.")
             return 0, ["Página não carregada corretamente."]
         
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = pagina["soup"]
       # Extração de meta descrição
         meta_description_tag = soup.find("meta", attrs={"name": "description"})
         meta_description = meta_description_tag["content"] if meta_description_tag and "content" in meta_description_tag.attrs else ""
@@ -662,7 +1307,7 @@ def preco_valor_percebido_pontuacao(url, categoria):
         meta_description_normalizado = normalizar_texto_para_comparacao(meta_description)
 
 
-        texto = normalizar_texto(soup.get_text())  # Normalizar o texto da página
+        texto = normalizar_texto(pagina["texto_visivel"])  # Normalizar o texto visível da página
         pontuacao = 0
         feedback = []
 
@@ -929,15 +1574,15 @@ def pontuacao_exclusividade_escassez(texto):
 
 
 # Função para avaliar Critério 5 de 16 - Faixa de Preços
-def faixa_precos_pontuacao(url):
+def faixa_precos_pontuacao(url, pagina=None):
     try:
         print(f"Analisando Faixa de Preços para URL: {url}")
-        response = requests.get(url, timeout=5)
-        if response.status_code != 200:
+        pagina = pagina or carregar_pagina(url, timeout=5)
+        if not pagina:
             print("Página não carregou corretamente.")
             return 0
 
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = pagina["soup"]
        # Extração de meta descrição
         meta_description_tag = soup.find("meta", attrs={"name": "description"})
         meta_description = meta_description_tag["content"] if meta_description_tag and "content" in meta_description_tag.attrs else ""
@@ -946,7 +1591,7 @@ def faixa_precos_pontuacao(url):
         meta_description_normalizado = normalizar_texto_para_comparacao(meta_description)
 
 
-        copy_text = soup.get_text(separator=" ").lower()
+        copy_text = pagina["texto_visivel"].lower()
 
         # Dicionário de subcritérios e palavras-chave com pesos
         subcriterios_palavras_chave = {
@@ -1013,22 +1658,37 @@ def faixa_precos_pontuacao(url):
 from pytrends.request import TrendReq
 from bs4 import BeautifulSoup
 import requests
+import threading
 from functools import lru_cache
 
 @lru_cache(maxsize=10)
 def fetch_url_content(url):
-    response = requests.get(url)
-    return response.text if response.status_code == 200 else None
+    download = baixar_html(url)
+    return download["texto"] if download else None
 
-# Configura a conexão com o Google Trends para os EUA
-pytrends = TrendReq(hl='en-US', tz=0, timeout=(10, 25))  # 10 segundos para conexão, 25 segundos para leitura
+# Configura a conexão com o Google Trends para os EUA (10 segundos para conexão, 25 para leitura)
+CONFIG_TRENDS = {"hl": "en-US", "tz": 360, "timeout": (10, 25)}
+
+# O TrendReq guarda o payload da última busca: cada thread usa o seu próprio cliente
+_clientes_trends = threading.local()
+
+
+def obter_cliente_trends():
+    """
+    Retorna o cliente do Google Trends da thread atual, criando-o no primeiro uso.
+    """
+    cliente = getattr(_clientes_trends, "cliente", None)
+    if cliente is None:
+        cliente = _clientes_trends.cliente = TrendReq(**CONFIG_TRENDS)
+    return cliente
 
 # Função para extrair o nome do produto da URL da página de vendas
 def extrair_nome_produto(url):
     try:
-        response = fetch_url_content(url)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, 'html.parser')
+        # Só o <head> é necessário: o download para assim que </head> é lido
+        download = baixar_html(url, ate_head=True)
+        if download:
+            soup = BeautifulSoup(download["texto"], 'html.parser')
            # Extração de meta descrição
             meta_description_tag = soup.find("meta", attrs={"name": "description"})
             meta_description = meta_description_tag["content"] if meta_description_tag and "content" in meta_description_tag.attrs else ""
@@ -1037,19 +1697,20 @@ def extrair_nome_produto(url):
             meta_description_normalizado = normalizar_texto_para_comparacao(meta_description)
 
             
-            # Tenta obter o título do produto na tag <title> ou <h1>
+            # Tenta obter o título do produto na meta og:title ou na tag <title>
+            og_title = soup.find("meta", attrs={"property": "og:title"})
+            og_title = og_title.get("content") if og_title else None
             titulo = soup.find('title').get_text() if soup.find('title') else None
-            h1 = soup.find('h1').get_text() if soup.find('h1') else None
             
             # Se o título estiver presente, usa ele como o nome do produto
-            nome_produto = h1 if h1 else titulo
+            nome_produto = og_title if og_title else titulo
             if nome_produto:
                 return nome_produto.strip()
             else:
                 print("Nome do produto não encontrado na página.")
                 return None
         else:
-            print(f"Erro ao acessar a página. Status: {response.status_code}")
+            print("Erro ao acessar a página.")
             return None
     except Exception as e:
         print(f"Erro ao extrair nome do produto: {e}")
@@ -1060,6 +1721,7 @@ def obter_interesse_produto(termo_busca):
     try:
         # Define o termo de busca e o período para os EUA
         termos_busca = [termo_busca]
+        pytrends = obter_cliente_trends()
         pytrends.build_payload(termos_busca, cat=0, timeframe='today 12-m', geo='US')  # Exemplo para EUA e últimos 12 meses
 
         # Obtenha dados de interesse ao longo do tempo
@@ -1079,7 +1741,7 @@ def obter_interesse_produto(termo_busca):
 
 # Função ajustada para calcular o volume de busca considerando o nome junto e separado
 def calcular_pontuacao_volume_busca(nome_do_produto):
-    pytrends = TrendReq(hl='en-US', tz=360)
+    pytrends = obter_cliente_trends()
     
     # Define os períodos
     periodos = {
@@ -1138,9 +1800,6 @@ modo_teste = True  # Mude para False para usar as requisições reais
 # (tirar o comentario) from pytrends.request import TrendReq
 import calendar
 
-# Configura conexão com o Google Trends
-pytrends = TrendReq(hl='en-US', tz=360)
-
 # Lista dos meses em português
 meses_portugues = [
     "", "Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho",
@@ -1151,6 +1810,7 @@ def analisar_sazonalidade(nome_do_produto):
     try:
         # Função para tentar coletar dados do Google Trends
         def buscar_trends(nome):
+            pytrends = obter_cliente_trends()
             pytrends.build_payload([nome], timeframe='today 12-m', geo='US')
             return pytrends.interest_over_time()
 
@@ -1249,11 +1909,12 @@ PALAVRAS_TRANSACIONAL = ["buy", "purchase", "discount", "offer", "promotion", "w
                          "promo code", "buy with discount", "buy direct", "pay", "request", "place order"]
 PALAVRAS_INFORMACIONAL = ["how it works", "which is better", "benefits of", "effects of", "advantages", "disadvantages",
                           "how to use", "recommendations", "comparisons", "analysis of", "guide to", "tutorial",
-                          "best options", "how to choose", "tips for", "what's the difference", "reviews", "product review"]
+                          "best options", "how to choose", "tips for", "what's the difference", "reviews", "product review",
+                          "benefits", "comparison"]
 PALAVRAS_CONSCIENTIZACAO = ["what is", "how to", "tips on", "guide to", "introduction to", "importance of",
                             "benefits of", "reasons for", "meaning of", "how it helps", "ways to", "basics of",
                             "information about", "learn more", "understand", "fundamentals", "overview of",
-                            "how to start", "for beginners"]
+                            "how to start", "for beginners", "importance", "overview"]
 
 # Pesos para cada categoria
 PESO_TRANSACIONAL = 2.5
@@ -1264,45 +1925,134 @@ PESO_INTENCAO_PALAVRA = 3.0
 PESO_VOLUME_BUSCA = 4.0
 PESO_CONCORRENCIA_CPC = 5.0
 
-# Função para identificar a intenção da palavra-chave (primeira definição)
-def identificar_intencao_sem_permissao(palavra_chave, nome_do_produto):
-    palavra_chave = palavra_chave.lower()
-    
-    # Verifica se o nome do produto está na palavra-chave e aplica um peso alto
-    if nome_do_produto and nome_do_produto.lower() in palavra_chave:
-        return 'produto_fundo_funil', PESO_TRANSACIONAL  # Peso transacional para fundo de funil com nome do produto
-
-    # Verifica categorias padrão
-    for termo in PALAVRAS_TRANSACIONAL:
-        if termo in palavra_chave:
-            return 'transacional', PESO_TRANSACIONAL
-    for termo in PALAVRAS_INFORMACIONAL:
-        if termo in palavra_chave:
-            return 'informacional', PESO_INFORMACIONAL
-    for termo in PALAVRAS_CONSCIENTIZACAO:
-        if termo in palavra_chave:
-            return 'conscientizacao', PESO_CONSCIENTIZACAO
-    return 'neutro', PESO_NEUTRO  # Peso padrão para palavras sem intenção específica
-
-# Função para identificar a intenção da palavra-chave (segunda definição)
+# Tabelas de faixas usadas na pontuação de SEO, avaliadas de forma vetorizada com NumPy
+import numpy as np
+
+# Multiplicador do volume de busca: (volume mínimo, volume máximo, multiplicador), limites inclusivos.
+# Volumes fora das faixas recebem MULTIPLICADOR_VOLUME_PADRAO (inclusive o volume 5000 exato).
+FAIXAS_MULTIPLICADOR_VOLUME = [
+    (1500, 4999, 0.5),
+    (np.nextafter(5000.0, np.inf), np.inf, 1.0),
+]
+MULTIPLICADOR_VOLUME_PADRAO = 0.25
+
+# Concorrência de CPC por faixa de volume: (volume mínimo, volume máximo, CPC alto acima de, CPC médio a partir de).
+# Volumes fora das faixas não pontuam em concorrência de CPC.
+FAIXAS_CPC_POR_VOLUME = [
+    (100, 999, 3.0, 1.0),
+    (1000, 1999, 4.0, 1.5),
+    (2000, 2999, 5.0, 2.0),
+    (3000, 3999, 6.0, 2.5),
+    (4000, 4999, 8.0, 3.0),
+    (5000, 6999, 9.0, 3.5),
+    (7000, 10000, 12.0, 4.0),
+]
+MULTIPLICADOR_CPC_ALTO = 1.2
+MULTIPLICADOR_CPC_MEDIO = 1.0
+MULTIPLICADOR_CPC_BAIXO = 0.8
+
+_VOLUME_MINIMOS, _VOLUME_MAXIMOS, _VOLUME_MULTIPLICADORES = (
+    np.array(coluna, dtype=float) for coluna in zip(*FAIXAS_MULTIPLICADOR_VOLUME)
+)
+_CPC_VOLUME_MINIMOS, _CPC_VOLUME_MAXIMOS, _CPC_LIMITES_ALTO, _CPC_LIMITES_MEDIO = (
+    np.array(coluna, dtype=float) for coluna in zip(*FAIXAS_CPC_POR_VOLUME)
+)
+
+
+def localizar_faixa(valores, minimos, maximos):
+    """
+    Retorna, para cada valor, o índice da faixa [mínimo, máximo] que o contém, ou -1.
+    As faixas devem estar ordenadas e não se sobrepor.
+    """
+    indices = np.searchsorted(minimos, valores, side="right") - 1
+    indices_validos = np.clip(indices, 0, None)
+    dentro = (indices >= 0) & (valores <= maximos[indices_validos])
+    return np.where(dentro, indices, -1)
+
+# INÍCIO CLASSIFICADOR DE INTENÇÃO
+# Um único classificador compilado para todas as palavras-chave: cada grupo de termos vira uma
+# expressão regular, aplicada de uma vez sobre todas as palavras-chave unidas por quebras de linha.
+
+def compilar_termos(termos):
+    """
+    Compila uma lista de termos em uma única expressão regular de busca por substring.
+    """
+    return re.compile("|".join(re.escape(termo.lower()) for termo in sorted(set(termos), key=len, reverse=True)))
+
+
+# Grupos de intenção em ordem de prioridade: (intenção, expressão compilada, peso)
+CLASSIFICADOR_INTENCAO = [
+    ("transacional", compilar_termos(PALAVRAS_TRANSACIONAL), PESO_TRANSACIONAL),
+    ("informacional", compilar_termos(PALAVRAS_INFORMACIONAL), PESO_INFORMACIONAL),
+    ("conscientizacao", compilar_termos(PALAVRAS_CONSCIENTIZACAO), PESO_CONSCIENTIZACAO),
+]
+
+
+def linhas_com_ocorrencia(regex, texto, inicios_linhas):
+    """
+    Retorna uma máscara com as linhas do texto que contêm ao menos uma ocorrência da expressão.
+    """
+    mascara = np.zeros(len(inicios_linhas), dtype=bool)
+    posicoes = np.fromiter((ocorrencia.start() for ocorrencia in regex.finditer(texto)), dtype=np.int64)
+    if posicoes.size:
+        mascara[np.searchsorted(inicios_linhas, posicoes, side="right") - 1] = True
+    return mascara
+
+
+def classificar_intencoes(palavras_chave, nome_do_produto=None, permissao_fundo_funil=True):
+    """
+    Classifica a intenção de uma lista de palavras-chave em uma única passada.
+    Palavras com o nome do produto são fundo de funil quando permitido; sem permissão de fundo de funil,
+    as transacionais recebem o peso neutro.
+    Retorna (intencoes, pesos), com os pesos em um array NumPy.
+    """
+    quantidade = len(palavras_chave)
+    if not quantidade:
+        return [], np.zeros(0)
+
+    # Uma palavra-chave por linha; as quebras de linha internas viram espaço
+    linhas = [str(palavra).lower().replace("\n", " ") for palavra in palavras_chave]
+    texto = "\n".join(linhas)
+    tamanhos = np.fromiter((len(linha) + 1 for linha in linhas), dtype=np.int64, count=quantidade)
+    inicios_linhas = np.concatenate(([0], np.cumsum(tamanhos)[:-1]))
+
+    intencoes = np.full(quantidade, "neutro", dtype=object)
+    pesos = np.full(quantidade, PESO_NEUTRO)
+    pendentes = np.ones(quantidade, dtype=bool)
+
+    # Nome do produto na palavra-chave: fundo de funil, se permitido
+    if permissao_fundo_funil and nome_do_produto:
+        regex_nome = re.compile(re.escape(nome_do_produto.lower()))
+        mascara = linhas_com_ocorrencia(regex_nome, texto, inicios_linhas)
+        intencoes[mascara] = "produto_fundo_funil"
+        pesos[mascara] = PESO_TRANSACIONAL
+        pendentes &= ~mascara
+
+    for intencao, regex, peso in CLASSIFICADOR_INTENCAO:
+        mascara = pendentes & linhas_com_ocorrencia(regex, texto, inicios_linhas)
+        intencoes[mascara] = intencao
+        # Ajusta para neutro se fundo de funil não é permitido
+        pesos[mascara] = PESO_NEUTRO if intencao == "transacional" and not permissao_fundo_funil else peso
+        pendentes &= ~mascara
+
+    return intencoes.tolist(), pesos
+
+
 def identificar_intencao(palavra_chave, nome_do_produto, permissao_fundo_funil):
-    palavra_chave = palavra_chave.lower()
-    
-    # Verifica se o nome do produto está na palavra-chave e se fundo de funil é permitido
-    if permissao_fundo_funil and nome_do_produto and nome_do_produto.lower() in palavra_chave:
-        return 'produto_fundo_funil', PESO_TRANSACIONAL  # Peso alto para fundo de funil com nome do produto
-    
-    # Verifica categorias padrão
-    for termo in PALAVRAS_TRANSACIONAL:
-        if termo in palavra_chave:
-            return 'transacional', PESO_TRANSACIONAL if permissao_fundo_funil else PESO_NEUTRO  # Ajusta para neutro se fundo de funil não é permitido
-    for termo in PALAVRAS_INFORMACIONAL:
-        if termo in palavra_chave:
-            return 'informacional', PESO_INFORMACIONAL
-    for termo in PALAVRAS_CONSCIENTIZACAO:
-        if termo in palavra_chave:
-            return 'conscientizacao', PESO_CONSCIENTIZACAO
-    return 'neutro', PESO_NEUTRO
+    """
+    Identifica a intenção de uma palavra-chave e retorna (intenção, peso).
+    """
+    intencoes, pesos = classificar_intencoes([palavra_chave], nome_do_produto, permissao_fundo_funil)
+    return intencoes[0], float(pesos[0])
+
+
+def identificar_intencao_sem_permissao(palavra_chave, nome_do_produto):
+    """
+    Identifica a intenção sem restrição de fundo de funil.
+    """
+    return identificar_intencao(palavra_chave, nome_do_produto, True)
+
+# FIM CLASSIFICADOR DE INTENÇÃO
 
 # Função para normalizar o texto para comparação
 def normalizar_texto_para_comparacao(texto):
@@ -1344,10 +2094,13 @@ import requests
 from bs4 import BeautifulSoup
 
 # Função para verificar SEO básico com logs de depuração adicionais
-def analisar_seo_basico(url, product_name, category):
+def analisar_seo_basico(url, product_name, category, pagina=None):
     try:
-        response = requests.get(url)
-        soup = BeautifulSoup(response.content, "html.parser")
+        pagina = pagina or carregar_pagina(url, timeout=10)
+        if not pagina:
+            print("[ERRO] Página não carregou corretamente para a análise de SEO básico.")
+            return 0
+        soup = pagina["soup"]
 
         # Normaliza o nome do produto
         nome_normalizado = normalizar_texto_para_comparacao(product_name)
@@ -1430,109 +2183,63 @@ def calcular_pontuacao_normalizada(keywords):
     return pontuacao_total / len(keywords)  # Normaliza pela quantidade
 
 # Função principal de cálculo da pontuação SEO
-def calcular_pontuacao_seo(palavras_chave, permissao_trafego_pago, permissao_fundo_funil, nome_do_produto, url_produto, categoria):
+def calcular_pontuacao_seo(palavras_chave, permissao_trafego_pago, permissao_fundo_funil, nome_do_produto, url_produto, categoria, pagina=None,
+                           pontuacao_seo_basico=None):
     pontuacao_permissao = 1.0 if permissao_trafego_pago else 0.0
     if permissao_fundo_funil:
         pontuacao_permissao += 1.0
 
-    pontuacao_volume_busca = 0.0
-    pontuacao_concorrencia_cpc = 0.0
-    pontuacao_keyword_total = 0.0
-
     # Lista de palavras-chave da categoria
     palavras_categoria = TERMS_BY_CATEGORY.get(categoria, [])
 
-    cpc_alertas = []  # Lista para armazenar alertas de CPC alto
+    # Chama a função para obter a pontuação de SEO básico (a menos que já tenha sido calculada)
+    if pontuacao_seo_basico is None:
+        pontuacao_seo_basico = analisar_seo_basico(url_produto, nome_do_produto, categoria, pagina)
+        pontuacao_seo_basico = limitar_seo_basico(pontuacao_seo_basico)  # Aplica limite à pontuação de SEO básico
+
+    # Colunas das palavras-chave para o cálculo vetorizado
+    termos = [palavra.get('palavra', "") for palavra in palavras_chave]
+    volumes = np.array([palavra.get('volume', 0) for palavra in palavras_chave], dtype=float)
+    cpcs = np.array([palavra.get('cpc', 0.0) for palavra in palavras_chave], dtype=float)
+
+    # Identificar intenção e ajustar peso com base em fundo de funil e na categoria
+    _, pesos_intencao = classificar_intencoes(termos, nome_do_produto, permissao_fundo_funil)
+    termos_categoria = set(palavras_categoria)
+    ajustes_categoria = np.array([1.5 if termo in termos_categoria else 1.0 for termo in termos], dtype=float)
+
+    # Ajuste do volume
+    faixas_volume = localizar_faixa(volumes, _VOLUME_MINIMOS, _VOLUME_MAXIMOS)
+    multiplicadores_volume = np.where(
+        faixas_volume >= 0, _VOLUME_MULTIPLICADORES[np.clip(faixas_volume, 0, None)], MULTIPLICADOR_VOLUME_PADRAO
+    )
+    pontuacao_volume_busca = float(np.sum(
+        PESO_VOLUME_BUSCA * multiplicadores_volume * pesos_intencao * ajustes_categoria
+    ))
+
+    # Ajuste do CPC com limites de CPC alto e médio por faixa de volume
+    faixas_cpc = localizar_faixa(volumes, _CPC_VOLUME_MINIMOS, _CPC_VOLUME_MAXIMOS)
+    na_faixa = faixas_cpc >= 0
+    indices_faixa = np.clip(faixas_cpc, 0, None)
+    cpc_alto = na_faixa & (cpcs > _CPC_LIMITES_ALTO[indices_faixa])
+    cpc_medio = na_faixa & ~cpc_alto & (cpcs >= _CPC_LIMITES_MEDIO[indices_faixa])
+    multiplicadores_cpc = np.select(
+        [cpc_alto, cpc_medio, na_faixa],
+        [MULTIPLICADOR_CPC_ALTO, MULTIPLICADOR_CPC_MEDIO, MULTIPLICADOR_CPC_BAIXO],
+        default=0.0
+    )
+    pontuacao_concorrencia_cpc = float(np.sum(
+        PESO_CONCORRENCIA_CPC * multiplicadores_cpc * pesos_intencao * ajustes_categoria
+    ))
 
-    # Chama a função para obter a pontuação de SEO básico
-    pontuacao_seo_basico = analisar_seo_basico(url_produto, nome_do_produto, categoria)
-    pontuacao_seo_basico = limitar_seo_basico(pontuacao_seo_basico)  # Aplica limite à pontuação de SEO básico
+    cpc_alertas = [
+        f"⚠️ Palavra-chave '{termos[i]}' possui CPC alto (${palavras_chave[i].get('cpc', 0.0):.2f}). Explore alternativas mais baratas."
+        for i in np.flatnonzero(cpc_alto)
+    ]
 
-    for palavra in palavras_chave:
-        volume = palavra.get('volume', 0)
-        cpc = palavra.get('cpc', 0.0)
-        termo = palavra.get('palavra', "")
-
-        # Identificar intenção e ajustar peso com base em fundo de funil
-        _, peso_intencao = identificar_intencao(termo, nome_do_produto, permissao_fundo_funil)
-        ajuste_categoria = 1.5 if termo in palavras_categoria else 1.0  # Ajusta peso com base na categoria
-        pontuacao_keyword_total += peso_intencao * ajuste_categoria  # Pontuação de intenção da palavra
-
-        # Ajuste do volume
-        if volume > 5000:
-            pontuacao_volume_busca += PESO_VOLUME_BUSCA * peso_intencao * ajuste_categoria
-        elif 1500 <= volume <= 4999:
-            pontuacao_volume_busca += (PESO_VOLUME_BUSCA * 0.5) * peso_intencao * ajuste_categoria
-        else:
-            pontuacao_volume_busca += (PESO_VOLUME_BUSCA * 0.25) * peso_intencao * ajuste_categoria
-
-        # Ajuste do CPC com maior sensibilidade para faixas de volume e CPC
-        if 100 <= volume <= 999:  # Faixa de volume 100 a 999
-            if cpc > 3.0:  # CPC alto
-                pontuacao_concorrencia_cpc += (PESO_CONCORRENCIA_CPC * 1.2) * peso_intencao * ajuste_categoria
-                cpc_alertas.append(f"⚠️ Palavra-chave '{termo}' possui CPC alto (${cpc:.2f}). Explore alternativas mais baratas.")
-            elif 1.0 <= cpc <= 3.0:  # CPC médio
-                pontuacao_concorrencia_cpc += PESO_CONCORRENCIA_CPC * peso_intencao * ajuste_categoria
-            else:  # CPC baixo
-                pontuacao_concorrencia_cpc += (PESO_CONCORRENCIA_CPC * 0.8) * peso_intencao * ajuste_categoria
-
-        elif 1000 <= volume <= 1999:  # Faixa de volume 1000 a 1999
-            if cpc > 4.0:  # CPC alto
-                pontuacao_concorrencia_cpc += (PESO_CONCORRENCIA_CPC * 1.2) * peso_intencao * ajuste_categoria
-                cpc_alertas.append(f"⚠️ Palavra-chave '{termo}' possui CPC alto (${cpc:.2f}). Explore alternativas mais baratas.")
-            elif 1.5 <= cpc <= 4.0:  # CPC médio
-                pontuacao_concorrencia_cpc += PESO_CONCORRENCIA_CPC * peso_intencao * ajuste_categoria
-            else:  # CPC baixo
-                pontuacao_concorrencia_cpc += (PESO_CONCORRENCIA_CPC * 0.8) * peso_intencao * ajuste_categoria
-
-        elif 2000 <= volume <= 2999:  # Faixa de volume 2000 a 2999
-            if cpc > 5.0:  # CPC alto
-                pontuacao_concorrencia_cpc += (PESO_CONCORRENCIA_CPC * 1.2) * peso_intencao * ajuste_categoria
-                cpc_alertas.append(f"⚠️ Palavra-chave '{termo}' possui CPC alto (${cpc:.2f}). Explore alternativas mais baratas.")
-            elif 2.0 <= cpc <= 5.0:  # CPC médio
-                pontuacao_concorrencia_cpc += PESO_CONCORRENCIA_CPC * peso_intencao * ajuste_categoria
-            else:  # CPC baixo
-                pontuacao_concorrencia_cpc += (PESO_CONCORRENCIA_CPC * 0.8) * peso_intencao * ajuste_categoria
-
-        elif 3000 <= volume <= 3999:  # Faixa de volume 3000 a 3999
-            if cpc > 6.0:  # CPC alto
-                pontuacao_concorrencia_cpc += (PESO_CONCORRENCIA_CPC * 1.2) * peso_intencao * ajuste_categoria
-                cpc_alertas.append(f"⚠️ Palavra-chave '{termo}' possui CPC alto (${cpc:.2f}). Explore alternativas mais baratas.")
-            elif 2.5 <= cpc <= 6.0:  # CPC médio
-                pontuacao_concorrencia_cpc += PESO_CONCORRENCIA_CPC * peso_intencao * ajuste_categoria
-            else:  # CPC baixo
-                pontuacao_concorrencia_cpc += (PESO_CONCORRENCIA_CPC * 0.8) * peso_intencao * ajuste_categoria
-
-        elif 4000 <= volume <= 4999:  # Faixa de volume 4000 a 4999
-            if cpc > 8.0:  # CPC alto
-                pontuacao_concorrencia_cpc += (PESO_CONCORRENCIA_CPC * 1.2) * peso_intencao * ajuste_categoria
-                cpc_alertas.append(f"⚠️ Palavra-chave '{termo}' possui CPC alto (${cpc:.2f}). Explore alternativas mais baratas.")
-            elif 3.0 <= cpc <= 8.0:  # CPC médio
-                pontuacao_concorrencia_cpc += PESO_CONCORRENCIA_CPC * peso_intencao * ajuste_categoria
-            else:  # CPC baixo
-                pontuacao_concorrencia_cpc += (PESO_CONCORRENCIA_CPC * 0.8) * peso_intencao * ajuste_categoria
-
-        elif 5000 <= volume <= 6999:  # Faixa de volume 5000 a 6999
-            if cpc > 9.0:  # CPC alto
-                pontuacao_concorrencia_cpc += (PESO_CONCORRENCIA_CPC * 1.2) * peso_intencao * ajuste_categoria
-                cpc_alertas.append(f"⚠️ Palavra-chave '{termo}' possui CPC alto (${cpc:.2f}). Explore alternativas mais baratas.")
-            elif 3.5 <= cpc <= 9.0:  # CPC médio
-                pontuacao_concorrencia_cpc += PESO_CONCORRENCIA_CPC * peso_intencao * ajuste_categoria
-            else:  # CPC baixo
-                pontuacao_concorrencia_cpc += (PESO_CONCORRENCIA_CPC * 0.8) * peso_intencao * ajuste_categoria
-
-        elif 7000 <= volume <= 10000:  # Faixa de volume 7000 a 10000
-            if cpc > 12.0:  # CPC alto
-                pontuacao_concorrencia_cpc += (PESO_CONCORRENCIA_CPC * 1.2) * peso_intencao * ajuste_categoria
-                cpc_alertas.append(f"⚠️ Palavra-chave '{termo}' possui CPC alto (${cpc:.2f}). Explore alternativas mais baratas.")
-            elif 4.0 <= cpc <= 12.0:  # CPC médio
-                pontuacao_concorrencia_cpc += PESO_CONCORRENCIA_CPC * peso_intencao * ajuste_categoria
-            else:  # CPC baixo
-                pontuacao_concorrencia_cpc += (PESO_CONCORRENCIA_CPC * 0.8) * peso_intencao * ajuste_categoria
-
-   # Normalização da pontuação de keywords
+    # Normalização da pontuação de keywords (mantém o cálculo anterior, que usa o peso da última palavra-chave)
+    peso_ultima_palavra = float(pesos_intencao[-1] * ajustes_categoria[-1]) if termos else 0.0
     pontuacao_keyword_normalizada = calcular_pontuacao_normalizada(
-        [{'pontuacao': peso_intencao * ajuste_categoria} for termo in palavras_chave]
+        [{'pontuacao': peso_ultima_palavra} for termo in palavras_chave]
     )
 
     # Cálculo total da pontuação SEO e palavras-chave incluindo pontuação de SEO básico
@@ -1592,20 +2299,20 @@ from flask import Flask, render_template, request
 # app = Flask(__name__)  # Já definido anteriormente
 
 # Existing functions remain the same
-def calcular_qualidade_pagina(url):
-    return qualidade_pagina(url)  # Chama a função já existente para análise
+def calcular_qualidade_pagina(url, pagina=None):
+    return qualidade_pagina(url, pagina)  # Chama a função já existente para análise
 
-def calcular_copywriting(url):
-    return copywriting_pontuacao(url)  # Chama a função já existente de copywriting
+def calcular_copywriting(url, pagina=None):
+    return copywriting_pontuacao(url, pagina)  # Chama a função já existente de copywriting
 
-def calcular_beneficios_ofertas(url):
-    return pontuacao_beneficios_ofertas_especiais(url)
+def calcular_beneficios_ofertas(url, pagina=None):
+    return pontuacao_beneficios_ofertas_especiais(url, pagina)
 
-def calcular_preco_valor_percebido(url):
-    return preco_valor_percebido_pontuacao(url)
+def calcular_preco_valor_percebido(url, categoria, pagina=None):
+    return preco_valor_percebido_pontuacao(url, categoria, pagina)
 
-def calcular_faixa_precos(url):
-    return faixa_precos_pontuacao(url)
+def calcular_faixa_precos(url, pagina=None):
+    return faixa_precos_pontuacao(url, pagina)
 
 def analisar_sazonalidade(nome_do_produto):
     pontuacao_sazonalidade = 1
@@ -1731,12 +2438,23 @@ def remover_acentos(txt):
     import unicodedata
     return ''.join(c for c in unicodedata.normalize('NFD', txt) if unicodedata.category(c) != 'Mn')
 
+# Tabela CTR padrão normalizada uma única vez, na carga do módulo
+TABELA_CTR_NORMALIZADA = {remover_acentos(key.lower()): value for key, value in tabela_ctr.items()}
+
+def normalizar_tabela_ctr(tabela):
+    """
+    Retorna a tabela CTR com as chaves sem acentos e em minúsculas.
+    """
+    if tabela is tabela_ctr:
+        return TABELA_CTR_NORMALIZADA
+    return {remover_acentos(key.lower()): value for key, value in tabela.items()}
+
 def avaliar_ctr(categoria, tabela):
     """
     Retorna o CTR médio da categoria, com tratamento para normalização e erros.
     """
     categoria_normalizada = remover_acentos(categoria.lower())
-    tabela_normalizada = {remover_acentos(key.lower()): value for key, value in tabela.items()}
+    tabela_normalizada = normalizar_tabela_ctr(tabela)
     if categoria_normalizada in tabela_normalizada:
         ctr_medio = tabela_normalizada[categoria_normalizada]["ctr_medio"]
         print(f"[DEBUG] Categoria '{categoria}' encontrada com CTR médio: {ctr_medio}")
@@ -1756,31 +2474,14 @@ def normalizar_valor(valor, minimo, maximo):
         return 10
     return ((valor - minimo) / (maximo - minimo)) * 10
 
-def identificar_intencao(palavra_chave, nome_do_produto, permissao_fundo_funil):
+def normalizar_valores(valores, minimo, maximo):
     """
-    Identifica a intenção de uma palavra-chave e retorna seu peso.
+    Versão vetorizada de normalizar_valor: normaliza um array para a escala de 0 a 10.
     """
-    palavra_chave = palavra_chave.lower()
-    
-    # Verifica se o nome do produto está na palavra-chave e se fundo de funil é permitido
-    if permissao_fundo_funil and nome_do_produto and nome_do_produto.lower() in palavra_chave:
-        return 'produto_fundo_funil', 2.5  # Peso transacional para fundo de funil
-
-    # Verifica categorias padrão
-    palavras_transacional = ["buy", "purchase", "discount", "offer", "sale"]
-    palavras_informacional = ["how to", "benefits", "reviews", "comparison"]
-    palavras_conscientizacao = ["what is", "importance", "overview"]
-
-    for termo in palavras_transacional:
-        if termo in palavra_chave:
-            return 'transacional', 2.5
-    for termo in palavras_informacional:
-        if termo in palavra_chave:
-            return 'informacional', 1.0
-    for termo in palavras_conscientizacao:
-        if termo in palavra_chave:
-            return 'conscientizacao', 0.3
-    return 'neutro', 0.7  # Peso padrão para palavras sem intenção específica
+    valores = np.asarray(valores, dtype=float)
+    if maximo == minimo:  # Evitar divisão por zero
+        return np.zeros_like(valores)
+    return np.clip(((valores - minimo) / (maximo - minimo)) * 10, 0, 10)
 
 
 def validar_categoria(categoria, tabela):
@@ -1794,81 +2495,132 @@ def validar_categoria(categoria, tabela):
     return None
 
 
+# Pesos de cada critério na nota final, ajustáveis conforme o impacto desejado
+PESOS_NOTA_FINAL = {
+    "pontuacao_qualidade_pagina": 1.0,
+    "pontuacao_copywriting": 1.0,
+    "pontuacao_beneficios_ofertas": 1.0,
+    "pontuacao_preco_valor_percebido": 1.0,
+    "pontuacao_faixa_precos": 1.0,
+    "pontuacao_sazonalidade": 1.0,
+    "pontuacao_seo_palavras": 1.5,  # Exemplo: SEO tem peso maior
+    "pontuacao_ctr": 2.0,          # Exemplo: CTR tem peso maior
+    "pontuacao_redes_sociais": 1.0
+}
+
+# Critérios somados na pontuação total do produto
+CRITERIOS_PONTUACAO_TOTAL = list(PESOS_NOTA_FINAL)
+
+# Detalhes do SEO que também entram na nota final (peso 1.0)
+CAMPOS_DETALHES_SEO = [
+    "pontuacao_permissao",
+    "pontuacao_volume_busca",
+    "pontuacao_concorrencia_cpc",
+    "pontuacao_keyword",
+    "pontuacao_seo_basico"
+]
+
+# Tudo que entra na nota final: critérios, a própria pontuação total e os detalhes do SEO
+CAMPOS_NOTA_FINAL = CRITERIOS_PONTUACAO_TOTAL + ["pontuacao_total"] + CAMPOS_DETALHES_SEO
+
+
+def calcular_pontuacao_total(produto):
+    """
+    Soma os critérios principais do produto (pontuação total usada na ordenação).
+    O valor não é arredondado; o arredondamento acontece ao serializar o produto.
+    """
+    return sum(getattr(produto, criterio) for criterio in CRITERIOS_PONTUACAO_TOTAL)
+
+
 def calcular_nota_final(produto, tabela):
     """
     Calcula a nota final do produto com base em suas pontuações e pesos.
+    Entram na soma os campos de CAMPOS_NOTA_FINAL (inclusive a pontuação total e os detalhes de SEO).
     """
-    # Defina pesos para cada critério, ajustáveis conforme o impacto desejado
-    pesos = {
-        "pontuacao_qualidade_pagina": 1.0,
-        "pontuacao_copywriting": 1.0,
-        "pontuacao_beneficios_ofertas": 1.0,
-        "pontuacao_preco_valor_percebido": 1.0,
-        "pontuacao_faixa_precos": 1.0,
-        "pontuacao_sazonalidade": 1.0,
-        "pontuacao_seo_palavras": 1.5,  # Exemplo: SEO tem peso maior
-        "pontuacao_ctr": 2.0,          # Exemplo: CTR tem peso maior
-        "pontuacao_redes_sociais": 1.0
-    }
-
     # Soma ponderada das pontuações
     nota_final = sum(
-        produto[key] * pesos.get(key, 1.0) for key in produto.keys() if key.startswith("pontuacao")
+        getattr(produto, campo) * PESOS_NOTA_FINAL.get(campo, 1.0) for campo in CAMPOS_NOTA_FINAL
     )
 
     # Normaliza a nota final para uma escala de 0 a 10 (se necessário)
-    nota_final_normalizada = normalizar_valor(nota_final, 0, 100)  # Ajuste os valores mínimos/máximos conforme necessário
+    return normalizar_valor(nota_final, 0, 100)  # Ajuste os valores mínimos/máximos conforme necessário
 
-    return round(nota_final_normalizada, 2)
 
+# Faixas de normalização do CTR ponderado (ajustáveis)
+MINIMO_VOLUME_CTR, MAXIMO_VOLUME_CTR = 100, 10000
+MINIMO_CPC_CTR, MAXIMO_CPC_CTR = 0.1, 15.0
+CTR_MAXIMO = 86.75
 
-def calcular_ctr_ponderado(categoria, palavras_chave, nome_do_produto, permissao_fundo_funil, pontuacao_seo_basico):
+def calcular_ctr_ponderado_lote(produtos, tabela=None):
     """
-    Calcula o CTR ponderado com base em múltiplas palavras-chave, categoria, volume, CPC e ajustes de SEO.
+    Calcula o CTR ponderado de vários produtos (por exemplo, todos de um nicho) em uma única passada.
+    Cada item traz categoria, palavras_chave, nome_do_produto, permissao_fundo_funil e pontuacao_seo_basico.
+    Retorna a lista de CTRs na mesma ordem dos produtos, limitados entre 0 e 86.75.
     """
-    # Obter o CTR médio da categoria
-    ctr_categoria = avaliar_ctr(categoria, tabela_ctr)
-    if ctr_categoria == 0:
-        return 0  # Se a categoria não for encontrada, o CTR não pode ser calculado
-
-    ctr_total = 0
-    peso_total = 0
-
-    for palavra_chave in palavras_chave:
-        # Extrair atributos da palavra-chave
-        termo = palavra_chave.get('palavra', '').lower()
-        volume = palavra_chave.get('volume', 0)
-        cpc = palavra_chave.get('cpc', 0.0)
-
-        # Determinar a intenção e peso da palavra-chave
-        _, peso_intencao = identificar_intencao(termo, nome_do_produto, permissao_fundo_funil)
-
-        # Normalizar volume e CPC
-        minimo_volume, maximo_volume = 100, 10000  # Faixas ajustáveis
-        minimo_cpc, maximo_cpc = 0.1, 15.0         # Faixas ajustáveis
-        volume_normalizado = normalizar_valor(volume, minimo_volume, maximo_volume)
-        cpc_normalizado = normalizar_valor(cpc, minimo_cpc, maximo_cpc)
-
-        # Ajuste pelo SEO
-        ajuste_seo = pontuacao_seo_basico
-
-        # Cálculo do CTR individual para a palavra-chave
-        ctr_individual = (
-            (ctr_categoria * peso_intencao) *
-            (volume_normalizado / (cpc_normalizado + 1)) +
-            ajuste_seo
+    tabela_normalizada = normalizar_tabela_ctr(tabela if tabela is not None else tabela_ctr)
+    quantidade = len(produtos)
+
+    ctr_categorias = np.zeros(quantidade)
+    ajustes_seo = np.zeros(quantidade)
+    indices_produto, volumes, cpcs, pesos_intencao = [], [], [], []
+
+    # Achata as palavras-chave de todos os produtos em colunas, guardando o índice do produto
+    for indice, produto in enumerate(produtos):
+        categoria = produto["categoria"]
+        dados_categoria = tabela_normalizada.get(remover_acentos(categoria.lower()))
+        if not dados_categoria:
+            logging.error(f"[ERRO] Categoria '{categoria}' não encontrada na tabela CTR.")
+            continue  # Sem CTR da categoria o CTR do produto não pode ser calculado
+        ctr_categorias[indice] = dados_categoria["ctr_medio"]
+        ajustes_seo[indice] = produto["pontuacao_seo_basico"]
+
+        palavras_chave = produto["palavras_chave"]
+        _, pesos_produto = classificar_intencoes(
+            [palavra_chave.get('palavra', '') for palavra_chave in palavras_chave],
+            produto["nome_do_produto"], produto["permissao_fundo_funil"]
         )
+        indices_produto.append(np.full(len(palavras_chave), indice, dtype=np.intp))
+        volumes.extend(palavra_chave.get('volume', 0) for palavra_chave in palavras_chave)
+        cpcs.extend(palavra_chave.get('cpc', 0.0) for palavra_chave in palavras_chave)
+        pesos_intencao.append(pesos_produto)
+
+    indices_produto = np.concatenate(indices_produto) if indices_produto else np.zeros(0, dtype=np.intp)
+    volumes = np.array(volumes, dtype=float)
+    cpcs = np.array(cpcs, dtype=float)
+    pesos_intencao = np.concatenate(pesos_intencao) if pesos_intencao else np.zeros(0)
+
+    # Normalizar volume e CPC
+    volumes_normalizados = normalizar_valores(volumes, MINIMO_VOLUME_CTR, MAXIMO_VOLUME_CTR)
+    cpcs_normalizados = normalizar_valores(cpcs, MINIMO_CPC_CTR, MAXIMO_CPC_CTR)
+
+    # CTR individual de cada palavra-chave, com o ajuste de SEO do seu produto
+    ctr_individual = (
+        (ctr_categorias[indices_produto] * pesos_intencao) *
+        (volumes_normalizados / (cpcs_normalizados + 1)) +
+        ajustes_seo[indices_produto]
+    )
 
-        # Adicionar o CTR individual ao total, ponderado pelo volume
-        ctr_total += ctr_individual * volume
-        peso_total += volume
-
-    # Calcular a média ponderada do CTR
-    ctr_ponderado = (ctr_total / peso_total) if peso_total > 0 else 0
+    # Média ponderada pelo volume, agregada por produto
+    ctr_total = np.bincount(indices_produto, weights=ctr_individual * volumes, minlength=quantidade)
+    peso_total = np.bincount(indices_produto, weights=volumes, minlength=quantidade)
+    ctr_ponderado = np.divide(ctr_total, peso_total, out=np.zeros(quantidade), where=peso_total > 0)
 
     # Normalização final para evitar valores extremos
-    ctr_ponderado = min(max(ctr_ponderado, 0), 86.75)  # Limitar à escala máxima
-    return round(ctr_ponderado, 2)
+    ctr_ponderado = np.clip(ctr_ponderado, 0, CTR_MAXIMO)
+    return [round(float(valor), 2) for valor in ctr_ponderado]
+
+
+def calcular_ctr_ponderado(categoria, palavras_chave, nome_do_produto, permissao_fundo_funil, pontuacao_seo_basico):
+    """
+    Calcula o CTR ponderado com base em múltiplas palavras-chave, categoria, volume, CPC e ajustes de SEO.
+    """
+    return calcular_ctr_ponderado_lote([{
+        "categoria": categoria,
+        "palavras_chave": palavras_chave,
+        "nome_do_produto": nome_do_produto,
+        "permissao_fundo_funil": permissao_fundo_funil,
+        "pontuacao_seo_basico": pontuacao_seo_basico
+    }])[0]
 
 
 
@@ -2033,18 +2785,87 @@ def formatar_cpcs(cpcs):
         return "Erro ao formatar CPCs"
 
 
-# Adicione um dicionário global para rastrear frases já usadas
-frases_usadas = {
-    "custo_beneficio": set(),
-    "pontuacao_total": set(),
-    "conclusao": set()
+# MOTOR DE FRASES
+# Os modelos são interpretados uma única vez na carga do módulo. Cada análise tem seu próprio
+# estado de rotação (em flask.g durante a requisição): um "saco" embaralhado de índices por
+# bloco e cenário, do qual cada frase sai em O(1) sem repetir até o saco esvaziar.
+# Informe `semente_frases` no formulário (ou uma semente na rotação) para texto reproduzível.
+import string
+from flask import g, has_app_context, has_request_context
+
+
+def compilar_frase(modelo):
+    """
+    Interpreta o modelo em partes (texto fixo, campo, formato, conversão).
+    """
+    return tuple(string.Formatter().parse(modelo))
+
+
+def preencher_frase(partes, dados):
+    """
+    Monta a frase a partir das partes já interpretadas, sem reanalisar o modelo.
+    """
+    pedacos = []
+    for texto, campo, formato, conversao in partes:
+        pedacos.append(texto)
+        if campo is not None:
+            valor = dados[campo]
+            if conversao == "r":
+                valor = repr(valor)
+            elif conversao == "s":
+                valor = str(valor)
+            elif conversao == "a":
+                valor = ascii(valor)
+            pedacos.append(format(valor, formato or ""))
+    return "".join(pedacos)
+
+
+FRASES_COMPILADAS = {
+    bloco: {cenario: [compilar_frase(modelo) for modelo in modelos] for cenario, modelos in cenarios.items()}
+    for bloco, cenarios in frases.items()
 }
 
-def selecionar_comparacao(bloco, cenario, **dados):
+
+def nova_rotacao_frases(semente=None):
+    """
+    Estado de rotação de uma análise (ou de um lote): gerador aleatório e sacos de índices.
+    """
+    return {"aleatorio": random.Random(semente), "sacos": {}}
+
+
+def obter_rotacao_frases():
+    """
+    Retorna a rotação de frases da requisição atual, criando-a no primeiro uso com a
+    semente opcional `semente_frases`. Fora de uma requisição, retorna uma rotação nova.
+    """
+    if not has_app_context():
+        return nova_rotacao_frases()
+    if "rotacao_frases" not in g:
+        semente = None
+        if has_request_context():
+            semente = request.values.get("semente_frases", type=int)
+        g.rotacao_frases = nova_rotacao_frases(semente)
+    return g.rotacao_frases
+
+
+def sortear_frase(rotacao, bloco, cenario):
+    """
+    Tira do saco uma frase ainda não usada do cenário; com o saco vazio, embaralha de novo.
+    """
+    saco = rotacao["sacos"].get((bloco, cenario))
+    if not saco:
+        saco = list(range(len(FRASES_COMPILADAS[bloco][cenario])))
+        rotacao["aleatorio"].shuffle(saco)
+        rotacao["sacos"][(bloco, cenario)] = saco
+    return FRASES_COMPILADAS[bloco][cenario][saco.pop()]
+
+
+def selecionar_comparacao(bloco, cenario, rotacao=None, **dados):
     """
     Seleciona uma frase do bloco e cenário especificados e substitui os placeholders pelos dados fornecidos.
     Evita a repetição de frases na mesma análise.
     """
+    rotacao = rotacao or obter_rotacao_frases()
     try:
         if bloco == "custo_beneficio" and cenario == "cenario3":
             produtos = dados.get("produtos", [])
@@ -2060,56 +2881,23 @@ def selecionar_comparacao(bloco, cenario, **dados):
             if produto_1 == produto_2 and len(produtos_ordenados) > 1:
                 produto_2 = produtos_ordenados[1]
 
-            # Busca frases disponíveis que ainda não foram usadas
-            frases_do_cenario = frases[bloco][cenario]
-            frases_disponiveis = [f for f in frases_do_cenario if f not in frases_usadas[bloco]]
-
-            # Se todas as frases já foram usadas, redefina o conjunto
-            if not frases_disponiveis:
-                frases_usadas[bloco].clear()
-                frases_disponiveis = frases_do_cenario
-
-            # Escolhe uma frase disponível
-            frase = random.choice(frases_disponiveis)
-
-            # Marca a frase como usada
-            frases_usadas[bloco].add(frase)
-
             # Substitui os placeholders na frase
-            frase = frase.format(
-                nome_1=produto_1["nome"],
-                nome_2=produto_2["nome"],
-                cpcs_1=formatar_cpcs(produto_1.get("cpcs", [])),
-                cpcs_2=formatar_cpcs(produto_2.get("cpcs", [])),
-                nome=produto_1["nome"],
-                cpcs=formatar_cpcs(produto_1.get("cpcs", []))
-            )
-            return frase
-
-        # Recupera frases disponíveis para outros cenários
-        frases_do_cenario = frases[bloco][cenario]
-        frases_disponiveis = [f for f in frases_do_cenario if f not in frases_usadas[bloco]]
-
-        # Se todas as frases já foram usadas, redefina o conjunto
-        if not frases_disponiveis:
-            frases_usadas[bloco].clear()
-            frases_disponiveis = frases_do_cenario
-
-        # Escolhe uma frase disponível
-        frase = random.choice(frases_disponiveis)
-
-        # Marca a frase como usada
-        frases_usadas[bloco].add(frase)
+            return preencher_frase(sortear_frase(rotacao, bloco, cenario), {
+                "nome_1": produto_1["nome"],
+                "nome_2": produto_2["nome"],
+                "cpcs_1": formatar_cpcs(produto_1.get("cpcs", [])),
+                "cpcs_2": formatar_cpcs(produto_2.get("cpcs", [])),
+                "nome": produto_1["nome"],
+                "cpcs": formatar_cpcs(produto_1.get("cpcs", []))
+            })
 
         # Substitui os placeholders na frase
-        frase = frase.format(**dados)
-
-        return frase
+        return preencher_frase(sortear_frase(rotacao, bloco, cenario), dados)
     except Exception as e:
         return f"Erro ao formatar as frases: {e}"
 
 
-def gerar_frases_custo_beneficio(produtos):
+def gerar_frases_custo_beneficio(produtos, rotacao=None):
     phrases = []
     produtos_ordenados = sorted(produtos, key=lambda x: x['avg_cpc'], reverse=True)
     num_produtos = len(produtos_ordenados)
@@ -2124,17 +2912,17 @@ def gerar_frases_custo_beneficio(produtos):
         else:
             cenario = 'cenario3'  # CPC Médio
         
-        # Passar lista completa de produtos para o cenário 3
+        # Passar lista completa de produtos para o cenário 3 (já ordenada: reordenar é linear)
         if cenario == 'cenario3':
-            frase = selecionar_comparacao('custo_beneficio', cenario, produtos=produtos)
+            frase = selecionar_comparacao('custo_beneficio', cenario, rotacao, produtos=produtos_ordenados)
         else:
-            frase = selecionar_comparacao('custo_beneficio', cenario, **produto)
+            frase = selecionar_comparacao('custo_beneficio', cenario, rotacao, **produto)
         
         phrases.append(frase)
     return phrases
 
 
-def gerar_frases_pontuacao_total(produtos):
+def gerar_frases_pontuacao_total(produtos, rotacao=None):
     """
     Gera frases para o bloco pontuação_total.
     """
@@ -2153,13 +2941,13 @@ def gerar_frases_pontuacao_total(produtos):
             continue  # Ignorar caso intermediário
 
         # Gera a frase com base no cenário válido
-        frase = selecionar_comparacao('pontuacao_total', cenario, **produto)
+        frase = selecionar_comparacao('pontuacao_total', cenario, rotacao, **produto)
         phrases.append(frase)
 
     return phrases
 
 
-def gerar_frases_conclusao(produtos):
+def gerar_frases_conclusao(produtos, rotacao=None):
     """
     Gera frases de conclusão.
     """
@@ -2173,6 +2961,7 @@ def gerar_frases_conclusao(produtos):
         frase = selecionar_comparacao(
             "conclusao",
             "cenario1",
+            rotacao,
             nome=produto["nome"],
             cpcs=cpcs_formatados
         )
@@ -2222,7 +3011,7 @@ def analisar():
             )
 
             if produto:
-                produtos.append(produto)
+                produtos.append(produto.para_dict())
 
         # Ordenar produtos por pontuação total
         produtos = sorted(produtos, key=lambda p: p.get("pontuacao_total", 0), reverse=True)
@@ -2292,6 +3081,7 @@ app = Flask(__name__)
 
 def buscar_subreddit(subreddit_name, nome_produto):
     try:
+        reddit = obter_cliente_reddit()
         submissions = reddit.subreddit(subreddit_name).search(nome_produto, limit=5)
         resultados = []
         for submission in submissions:
@@ -2305,37 +3095,26 @@ def buscar_subreddit(subreddit_name, nome_produto):
     except Exception as e:
         return {"subreddit": subreddit_name, "erro": str(e)}
 
-# Lista de subreddits para busca
-subreddits = ["HealthTrendz", "diabetes", "newyorkknicks", "ApexDiscount", "WeReviewedIt"]
+# Inicializa o Reddit: o praw não é thread-safe, então cada thread usa o seu próprio cliente
+_clientes_reddit = threading.local()
 
-# Paralelismo
-nome_produto = "Gluco trust"
-with concurrent.futures.ThreadPoolExecutor() as executor:
-    future_to_subreddit = {executor.submit(buscar_subreddit, sub, nome_produto): sub for sub in subreddits}
 
-    resultados = []
-    for future in concurrent.futures.as_completed(future_to_subreddit):
-        subreddit_name = future_to_subreddit[future]
+def obter_cliente_reddit():
+    """
+    Retorna o cliente do Reddit da thread atual (None se a inicialização falhar).
+    """
+    if not hasattr(_clientes_reddit, "cliente"):
         try:
-            data = future.result()
-            resultados.extend(data)
-        except Exception as exc:
-            print(f"Erro no subreddit {subreddit_name}: {exc}")
-
-print(resultados)
-
-
-# Inicializa o Reddit
-try:
-    reddit = praw.Reddit(
-        client_id=client_id,
-        client_secret=client_secret,
-        user_agent=user_agent,
-    )
-    logging.debug("Reddit inicializado com sucesso.")
-except Exception as e:
-    logging.error(f"Erro ao inicializar o Reddit: {e}")
-    reddit = None
+            _clientes_reddit.cliente = praw.Reddit(
+                client_id=client_id,
+                client_secret=client_secret,
+                user_agent=user_agent,
+            )
+            logging.debug("Reddit inicializado com sucesso.")
+        except Exception as e:
+            logging.error(f"Erro ao inicializar o Reddit: {e}")
+            _clientes_reddit.cliente = None
+    return _clientes_reddit.cliente
 
 # Lista de subreddits fixos
 
@@ -2477,6 +3256,7 @@ def calcular_pontuacao_reddit(nome_produto, categoria):
     """
     Calcula a pontuação de engajamento no Reddit para a categoria do produto.
     """
+    reddit = obter_cliente_reddit()
     if not reddit:
         logging.error("Reddit não está inicializado.")
         return {"erro": "Integração com Reddit indisponível.", "pontuacao_reddit": 0, "subreddits_avaliados": []}
@@ -2627,62 +3407,21 @@ def analisar_com_reddit():
 
 
 @app.route("/analisar", methods=["POST"])
-def analisar():
+async def analisar():
     try:
         nicho = request.form.get("nicho", "Nicho Não Informado")
         logging.debug(f"Nicho recebido: {nicho}")
 
-        # Coletar dados dos produtos
-        produtos = []
-        for i in range(1, 6):  # Até 5 produtos
-            nome_produto = request.form.get(f"nome_produto_{i}", "").strip()
-            if not nome_produto:
-                continue
-            url_produto = request.form.get(f"url_produto_{i}", "").strip()
-            categoria_produto = request.form.get(f"categoria_produto_{i}", "").strip()
-
-            # Calcular pontuação de Redes Sociais
-            pontuacao_redes = calcular_redes_sociais(request.form, i)
-            logging.debug(f"Pontuação Redes Sociais para produto {i}: {pontuacao_redes}")
-
-            # Processar o produto
-            produto = processar_produto(
-                index=i,
-                nome_produto=nome_produto,
-                url_produto=url_produto,
-                permissao_trafego_pago=True,
-                permissao_fundo_funil=True,
-                form_data=request.form,
-                categoria_produto=categoria_produto,
-                tabela_ctr=tabela_ctr,
-                pontuacao_redes_sociais=pontuacao_redes  # Certifique-se de incluir este parâmetro
-            )
-
-            if produto:
-                produtos.append(produto)
+        # Coletar e pontuar os produtos (até 5), com as esperas de rede em paralelo
+        resultado = await processar_nicho_async(request.form, request.files, exigir_url=False)
+        resultado["nicho"] = nicho
 
-        if not produtos:
+        if not resultado["produtos"]:
             logging.error("Nenhum produto fornecido.")
             return render_template("index.html", error="Nenhum produto fornecido.")
 
-        # Ordenar produtos por pontuação
-        produtos = sorted(produtos, key=lambda p: p.get("pontuacao_total", 0), reverse=True)
-
-        # Gerar frases
-        frases_custo_beneficio = gerar_frases_custo_beneficio(produtos)
-        frases_pontuacao_total = gerar_frases_pontuacao_total(produtos)
-        frases_conclusao = gerar_frases_conclusao(produtos)
-        
-
-        # Renderizar o template
-        return render_template(
-            "analisar.html",
-            nicho=nicho,
-            produtos=produtos,
-            frases_custo_beneficio=frases_custo_beneficio,
-            frases_pontuacao_total=frases_pontuacao_total,
-            frases_conclusao=frases_conclusao,
-        )
+        # Renderizar o template com as frases
+        return renderizar_resultado_nicho(resultado, com_frases=True, form_data=request.form, arquivos=request.files)
     except Exception as e:
         logging.error(f"Erro ao processar a análise: {e}")
         
@@ -2711,47 +3450,55 @@ def calcular_redes_sociais(form_data, produto_index):
 
         engajamento = form_data.get(f"engajamento_{produto_index}", "baixo")
 
+        # A pontuação depende só dos campos do formulário; reenvios iguais vêm do cache
+        return pontuar_redes_sociais(
+            instagram_presente, facebook_presente, youtube_presente,
+            instagram_postagem, facebook_postagem, youtube_postagem,
+            engajamento
+        )
+
+    except Exception as e:
+        logging.error(f"Erro ao calcular pontuação de Redes Sociais: {e}")
+        return 0
 
 
-        # Inicializa a pontuação
-        pontuacao = 0
+@lru_cache(maxsize=256)
+def pontuar_redes_sociais(instagram_presente, facebook_presente, youtube_presente,
+                          instagram_postagem, facebook_postagem, youtube_postagem,
+                          engajamento):
+    # Inicializa a pontuação
+    pontuacao = 0
 
-        # Presença nas redes sociais (até 1.5 pontos)
-        redes_presente = sum([
-            0.5 if instagram_presente else 0,
-            0.5 if facebook_presente else 0,
-            0.5 if youtube_presente else 0
-        ])
-        pontuacao += redes_presente
-
-        # Postagens recentes (até 1.0 ponto)
-        postagens_recentes = sum([
-            0.3 if instagram_postagem else 0,
-            0.3 if facebook_postagem else 0,
-            0.3 if youtube_postagem else 0
-        ])
-        pontuacao += postagens_recentes
-
-        # Engajamento (até 1.5 pontos)
-        if engajamento == "baixo":
-            pontuacao += 0
-        elif engajamento == "medio":
-            pontuacao += 0.8
-        elif engajamento == "alto":
-            pontuacao += 1.5
-
-        # Limita a pontuação máxima
-        pontuacao = min(pontuacao, 4)
+    # Presença nas redes sociais (até 1.5 pontos)
+    redes_presente = sum([
+        0.5 if instagram_presente else 0,
+        0.5 if facebook_presente else 0,
+        0.5 if youtube_presente else 0
+    ])
+    pontuacao += redes_presente
 
-        return round(pontuacao, 2)
+    # Postagens recentes (até 1.0 ponto)
+    postagens_recentes = sum([
+        0.3 if instagram_postagem else 0,
+        0.3 if facebook_postagem else 0,
+        0.3 if youtube_postagem else 0
+    ])
+    pontuacao += postagens_recentes
 
+    # Engajamento (até 1.5 pontos)
+    if engajamento == "baixo":
+        pontuacao += 0
+    elif engajamento == "medio":
+        pontuacao += 0.8
+    elif engajamento == "alto":
+        pontuacao += 1.5
 
-        logging.debug(f"Pontuação calculada para produto {produto_index}: {pontuacao}")
-        return pontuacao
+    # Limita a pontuação máxima
+    pontuacao = min(pontuacao, 4)
+
+    logging.debug(f"Pontuação de Redes Sociais calculada: {pontuacao}")
+    return round(pontuacao, 2)
 
-    except Exception as e:
-        logging.error(f"Erro ao calcular pontuação de Redes Sociais: {e}")
-        return 0
 
 
 
@@ -2763,183 +3510,2810 @@ def calcular_redes_sociais(form_data, produto_index):
 
 
 
-# FUNÇÃO BASE DO CODIGO
-def processar_produto(index, nome_produto, url_produto, permissao_trafego_pago,
-                      permissao_fundo_funil, form_data, categoria_produto, tabela_ctr,
-                      pontuacao_redes_sociais):
+# INÍCIO IMPORTAÇÃO DE PALAVRAS-CHAVE (CSV/TSV)
+import csv
+import io
+import pandas as pd
+
+# Linhas lidas por lote do arquivo; cada lote é convertido coluna a coluna
+TAMANHO_LOTE_PALAVRAS_CHAVE = 5000
+# Máximo de palavras-chave aceitas por produto
+LIMITE_PALAVRAS_CHAVE_PRODUTO = int(os.environ.get("LIMITE_PALAVRAS_CHAVE_PRODUTO", 50000))
+# Palavras-chave exibidas como campos editáveis; as demais voltam ao formulário num campo oculto
+LIMITE_PALAVRAS_CHAVE_EDITAVEIS = 50
+# Início do arquivo usado para detectar delimitador e cabeçalho
+BYTES_AMOSTRA_CSV = 8192
+DELIMITADORES_CSV = "\t;|,"
+
+# Nomes de coluna aceitos, incluindo os das exportações das ferramentas de pesquisa
+COLUNAS_PALAVRAS_CHAVE = {
+    "palavra": ["palavra", "palavra-chave", "palavra_chave", "palavras-chave", "keyword", "keywords",
+                "termo", "query", "search term"],
+    "volume": ["volume", "volume de busca", "volume_busca", "search volume", "avg. monthly searches",
+               "avg monthly searches", "searches"],
+    "cpc": ["cpc", "cpc (usd)", "cpc (brl)", "custo por clique", "top of page bid (high range)"],
+}
+MAPA_COLUNAS_PALAVRAS_CHAVE = {
+    alias: coluna for coluna, aliases in COLUNAS_PALAVRAS_CHAVE.items() for alias in aliases
+}
+
+# O formulário de resultados reenvia as palavras importadas; o padrão do Flask (500 KB) é pouco
+app.config["MAX_FORM_MEMORY_SIZE"] = 8 * 1024 * 1024
+app.config["MAX_CONTENT_LENGTH"] = 32 * 1024 * 1024
+
+
+def normalizar_nome_coluna(nome):
+    return str(nome).strip().strip('"').lower()
+
+
+def detectar_formato_csv(amostra):
     """
-    Processa as informações de um produto, calculando pontuações e validando dados.
+    Detecta o delimitador e se a primeira linha é um cabeçalho reconhecido.
+    """
+    primeira_linha = amostra.splitlines()[0] if amostra else ""
+
+    # Cabeçalho reconhecido: o delimitador é o que separa os nomes conhecidos
+    for delimitador in DELIMITADORES_CSV:
+        colunas = {MAPA_COLUNAS_PALAVRAS_CHAVE.get(normalizar_nome_coluna(c)) for c in primeira_linha.split(delimitador)}
+        if len(colunas - {None}) >= 2:
+            return delimitador, True
+
+    # Sem cabeçalho: descarta a última linha (possivelmente cortada) e usa o Sniffer
+    linhas_completas = amostra[:amostra.rfind("\n")] if "\n" in amostra else amostra
+    try:
+        delimitador = csv.Sniffer().sniff(linhas_completas, delimiters=DELIMITADORES_CSV).delimiter
+    except csv.Error:
+        delimitador = max(DELIMITADORES_CSV, key=primeira_linha.count)
+    return delimitador, False
+
+
+def converter_decimais(serie):
+    """
+    Converte uma coluna de texto em float aceitando "1,50", "1.50", "R$ 1.234,56" e "$1,234.56".
+    O último separador encontrado é o decimal; valores inválidos viram NaN.
+    """
+    texto = serie.str.replace(r"[^\d,.\-]", "", regex=True)
+    decimal_virgula = texto.str.rfind(",") > texto.str.rfind(".")
+    texto = texto.where(
+        ~decimal_virgula,
+        texto.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    )
+    texto = texto.where(decimal_virgula, texto.str.replace(",", "", regex=False))
+    return pd.to_numeric(texto, errors="coerce")
+
+
+def converter_inteiros(serie):
+    """
+    Converte uma coluna de texto em inteiros, removendo separadores de milhar ("1.200", "1,200", "1 200").
+    Valores fracionários ou inválidos viram NaN.
+    """
+    texto = serie.str.strip().str.replace(r"[\s.,](?=\d{3}(?!\d))", "", regex=True)
+    valores = pd.to_numeric(texto, errors="coerce")
+    return valores.where(valores == valores.round())
+
+
+def normalizar_palavras_chave(tabela):
+    """
+    Converte um lote (colunas palavra, volume e cpc em texto) na lista usada por SEO e CTR.
+    Linhas sem palavra ou com volume/CPC inválidos são descartadas.
+    """
+    palavras = tabela["palavra"].fillna("").astype(str).str.strip()
+    volumes = converter_inteiros(tabela["volume"].fillna("").astype(str))
+    cpcs = converter_decimais(tabela["cpc"].fillna("").astype(str))
+
+    validas = (palavras != "") & volumes.notna() & cpcs.notna()
+    descartadas = int((~validas).sum())
+    if descartadas:
+        logging.debug(f"[DEBUG] {descartadas} linha(s) de palavras-chave ignoradas por volume ou CPC inválido.")
+
+    return [
+        {"palavra": palavra, "volume": int(volume), "cpc": float(cpc)}
+        for palavra, volume, cpc in zip(palavras[validas], volumes[validas], cpcs[validas])
+    ]
+
+
+def ler_palavras_chave_arquivo(arquivo, limite=LIMITE_PALAVRAS_CHAVE_PRODUTO):
+    """
+    Lê um CSV/TSV de palavras-chave (palavra, volume, cpc) em lotes, sem carregar o arquivo inteiro.
+    Aceita um stream binário (upload) ou o texto já serializado.
+    """
+    if isinstance(arquivo, str):
+        arquivo = io.StringIO(arquivo)
+
+    amostra = arquivo.read(BYTES_AMOSTRA_CSV)
+    arquivo.seek(0)
+    if isinstance(amostra, bytes):
+        amostra = amostra.decode("utf-8-sig", errors="replace")
+    if not amostra.strip():
+        return []
+
+    delimitador, tem_cabecalho = detectar_formato_csv(amostra.lstrip("\ufeff"))
+    opcoes = {
+        "sep": delimitador,
+        "dtype": str,
+        "keep_default_na": False,
+        "skipinitialspace": True,
+        "on_bad_lines": "skip",
+        "chunksize": TAMANHO_LOTE_PALAVRAS_CHAVE,
+        "encoding": "utf-8-sig",
+        "encoding_errors": "replace",
+    }
+    if tem_cabecalho:
+        opcoes["usecols"] = lambda coluna: normalizar_nome_coluna(coluna) in MAPA_COLUNAS_PALAVRAS_CHAVE
+    else:
+        opcoes.update(header=None, usecols=[0, 1, 2], names=["palavra", "volume", "cpc"])
+
+    palavras_chave = []
+    with pd.read_csv(arquivo, **opcoes) as leitor:
+        for lote in leitor:
+            if tem_cabecalho:
+                lote = lote.rename(columns=lambda coluna: MAPA_COLUNAS_PALAVRAS_CHAVE[normalizar_nome_coluna(coluna)])
+                lote = lote.loc[:, ~lote.columns.duplicated()]
+                faltando = {"palavra", "volume", "cpc"} - set(lote.columns)
+                if faltando:
+                    raise ValueError(f"Coluna(s) ausente(s) no arquivo: {', '.join(sorted(faltando))}")
+
+            palavras_chave.extend(normalizar_palavras_chave(lote))
+            if len(palavras_chave) >= limite:
+                logging.debug(f"[DEBUG] Limite de {limite} palavras-chave atingido; restante do arquivo ignorado.")
+                return palavras_chave[:limite]
+
+    return palavras_chave
+
+
+def serializar_palavras_chave(palavras_chave):
+    """
+    Serializa palavras-chave em TSV para reenviar pelo formulário de resultados.
+    """
+    if not palavras_chave:
+        return ""
+    return pd.DataFrame(palavras_chave, columns=["palavra", "volume", "cpc"]).to_csv(sep="\t", index=False)
+
+
+def extrair_palavras_chave_produto(form_data, index, arquivos=None):
+    """
+    Junta as palavras-chave do produto: linhas do formulário, palavras importadas
+    reenviadas pela página de resultados e o arquivo enviado (que substitui as importadas).
     """
     palavras = form_data.getlist(f'palavra-chave_{index}[]')
     volumes = form_data.getlist(f'volume_{index}[]')
     cpcs = form_data.getlist(f'cpc_{index}[]')
+    linhas = min(len(palavras), len(volumes), len(cpcs))
 
     palavras_chave = []
-    cpcs_lista = []
-    for palavra, volume, cpc in zip(palavras, volumes, cpcs):
-        try:
-            logging.debug(f"Processando palavra-chave: {palavra}, volume: {volume}, cpc: {cpc}")
-            cpc = cpc.replace(',', '.')  # Substitui vírgulas por pontos
-            cpc_value = float(cpc)
-            volume_value = int(volume)
-            palavras_chave.append({
-                'palavra': palavra.strip(),
-                'volume': volume_value,
-                'cpc': cpc_value
-            })
-            if cpc_value > 0:
-                cpcs_lista.append(cpc_value)
-        except ValueError:
-            logging.error(f"Erro ao converter cpc '{cpc}' ou volume '{volume}' para número.")
-            continue
+    if linhas:
+        palavras_chave = normalizar_palavras_chave(pd.DataFrame({
+            "palavra": palavras[:linhas],
+            "volume": volumes[:linhas],
+            "cpc": cpcs[:linhas],
+        }))
+
+    arquivo = arquivos.get(f"arquivo_palavras_chave_{index}") if arquivos else None
+    try:
+        if arquivo and arquivo.filename:
+            importadas = ler_palavras_chave_arquivo(arquivo.stream)
+            logging.debug(f"[DEBUG] {len(importadas)} palavra(s)-chave importada(s) de '{arquivo.filename}' para o produto {index}.")
+        else:
+            importadas = ler_palavras_chave_arquivo(form_data.get(f"palavras_chave_importadas_{index}", ""))
+    except (ValueError, pd.errors.ParserError, UnicodeError) as e:
+        logging.error(f"[ERRO] Falha ao ler o arquivo de palavras-chave do produto {index}: {e}")
+        importadas = []
 
-    # Cálculo dos CPCs
-    cpcs_formatted = formatar_cpcs(cpcs_lista)
-    avg_cpc = sum(cpcs_lista) / len(cpcs_lista) if cpcs_lista else 0
+    return (palavras_chave + importadas)[:LIMITE_PALAVRAS_CHAVE_PRODUTO]
 
-    # Calcular outros critérios
-    pontuacao_qualidade_pagina = calcular_qualidade_pagina(url_produto)
-    pontuacao_copywriting = calcular_copywriting(url_produto)
-    pontuacao_beneficios_ofertas = calcular_beneficios_ofertas(url_produto)
-    pontuacao_preco_valor_percebido, feedback_preco_valor = preco_valor_percebido_pontuacao(url_produto, categoria_produto)
-    pontuacao_faixa_precos = calcular_faixa_precos(url_produto)
-    pontuacao_sazonalidade, descricao_sazonalidade = analisar_sazonalidade(nome_produto)
-
-    # Calcular pontuação de SEO e palavras-chave
-    pontuacao_seo_palavras, detalhes_seo = calcular_pontuacao_seo(
-        palavras_chave, permissao_trafego_pago, permissao_fundo_funil, nome_produto, url_produto, categoria_produto
-    )
+# FIM IMPORTAÇÃO DE PALAVRAS-CHAVE (CSV/TSV)
 
-    # Validar categoria e calcular CTR ponderado
-    categoria_valida = validar_categoria(categoria_produto, tabela_ctr)
-    if not categoria_valida:
-        logging.error(f"Produto {index} ignorado: Categoria inválida.")
-        return None
 
-    if not palavras_chave:
-        logging.error("Nenhuma palavra-chave válida foi fornecida. O cálculo de CTR será ignorado.")
-        nota_ctr_ponderado = 0
-        descricao_ctr = "Nenhuma palavra-chave válida para análise de CTR."
+
+
+
+# INÍCIO MEMO DE CRITÉRIOS
+# Reenvios do formulário (ajuste de palavras-chave, CPCs ou redes sociais) só recalculam
+# os critérios cujas entradas mudaram: critérios de página são guardados pela impressão
+# digital do conteúdo baixado, SEO e CTR pelo conjunto de palavras-chave.
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Versão de cada critério: incremente ao alterar a lógica para invalidar resultados guardados
+VERSOES_CRITERIOS = {
+    "qualidade_pagina": 1,
+    "copywriting": 1,
+    "beneficios_ofertas": 1,
+    "preco_valor_percebido": 1,
+    "faixa_precos": 1,
+    "seo_basico": 1,
+    "seo_palavras": 1,
+    "ctr": 1,
+}
+LIMITE_MEMO_CRITERIOS = int(os.environ.get("LIMITE_MEMO_CRITERIOS", 2048))
+
+_memo_criterios = OrderedDict()
+_trava_memo_criterios = threading.Lock()
+_AUSENTE = object()
+
+
+def buscar_memo_criterio(chave):
+    """
+    Retorna uma cópia do resultado guardado para a chave, ou _AUSENTE.
+    """
+    with _trava_memo_criterios:
+        resultado = _memo_criterios.get(chave, _AUSENTE)
+        if resultado is _AUSENTE:
+            return _AUSENTE
+        _memo_criterios.move_to_end(chave)
+    return copy.deepcopy(resultado)
+
+
+def guardar_memo_criterio(chave, resultado):
+    """
+    Guarda o resultado descartando os menos usados quando o limite é atingido.
+    """
+    with _trava_memo_criterios:
+        _memo_criterios[chave] = copy.deepcopy(resultado)
+        _memo_criterios.move_to_end(chave)
+        while len(_memo_criterios) > LIMITE_MEMO_CRITERIOS:
+            _memo_criterios.popitem(last=False)
+
+
+def memoizar_criterio(criterio, entradas, calcular):
+    """
+    Calcula o critério apenas se ainda não houver resultado para (critério, versão, entradas).
+    """
+    chave = (criterio, VERSOES_CRITERIOS[criterio]) + tuple(entradas)
+    resultado = buscar_memo_criterio(chave)
+    if resultado is _AUSENTE:
+        resultado = calcular()
+        guardar_memo_criterio(chave, resultado)
     else:
-        nota_ctr_ponderado = calcular_ctr_ponderado(
-            categoria=categoria_valida,
-            palavras_chave=palavras_chave,
-            nome_do_produto=nome_produto,
-            permissao_fundo_funil=permissao_fundo_funil,
-            pontuacao_seo_basico=detalhes_seo['pontuacao_seo_basico']
-        )
-        descricao_ctr = analisar_ctr(nota_ctr_ponderado)
+        logging.debug(f"[DEBUG] Critério '{criterio}' reaproveitado do memo.")
+    return resultado
 
-    # Monta o dicionário do produto
-    produto = {
-        "nome": nome_produto,
-        "url": url_produto,
-        "categoria": categoria_valida,
-        "pontuacao_qualidade_pagina": round(pontuacao_qualidade_pagina, 2),
-        "pontuacao_copywriting": round(pontuacao_copywriting, 2),
-        "pontuacao_beneficios_ofertas": round(pontuacao_beneficios_ofertas, 2),
-        "pontuacao_preco_valor_percebido": round(pontuacao_preco_valor_percebido, 2),
-        "feedback_preco_valor": feedback_preco_valor,
-        "pontuacao_faixa_precos": round(pontuacao_faixa_precos, 2),
-        "pontuacao_sazonalidade": round(pontuacao_sazonalidade, 2),
-        "descricao_sazonalidade": descricao_sazonalidade,
-        "pontuacao_seo_palavras": round(pontuacao_seo_palavras, 2),
-        "pontuacao_permissao": round(detalhes_seo['pontuacao_permissao'], 2),
-        "pontuacao_volume_busca": round(detalhes_seo['pontuacao_volume_busca'], 2),
-        "pontuacao_concorrencia_cpc": round(detalhes_seo['pontuacao_concorrencia_cpc'], 2),
-        "pontuacao_keyword": round(detalhes_seo['pontuacao_keyword'], 2),
-        "pontuacao_seo_basico": round(detalhes_seo['pontuacao_seo_basico'], 2),
-        "pontuacao_ctr": round(nota_ctr_ponderado, 2),
-        "descricao_ctr": descricao_ctr,
-        "avg_cpc": round(avg_cpc, 2),
-        "palavras_chave": palavras_chave,
-        "permissao_trafego_pago": permissao_trafego_pago,
-        "permissao_fundo_funil": permissao_fundo_funil,
-        "cpc_alertas": detalhes_seo.get('cpc_alertas', []),
-        "cpcs": cpcs_formatted,
-        "instagram_presente": form_data.get(f"instagram_presente_{index}", "nao"),
-        "facebook_presente": form_data.get(f"facebook_presente_{index}", "nao"),
-        "youtube_presente": form_data.get(f"youtube_postagem_{index}", "nao"),
-        "pontuacao_redes_sociais": pontuacao_redes_sociais
+
+def hash_palavras_chave(palavras_chave):
+    """
+    Resume a lista de palavras-chave (palavra, volume, cpc) num hash usado como chave do memo.
+    """
+    resumo = hashlib.sha256()
+    for palavra in palavras_chave:
+        resumo.update(f"{palavra.get('palavra', '')}\t{palavra.get('volume', 0)}\t{palavra.get('cpc', 0.0)}\n".encode("utf-8"))
+    return resumo.hexdigest()
+
+
+def calcular_criterios_pagina(url, nome_produto, categoria, download):
+    """
+    Calcula os critérios que dependem da página, reaproveitando os que já foram
+    calculados para o mesmo conteúdo (ou, nos critérios de texto, quase o mesmo, pela
+    impressão digital). O HTML só é interpretado se algum critério faltar.
+    Sem download, os critérios ficam zerados com o motivo (nenhum critério baixa a página sozinho).
+    """
+    if not download:
+        return criterios_pagina_indisponivel(motivo_falha_recente(url) or "A página não carregou ou não é HTML.")
+
+    impressao = impressao_digital_pagina(download)
+    hash_texto, nova_referencia = chave_conteudo_pagina(url, impressao)
+    if nova_referencia:
+        indexar_pagina(url, nome_produto, impressao)
+    entradas = {
+        "qualidade_pagina": (),
+        "copywriting": (),
+        "beneficios_ofertas": (),
+        "preco_valor_percebido": (categoria,),
+        "faixa_precos": (),
+        "seo_basico": (nome_produto, categoria),
+    }
+    # Preço, faixa de preço e SEO básico só se repetem com o conteúdo exatamente igual
+    chaves = {
+        criterio: (
+            criterio, VERSOES_CRITERIOS[criterio],
+            hash_texto if criterio in CRITERIOS_REAPROVEITADOS_SIMHASH else impressao["hash"]
+        ) + valores
+        for criterio, valores in entradas.items()
     }
 
-    # Calcular pontuação total corretamente
-    produto["pontuacao_total"] = round(
-        produto["pontuacao_qualidade_pagina"] +
-        produto["pontuacao_copywriting"] +
-        produto["pontuacao_beneficios_ofertas"] +
-        produto["pontuacao_preco_valor_percebido"] +
-        produto["pontuacao_faixa_precos"] +
-        produto["pontuacao_sazonalidade"] +
-        produto["pontuacao_seo_palavras"] +
-        produto["pontuacao_ctr"] +
-        produto["pontuacao_redes_sociais"],
-        2
+    resultados = {}
+    for criterio, chave in chaves.items():
+        resultado = buscar_memo_criterio(chave)
+        if resultado is not _AUSENTE:
+            resultados[criterio] = resultado
+
+    # Páginas de template idênticas (mesmo conteúdo exato, qualquer URL ou worker) dividem
+    # os critérios de texto mais caros pelo cache compartilhado
+    for criterio in CRITERIOS_POR_CONTEUDO:
+        if criterio not in resultados:
+            resultado = ler_criterio_por_conteudo(criterio, impressao["hash"])
+            if resultado is not None:
+                resultados[criterio] = resultado
+                guardar_memo_criterio(chaves[criterio], resultado)
+
+    faltando = [criterio for criterio in chaves if criterio not in resultados]
+    logging.debug(f"[DEBUG] Critérios de página reaproveitados: {len(resultados)}; a calcular: {faltando}")
+    if not faltando:
+        return resultados
+
+    # A interpretação do HTML vai para o pool de processos (se houver)
+    calculados = calcular_criterios_em_processo(url, nome_produto, categoria, download, faltando)
+    for criterio in faltando:
+        resultados[criterio] = calculados[criterio]
+        guardar_memo_criterio(chaves[criterio], resultados[criterio])
+        if criterio in CRITERIOS_POR_CONTEUDO:
+            gravar_criterio_por_conteudo(criterio, impressao["hash"], resultados[criterio])
+
+    return resultados
+
+
+def calcular_criterios_faltando(url, nome_produto, categoria, download, faltando):
+    """
+    Interpreta o HTML e calcula apenas os critérios de página pedidos.
+    """
+    pagina = interpretar_pagina(url, download) if download else None
+    calculos = {
+        "qualidade_pagina": lambda: calcular_qualidade_pagina(url, pagina),
+        "copywriting": lambda: calcular_copywriting(url, pagina),
+        "beneficios_ofertas": lambda: calcular_beneficios_ofertas(url, pagina),
+        "preco_valor_percebido": lambda: calcular_preco_valor_percebido(url, categoria, pagina),
+        "faixa_precos": lambda: calcular_faixa_precos(url, pagina),
+        "seo_basico": lambda: limitar_seo_basico(analisar_seo_basico(url, nome_produto, categoria, pagina)),
+    }
+    return {criterio: calculos[criterio]() for criterio in faltando}
+
+# FIM MEMO DE CRITÉRIOS
+
+
+# INÍCIO POOL DE PROCESSOS PARA CRITÉRIOS DE PÁGINA
+# A interpretação do HTML (BeautifulSoup) e as comparações aproximadas são Python puro e
+# seguram o GIL; em threads elas travam as outras requisições do mesmo worker. Um pool de
+# processos persistente recebe só os bytes da página e devolve as pontuações calculadas.
+# O memo continua no processo principal: só os critérios que faltam vão para o pool.
+import atexit
+import multiprocessing
+from concurrent.futures.process import BrokenProcessPool
+
+# 0 desliga o pool (tudo roda no próprio processo)
+PROCESSOS_CRITERIOS = int(os.environ.get("PROCESSOS_CRITERIOS", min(4, os.cpu_count() or 1)))
+# "forkserver" evita herdar travas de threads do servidor; "fork" ou "spawn" também servem
+CONTEXTO_PROCESSOS_CRITERIOS = os.environ.get("CONTEXTO_PROCESSOS_CRITERIOS", "forkserver")
+
+_pool_processos = None
+_pid_pool_processos = None
+_trava_pool_processos = threading.Lock()
+
+
+def obter_pool_processos():
+    """
+    Retorna o pool de processos deste worker, criando-o na primeira chamada.
+    Retorna None se o pool estiver desligado ou se já estivermos num processo filho.
+    """
+    global _pool_processos, _pid_pool_processos
+    if PROCESSOS_CRITERIOS <= 0 or multiprocessing.parent_process() is not None:
+        return None
+    with _trava_pool_processos:
+        # Após um fork (ex.: gunicorn --preload) o pool herdado não pertence a este processo
+        if _pool_processos is None or _pid_pool_processos != os.getpid():
+            metodos = multiprocessing.get_all_start_methods()
+            contexto = CONTEXTO_PROCESSOS_CRITERIOS if CONTEXTO_PROCESSOS_CRITERIOS in metodos else None
+            _pool_processos = concurrent.futures.ProcessPoolExecutor(
+                max_workers=PROCESSOS_CRITERIOS,
+                mp_context=multiprocessing.get_context(contexto)
+            )
+            _pid_pool_processos = os.getpid()
+            logging.debug(f"[DEBUG] Pool de processos criado com {PROCESSOS_CRITERIOS} processo(s) ({contexto or 'padrão'}).")
+        return _pool_processos
+
+
+def descartar_pool_processos(pool):
+    """
+    Descarta um pool quebrado (processo filho morto) para que o próximo uso crie outro.
+    """
+    global _pool_processos
+    with _trava_pool_processos:
+        if _pool_processos is pool:
+            _pool_processos = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+@atexit.register
+def encerrar_pool_processos():
+    if _pool_processos is not None and _pid_pool_processos == os.getpid():
+        _pool_processos.shutdown(wait=False, cancel_futures=True)
+
+
+def calcular_criterios_de_bytes(url, nome_produto, categoria, conteudo, content_type, faltando):
+    """
+    Executada no processo filho: remonta o download a partir dos bytes e calcula os critérios.
+    """
+    return calcular_criterios_faltando(
+        url, nome_produto, categoria, download_de_bytes(url, conteudo, content_type), faltando
     )
 
-    # Calcula a nota final incluindo CTR
-    produto["nota_final"] = calcular_nota_final(produto, tabela_ctr)
 
-    logging.debug(f"Produto processado: {produto}")
-    return produto
+def calcular_criterios_em_processo(url, nome_produto, categoria, download, faltando):
+    """
+    Envia os bytes da página ao pool de processos; sem pool (ou se ele quebrar),
+    calcula no próprio processo.
+    """
+    pool = obter_pool_processos()
+    if pool is not None:
+        try:
+            return pool.submit(
+                calcular_criterios_de_bytes, url, nome_produto, categoria,
+                download["conteudo"], download.get("content_type", ""), faltando
+            ).result()
+        except BrokenProcessPool as e:
+            logging.error(f"[ERRO] Pool de processos quebrado, calculando no próprio processo: {e}")
+            descartar_pool_processos(pool)
+    return calcular_criterios_faltando(url, nome_produto, categoria, download, faltando)
+
+# FIM POOL DE PROCESSOS PARA CRITÉRIOS DE PÁGINA
+
+
+
+
+
+# INÍCIO CACHE COMPARTILHADO ENTRE WORKERS
+# Resultados dos critérios de página ficam num SQLite (modo WAL) usado por todos os
+# workers do gunicorn. Um bloqueio por chave garante que só um worker baixa e pontua
+# uma URL de cada vez; os demais aguardam e leem o resultado gravado.
+import json
+import sqlite3
+from contextlib import contextmanager
+
+CAMINHO_CACHE_COMPARTILHADO = os.environ.get(
+    "CACHE_COMPARTILHADO_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache_resultados.sqlite3")
+)
+TTL_CACHE_COMPARTILHADO = int(os.environ.get("TTL_CACHE_COMPARTILHADO", 6 * 60 * 60))
+# Tempo máximo de um bloqueio; depois disso outro worker assume o cálculo (worker travado ou morto)
+VALIDADE_BLOQUEIO_SEGUNDOS = 120
+INTERVALO_ESPERA_BLOQUEIO = 0.2
+# Travas locais por chave: threads do mesmo processo esperam aqui sem consultar o SQLite.
+# Cada chave em uso tem a sua (com contagem de usuários), para que um download lento não
+# segure chaves sem relação com ele.
+_travas_chaves_cache = {}
+_trava_registro_chaves = threading.Lock()
+_conexoes_sqlite = threading.local()
+
+ESQUEMA_CACHE_COMPARTILHADO = (
+    "CREATE TABLE IF NOT EXISTS resultados ("
+    "chave TEXT PRIMARY KEY, valor TEXT NOT NULL, criado_em REAL NOT NULL, expira_em REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_resultados_expira_em ON resultados (expira_em)",
+    "CREATE TABLE IF NOT EXISTS bloqueios (chave TEXT PRIMARY KEY, dono TEXT NOT NULL, expira_em REAL NOT NULL)",
+)
+
+
+def conexao_sqlite(caminho, esquema):
+    """
+    Retorna a conexão SQLite (modo WAL, autocommit) da thread atual para o arquivo,
+    criando as tabelas do esquema na primeira vez.
+    """
+    # Conexões não atravessam o fork dos workers: cada processo/thread abre as suas
+    if getattr(_conexoes_sqlite, "pid", None) != os.getpid():
+        _conexoes_sqlite.conexoes = {}
+        _conexoes_sqlite.pid = os.getpid()
+
+    conexao = _conexoes_sqlite.conexoes.get(caminho)
+    if conexao is None:
+        conexao = sqlite3.connect(caminho, timeout=30, isolation_level=None)
+        conexao.execute("PRAGMA journal_mode=WAL")
+        conexao.execute("PRAGMA synchronous=NORMAL")
+        for comando in esquema:
+            conexao.execute(comando)
+        _conexoes_sqlite.conexoes[caminho] = conexao
+    return conexao
+
+
+@contextmanager
+def transacao_imediata(conexao):
+    """
+    Transação com BEGIN IMMEDIATE: reserva a escrita já no início, evitando corridas entre workers.
+    """
+    conexao.execute("BEGIN IMMEDIATE")
+    try:
+        yield conexao
+    except BaseException:
+        conexao.execute("ROLLBACK")
+        raise
+    conexao.execute("COMMIT")
 
 
+@contextmanager
+def trava_local_chave(chave):
+    """
+    Trava local só desta chave; é descartada quando nenhuma thread a usa mais.
+    """
+    with _trava_registro_chaves:
+        registro = _travas_chaves_cache.setdefault(chave, [threading.Lock(), 0])
+        registro[1] += 1
+    try:
+        with registro[0]:
+            yield
+    finally:
+        with _trava_registro_chaves:
+            registro[1] -= 1
+            if not registro[1]:
+                del _travas_chaves_cache[chave]
+
+
+def conexao_cache_compartilhado():
+    # O disjuntor por domínio, o cache negativo (seção do início) e as impressões digitais
+    # de referência das páginas moram no mesmo arquivo
+    return conexao_sqlite(
+        CAMINHO_CACHE_COMPARTILHADO, ESQUEMA_CACHE_COMPARTILHADO + ESQUEMA_DISJUNTORES + ESQUEMA_IMPRESSOES_PAGINAS
+    )
 
 
-@app.route("/", methods=["GET", "POST"])
-def home():
-    if request.method == "POST":
-        nicho = request.form.get("nicho", "")
-        produtos = []
+def ler_cache_compartilhado(chave):
+    linha = conexao_cache_compartilhado().execute(
+        "SELECT valor FROM resultados WHERE chave = ? AND expira_em > ?", (chave, time.time())
+    ).fetchone()
+    return json.loads(linha[0]) if linha else None
 
-        for i in range(1, 6):
-            nome_produto = request.form.get(f"nome_produto_{i}", "").strip()
-            if not nome_produto:
-                    continue
-            print(f"Produto {i} - Nome: {nome_produto}")
 
-            url_produto = request.form.get(f"url_produto_{i}", "").strip()
-            categoria_produto = request.form.get(f"categoria_produto_{i}", "").strip()
+def gravar_cache_compartilhado(chave, valor, ttl=None):
+    agora = time.time()
+    conexao = conexao_cache_compartilhado()
+    conexao.execute(
+        "INSERT OR REPLACE INTO resultados (chave, valor, criado_em, expira_em) VALUES (?, ?, ?, ?)",
+        (chave, json.dumps(valor), agora, agora + (ttl or TTL_CACHE_COMPARTILHADO))
+    )
+    conexao.execute("DELETE FROM resultados WHERE expira_em <= ?", (agora,))
 
-            # Calcular pontuação de Redes Sociais
-            pontuacao_redes = calcular_redes_sociais(request.form, i)
 
+def tentar_bloquear_chave(chave, dono):
+    """
+    Tenta registrar o bloqueio da chave; bloqueios vencidos são descartados antes.
+    """
+    agora = time.time()
+    with transacao_imediata(conexao_cache_compartilhado()) as conexao:
+        conexao.execute("DELETE FROM bloqueios WHERE chave = ? AND expira_em <= ?", (chave, agora))
+        cursor = conexao.execute(
+            "INSERT OR IGNORE INTO bloqueios (chave, dono, expira_em) VALUES (?, ?, ?)",
+            (chave, dono, agora + VALIDADE_BLOQUEIO_SEGUNDOS)
+        )
+    return cursor.rowcount == 1
 
-            if nome_produto and url_produto:
-                permissao_trafego_pago = request.form.get(f"permissao_trafego_pago_{i}", "true") == "true"
-                permissao_fundo_funil = request.form.get(f"permissao_fundo_funil_{i}", "true") == "true"
-                categoria_produto = request.form.get(f"categoria_produto_{i}", "").strip()
-
-                produto = processar_produto(
-                    index=i,
-                    nome_produto=nome_produto,
-                    url_produto=url_produto,
-                    permissao_trafego_pago=True,
-                    permissao_fundo_funil=True,
-                    form_data=request.form,
-                    categoria_produto=categoria_produto,
-                    tabela_ctr=tabela_ctr,  # Certifique-se de que 'tabela_ctr' está definido
-                    pontuacao_redes_sociais=pontuacao_redes  # Adicionado
-                )
 
+def liberar_bloqueio_chave(chave, dono):
+    conexao_cache_compartilhado().execute("DELETE FROM bloqueios WHERE chave = ? AND dono = ?", (chave, dono))
 
-                if produto:  # Certifique-se de adicionar apenas produtos válidos
-                    produtos.append(produto)
 
-        # **Adicione aqui o filtro para remover produtos sem nome**
-        produtos = [produto for produto in produtos if produto.get("nome")]
+def obter_ou_calcular_compartilhado(chave, calcular, ttl=None):
+    """
+    Retorna o resultado guardado para a chave ou o calcula uma única vez entre todos os workers.
+    Resultados None não são gravados. Se o SQLite falhar, calcula sem cache.
+    """
+    with trava_local_chave(chave):
+        try:
+            valor = ler_cache_compartilhado(chave)
+            if valor is not None:
+                logging.debug(f"[DEBUG] Cache compartilhado: acerto para {chave}")
+                return valor
+
+            dono = f"{os.getpid()}:{threading.get_ident()}"
+            prazo = time.time() + VALIDADE_BLOQUEIO_SEGUNDOS
+            while not tentar_bloquear_chave(chave, dono):
+                # Outro worker está calculando esta chave: aguarda o resultado dele
+                time.sleep(INTERVALO_ESPERA_BLOQUEIO)
+                valor = ler_cache_compartilhado(chave)
+                if valor is not None:
+                    logging.debug(f"[DEBUG] Cache compartilhado: resultado de outro worker para {chave}")
+                    return valor
+                if time.time() > prazo:
+                    logging.warning(f"[CACHE] Tempo de espera esgotado para {chave}; calculando sem bloqueio.")
+                    return calcular()
+        except sqlite3.Error as e:
+            logging.error(f"[ERRO] Cache compartilhado indisponível: {e}")
+            return calcular()
 
-        # Aplica o arredondamento globalmente após o processamento
-        produtos = [arredondar_valores(produto, 2) for produto in produtos]
+        try:
+            valor = calcular()
+            if valor is not None:
+                gravar_cache_compartilhado(chave, valor, ttl)
+            return valor
+        except sqlite3.Error as e:
+            logging.error(f"[ERRO] Falha ao gravar no cache compartilhado: {e}")
+            return valor
+        finally:
+            try:
+                liberar_bloqueio_chave(chave, dono)
+            except sqlite3.Error as e:
+                logging.error(f"[ERRO] Falha ao liberar bloqueio de {chave}: {e}")
 
-        # Ordena os produtos com base na pontuação total antes de renderizar
-        produtos = sorted(produtos, key=lambda x: x.get("pontuacao_total", 0), reverse=True)
 
-        # Renderiza a página de resultados com os produtos processados
-        return render_template("analisar.html", nicho=nicho, produtos=produtos)
+def chave_criterios_pagina(url, nome_produto, categoria):
+    """
+    Chave do cache compartilhado: URL, versões dos critérios de página e entradas extras.
+    """
+    versoes = ",".join(
+        f"{criterio}={VERSOES_CRITERIOS[criterio]}"
+        for criterio in ("qualidade_pagina", "copywriting", "beneficios_ofertas",
+                         "preco_valor_percebido", "faixa_precos", "seo_basico")
+    )
+    return f"pagina|{url}|{versoes}|{nome_produto}|{categoria}"
 
-    # Exibe a página inicial se o método for GET
-    return render_template("index.html")
+
+def coletar_criterios_pagina(url, nome_produto, categoria):
+    """
+    Baixa a página e calcula os critérios de página. Retorna None se a página não carregar.
+    """
+    try:
+        download = baixar_html(url, timeout=10)
+    except requests.RequestException as e:
+        logging.error(f"Erro ao acessar a página {url}: {e}")
+        return None
+    if not download:
+        return None
+    return calcular_criterios_pagina(url, nome_produto, categoria, download)
+
+
+def obter_criterios_pagina(url_produto, nome_produto, categoria_produto):
+    """
+    Critérios de página pelo cache compartilhado: uma única coleta por URL entre todos
+    os workers. Se a página não carregar, os critérios de página ficam zerados e o motivo
+    vai para o resultado (os critérios não tentam baixar a página de novo, um por um).
+    """
+    if not url_produto:
+        return criterios_pagina_indisponivel("Produto sem URL informada.")
+    criterios_pagina = obter_ou_calcular_compartilhado(
+        chave_criterios_pagina(url_produto, nome_produto, categoria_produto),
+        lambda: coletar_criterios_pagina(url_produto, nome_produto, categoria_produto)
+    )
+    if criterios_pagina is None:
+        criterios_pagina = criterios_pagina_indisponivel(
+            motivo_falha_recente(url_produto) or "A página não carregou ou não é HTML."
+        )
+    return criterios_pagina
+
+# FIM CACHE COMPARTILHADO ENTRE WORKERS
+
+
+# INÍCIO REGISTRO DE PONTUAÇÃO DO PRODUTO
+# Cada produto pontuado é um PontuacaoProduto (dataclass com __slots__) e não um dicionário
+# de ~35 chaves: os campos de pontuação são explícitos e os valores ficam sem arredondamento
+# até a serialização (templates, JSON do lote e resultado dos jobs).
+from dataclasses import dataclass, field, fields
+
+CASAS_DECIMAIS_PONTUACAO = 2
+
+
+@dataclass(slots=True)
+class PontuacaoProduto:
+    nome: str
+    url: str
+    categoria: str
+    pontuacao_qualidade_pagina: float = 0.0
+    pontuacao_copywriting: float = 0.0
+    pontuacao_beneficios_ofertas: float = 0.0
+    pontuacao_preco_valor_percebido: float = 0.0
+    pontuacao_faixa_precos: float = 0.0
+    pontuacao_sazonalidade: float = 0.0
+    pontuacao_seo_palavras: float = 0.0
+    pontuacao_ctr: float = 0.0
+    pontuacao_redes_sociais: float = 0.0
+    pontuacao_permissao: float = 0.0
+    pontuacao_volume_busca: float = 0.0
+    pontuacao_concorrencia_cpc: float = 0.0
+    pontuacao_keyword: float = 0.0
+    pontuacao_seo_basico: float = 0.0
+    pontuacao_total: float = 0.0
+    nota_final: float = 0.0
+    feedback_preco_valor: list = field(default_factory=list)
+    descricao_sazonalidade: str = ""
+    descricao_ctr: str = ""
+    avg_cpc: float = 0.0
+    palavras_chave: list = field(default_factory=list)
+    total_palavras_chave: int = 0
+    # Posição do produto no formulário: as palavras-chave importadas além das editáveis
+    # não ficam no registro e são relidas do formulário (ou do payload do job) por ela
+    indice_formulario: int = 0
+    permissao_trafego_pago: bool = True
+    permissao_fundo_funil: bool = True
+    cpc_alertas: list = field(default_factory=list)
+    cpcs: str = ""
+    instagram_presente: str = "nao"
+    facebook_presente: str = "nao"
+    youtube_presente: str = "nao"
+    pontuado_em: float = 0.0
+    pagina_inacessivel: str = ""
+
+    def para_dict(self, casas_decimais=CASAS_DECIMAIS_PONTUACAO):
+        """
+        Converte para dicionário (templates e JSON), arredondando os números.
+        Com casas_decimais=None, mantém os valores exatos (usado para guardar o resultado).
+        """
+        dados = {nome: getattr(self, nome) for nome in CAMPOS_PRODUTO}
+        if casas_decimais is None:
+            return dados
+        for nome in CAMPOS_ARREDONDADOS_PRODUTO:
+            dados[nome] = round(dados[nome], casas_decimais)
+        # As palavras-chave editáveis também aparecem arredondadas (cópia: o registro não muda)
+        dados["palavras_chave"] = [
+            arredondar_valores(dict(palavra), casas_decimais) for palavra in self.palavras_chave
+        ]
+        return dados
+
+    @classmethod
+    def de_dict(cls, dados):
+        """
+        Reconstrói o registro a partir de para_dict (ignora chaves desconhecidas).
+        """
+        return cls(**{nome: valor for nome, valor in dados.items() if nome in CAMPOS_PRODUTO_CONJUNTO})
+
+
+CAMPOS_PRODUTO = tuple(campo.name for campo in fields(PontuacaoProduto))
+CAMPOS_PRODUTO_CONJUNTO = frozenset(CAMPOS_PRODUTO)
+CAMPOS_ARREDONDADOS_PRODUTO = tuple(
+    CRITERIOS_PONTUACAO_TOTAL + CAMPOS_DETALHES_SEO + ["pontuacao_total", "nota_final", "avg_cpc"]
+)
+
+# FIM REGISTRO DE PONTUAÇÃO DO PRODUTO
+
+
+
+
+# FUNÇÃO BASE DO CODIGO
+def processar_produto(index, nome_produto, url_produto, permissao_trafego_pago,
+                      permissao_fundo_funil, form_data, categoria_produto, tabela_ctr,
+                      pontuacao_redes_sociais, arquivos=None, ao_concluir_criterio=None,
+                      criterios_pagina=None, sazonalidade=None, pontuado_em=None):
+    """
+    Processa as informações de um produto, calculando pontuações e validando dados.
+    `arquivos` recebe os uploads (request.files) com o CSV/TSV de palavras-chave do produto.
+    `ao_concluir_criterio(criterio, pontuacao)` é chamado assim que cada critério termina.
+    `criterios_pagina` permite informar os critérios de página já calculados (sem nova coleta)
+    e `sazonalidade` a tupla (pontuação, descrição) já consultada; `pontuado_em` é o instante
+    dessa coleta (padrão: agora).
+    """
+    def concluir_criterio(criterio, pontuacao):
+        if ao_concluir_criterio:
+            ao_concluir_criterio(criterio, pontuacao)
+
+    palavras_chave = extrair_palavras_chave_produto(form_data, index, arquivos)
+    cpcs_lista = [palavra["cpc"] for palavra in palavras_chave if palavra["cpc"] > 0]
+
+    # Cálculo dos CPCs
+    cpcs_formatted = formatar_cpcs(cpcs_lista)
+    avg_cpc = sum(cpcs_lista) / len(cpcs_lista) if cpcs_lista else 0
+
+    # Critérios de página: uma única coleta por URL entre todos os workers (cache compartilhado)
+    if criterios_pagina is None:
+        criterios_pagina = obter_criterios_pagina(url_produto, nome_produto, categoria_produto)
+
+    # Calcular outros critérios
+    pontuacao_qualidade_pagina = criterios_pagina["qualidade_pagina"]
+    pontuacao_copywriting = criterios_pagina["copywriting"]
+    pontuacao_beneficios_ofertas = criterios_pagina["beneficios_ofertas"]
+    pontuacao_preco_valor_percebido, feedback_preco_valor = criterios_pagina["preco_valor_percebido"]
+    pontuacao_faixa_precos = criterios_pagina["faixa_precos"]
+    concluir_criterio("qualidade_pagina", pontuacao_qualidade_pagina)
+    concluir_criterio("copywriting", pontuacao_copywriting)
+    concluir_criterio("beneficios_ofertas", pontuacao_beneficios_ofertas)
+    concluir_criterio("preco_valor_percebido", pontuacao_preco_valor_percebido)
+    concluir_criterio("faixa_precos", pontuacao_faixa_precos)
+
+    pontuacao_sazonalidade, descricao_sazonalidade = sazonalidade or analisar_sazonalidade(nome_produto)
+    concluir_criterio("sazonalidade", pontuacao_sazonalidade)
+
+    # Calcular pontuação de SEO e palavras-chave (só recalcula se as palavras-chave ou permissões mudarem)
+    hash_palavras = hash_palavras_chave(palavras_chave)
+    pontuacao_seo_palavras, detalhes_seo = memoizar_criterio(
+        "seo_palavras",
+        (hash_palavras, permissao_trafego_pago, permissao_fundo_funil, nome_produto, categoria_produto,
+         criterios_pagina["seo_basico"]),
+        lambda: calcular_pontuacao_seo(
+            palavras_chave, permissao_trafego_pago, permissao_fundo_funil, nome_produto, url_produto,
+            categoria_produto, pontuacao_seo_basico=criterios_pagina["seo_basico"]
+        )
+    )
+    concluir_criterio("seo_palavras", pontuacao_seo_palavras)
+
+    # Validar categoria e calcular CTR ponderado
+    categoria_valida = validar_categoria(categoria_produto, tabela_ctr)
+    if not categoria_valida:
+        logging.error(f"Produto {index} ignorado: Categoria inválida.")
+        return None
+
+    if not palavras_chave:
+        logging.error("Nenhuma palavra-chave válida foi fornecida. O cálculo de CTR será ignorado.")
+        nota_ctr_ponderado = 0
+        descricao_ctr = "Nenhuma palavra-chave válida para análise de CTR."
+    else:
+        nota_ctr_ponderado = memoizar_criterio(
+            "ctr",
+            (categoria_valida, hash_palavras, nome_produto, permissao_fundo_funil, detalhes_seo['pontuacao_seo_basico']),
+            lambda: calcular_ctr_ponderado(
+                categoria=categoria_valida,
+                palavras_chave=palavras_chave,
+                nome_do_produto=nome_produto,
+                permissao_fundo_funil=permissao_fundo_funil,
+                pontuacao_seo_basico=detalhes_seo['pontuacao_seo_basico']
+            )
+        )
+        descricao_ctr = analisar_ctr(nota_ctr_ponderado)
+    concluir_criterio("ctr", nota_ctr_ponderado)
+    concluir_criterio("redes_sociais", pontuacao_redes_sociais)
+
+    # Monta o registro do produto (sem arredondar: isso fica para a serialização)
+    produto = PontuacaoProduto(
+        nome=nome_produto,
+        url=url_produto,
+        categoria=categoria_valida,
+        pontuacao_qualidade_pagina=pontuacao_qualidade_pagina,
+        pontuacao_copywriting=pontuacao_copywriting,
+        pontuacao_beneficios_ofertas=pontuacao_beneficios_ofertas,
+        pontuacao_preco_valor_percebido=pontuacao_preco_valor_percebido,
+        feedback_preco_valor=feedback_preco_valor,
+        pontuacao_faixa_precos=pontuacao_faixa_precos,
+        pontuacao_sazonalidade=pontuacao_sazonalidade,
+        descricao_sazonalidade=descricao_sazonalidade,
+        pontuacao_seo_palavras=pontuacao_seo_palavras,
+        pontuacao_permissao=detalhes_seo['pontuacao_permissao'],
+        pontuacao_volume_busca=detalhes_seo['pontuacao_volume_busca'],
+        pontuacao_concorrencia_cpc=detalhes_seo['pontuacao_concorrencia_cpc'],
+        pontuacao_keyword=detalhes_seo['pontuacao_keyword'],
+        pontuacao_seo_basico=detalhes_seo['pontuacao_seo_basico'],
+        pontuacao_ctr=nota_ctr_ponderado,
+        descricao_ctr=descricao_ctr,
+        avg_cpc=avg_cpc,
+        palavras_chave=palavras_chave[:LIMITE_PALAVRAS_CHAVE_EDITAVEIS],
+        total_palavras_chave=len(palavras_chave),
+        indice_formulario=index,
+        permissao_trafego_pago=permissao_trafego_pago,
+        permissao_fundo_funil=permissao_fundo_funil,
+        cpc_alertas=detalhes_seo.get('cpc_alertas', []),
+        cpcs=cpcs_formatted,
+        instagram_presente=form_data.get(f"instagram_presente_{index}", "nao"),
+        facebook_presente=form_data.get(f"facebook_presente_{index}", "nao"),
+        youtube_presente=form_data.get(f"youtube_postagem_{index}", "nao"),
+        pontuacao_redes_sociais=pontuacao_redes_sociais,
+        pontuado_em=pontuado_em or time.time(),
+        pagina_inacessivel=criterios_pagina.get("pagina_inacessivel", "")
+    )
+
+    # Calcular pontuação total corretamente
+    produto.pontuacao_total = calcular_pontuacao_total(produto)
+
+    # Calcula a nota final incluindo CTR
+    produto.nota_final = calcular_nota_final(produto, tabela_ctr)
+
+    logging.debug(f"Produto processado: {produto}")
+    return produto
+
+
+
+
+def processar_nicho(form_data, arquivos=None, ao_concluir_produto=None, ao_concluir_criterio=None):
+    """
+    Processa todos os produtos do formulário (até 5) e retorna {"nicho", "produtos"},
+    com os produtos (PontuacaoProduto) ordenados pela pontuação total.
+    `ao_concluir_produto(indice, nome, produto)` é chamado ao fim de cada produto e
+    `ao_concluir_criterio(indice, nome, criterio, pontuacao)` ao fim de cada critério.
+    """
+    nicho = form_data.get("nicho", "")
+    produtos = []
+
+    for i in range(1, 6):
+        nome_produto = form_data.get(f"nome_produto_{i}", "").strip()
+        if not nome_produto:
+            continue
+        print(f"Produto {i} - Nome: {nome_produto}")
+
+        url_produto = form_data.get(f"url_produto_{i}", "").strip()
+        categoria_produto = form_data.get(f"categoria_produto_{i}", "").strip()
+
+        # Calcular pontuação de Redes Sociais
+        pontuacao_redes = calcular_redes_sociais(form_data, i)
+
+        produto = None
+        if nome_produto and url_produto:
+            permissao_trafego_pago = form_data.get(f"permissao_trafego_pago_{i}", "true") == "true"
+            permissao_fundo_funil = form_data.get(f"permissao_fundo_funil_{i}", "true") == "true"
+            categoria_produto = form_data.get(f"categoria_produto_{i}", "").strip()
+
+            # Produto da lista de acompanhamento: usa a coleta agendada, sem esperar a rede
+            pre_pontuacao = pre_pontuacao_acompanhada(url_produto, nome_produto, categoria_produto) or {}
+
+            produto = processar_produto(
+                index=i,
+                nome_produto=nome_produto,
+                url_produto=url_produto,
+                permissao_trafego_pago=True,
+                permissao_fundo_funil=True,
+                form_data=form_data,
+                categoria_produto=categoria_produto,
+                tabela_ctr=tabela_ctr,  # Certifique-se de que 'tabela_ctr' está definido
+                pontuacao_redes_sociais=pontuacao_redes,  # Adicionado
+                arquivos=arquivos,
+                ao_concluir_criterio=(
+                    (lambda criterio, pontuacao, i=i, nome=nome_produto: ao_concluir_criterio(i, nome, criterio, pontuacao))
+                    if ao_concluir_criterio else None
+                ),
+                criterios_pagina=pre_pontuacao.get("criterios_pagina"),
+                sazonalidade=pre_pontuacao.get("sazonalidade"),
+                pontuado_em=pre_pontuacao.get("pontuado_em")
+            )
+
+
+            if produto:  # Certifique-se de adicionar apenas produtos válidos
+                produtos.append(produto)
+
+        if ao_concluir_produto:
+            ao_concluir_produto(i, nome_produto, produto)
+
+    # **Adicione aqui o filtro para remover produtos sem nome**
+    produtos = [produto for produto in produtos if produto.nome]
+
+    # Ordena os produtos com base na pontuação total antes de renderizar
+    # (o arredondamento fica para a serialização, em PontuacaoProduto.para_dict)
+    produtos = sorted(produtos, key=lambda x: x.pontuacao_total, reverse=True)
+    lote = gravar_no_catalogo(produtos, nicho)
+
+    return {"nicho": nicho, "produtos": produtos, "lote": lote}
+
+
+def palavras_chave_excedentes(form_data, index, arquivos=None):
+    """
+    Palavras-chave do produto além das editáveis, serializadas para o campo oculto do
+    formulário de reenvio. Vêm do formulário original (ou do payload do job).
+    """
+    arquivo = arquivos.get(f"arquivo_palavras_chave_{index}") if arquivos else None
+    if arquivo and arquivo.filename:
+        # O upload já foi lido na pontuação
+        arquivo.stream.seek(0)
+    return serializar_palavras_chave(
+        extrair_palavras_chave_produto(form_data, index, arquivos)[LIMITE_PALAVRAS_CHAVE_EDITAVEIS:]
+    )
+
+
+def renderizar_resultado_nicho(resultado, com_frases=False, form_data=None, arquivos=None):
+    """
+    Renderiza analisar.html para o resultado de processar_nicho.
+    Com `com_frases`, inclui as seções de frases (custo-benefício, pontuação total e conclusão).
+    `form_data`/`arquivos` são os campos da análise, de onde saem as palavras-chave importadas
+    que não cabem na lista editável.
+    """
+    # O template e as frases recebem dicionários já arredondados
+    produtos = [produto.para_dict() for produto in resultado["produtos"]]
+    for produto in produtos:
+        produto["palavras_chave_importadas"] = ""
+        if form_data is not None and produto["total_palavras_chave"] > len(produto["palavras_chave"]):
+            produto["palavras_chave_importadas"] = palavras_chave_excedentes(
+                form_data, produto["indice_formulario"], arquivos
+            )
+        produto["idade_pontuacao"] = descrever_idade_pontuacao(produto["pontuado_em"])
+        produto["pontuacao_desatualizada"] = bool(produto["pontuado_em"]) and (
+            time.time() - produto["pontuado_em"] > IDADE_PONTUACAO_DESATUALIZADA
+        )
+        produto["duplicatas"] = paginas_semelhantes(produto["url"]) if produto["url"] else []
+    frases = {}
+    if com_frases:
+        frases = {
+            "frases_custo_beneficio": gerar_frases_custo_beneficio(produtos),
+            "frases_pontuacao_total": gerar_frases_pontuacao_total(produtos),
+            "frases_conclusao": gerar_frases_conclusao(produtos)
+        }
+    return render_template(
+        "analisar.html",
+        nicho=resultado["nicho"],
+        produtos=produtos,
+        analise_id=resultado.get("lote"),
+        rotulos_criterios=ROTULOS_CRITERIOS,
+        **frases
+    )
+
+
+# INÍCIO ANÁLISE ASSÍNCRONA
+# As rotas / e /analisar disparam todas as esperas de rede do nicho (páginas e Trends) ao
+# mesmo tempo com asyncio.gather, cada uma com seu tempo limite, e depois pontuam os produtos
+# em paralelo. As bibliotecas de rede do projeto (requests, pytrends) são síncronas, então
+# cada chamada roda num executor de threads compartilhado; a interpretação do HTML continua
+# no pool de processos. Views async no Flask exigem o pacote asgiref.
+import asyncio
+import contextvars
+import functools
+
+TIMEOUT_COLETA_PAGINA = float(os.environ.get("TIMEOUT_COLETA_PAGINA", 30))
+TIMEOUT_TRENDS = float(os.environ.get("TIMEOUT_TRENDS", 30))
+TIMEOUT_PONTUACAO_PRODUTO = float(os.environ.get("TIMEOUT_PONTUACAO_PRODUTO", 60))
+THREADS_ANALISE_ASSINCRONA = int(os.environ.get("THREADS_ANALISE_ASSINCRONA", 32))
+
+# Compartilhado entre requisições: cada view async roda num event loop próprio
+_executor_analise_assincrona = concurrent.futures.ThreadPoolExecutor(
+    max_workers=THREADS_ANALISE_ASSINCRONA, thread_name_prefix="analise-async"
+)
+# O prazo do wait_for não interrompe a chamada bloqueante: ela segue ocupando a thread até
+# a rede responder. Chamadas com prazo usam no máximo essas vagas do executor, para que
+# esperas presas não tomem todas as threads das chamadas rápidas (cache, catálogo).
+VAGAS_CHAMADAS_COM_PRAZO = max(1, THREADS_ANALISE_ASSINCRONA * 3 // 4)
+INTERVALO_ESPERA_VAGA = 0.05
+_vagas_chamadas_com_prazo = threading.BoundedSemaphore(VAGAS_CHAMADAS_COM_PRAZO)
+
+
+def executar_liberando_vaga(chamada):
+    """
+    Roda a chamada na thread do executor e só então devolve a vaga, mesmo se o prazo já passou.
+    """
+    try:
+        return chamada()
+    finally:
+        _vagas_chamadas_com_prazo.release()
+
+
+async def executar_em_thread(funcao, *args, timeout=None, **kwargs):
+    """
+    Executa uma função bloqueante no executor compartilhado (preservando o contexto
+    da requisição) e aguarda no máximo `timeout` segundos. Com prazo, a chamada espera
+    uma vaga dentro do mesmo prazo; se nenhuma abrir, levanta asyncio.TimeoutError sem
+    enviar trabalho ao executor, e quem chamou devolve o resultado degradado.
+    """
+    loop = asyncio.get_running_loop()
+    contexto = contextvars.copy_context()
+    chamada = functools.partial(contexto.run, funcao, *args, **kwargs)
+    if timeout is not None:
+        prazo = loop.time() + timeout
+        while not _vagas_chamadas_com_prazo.acquire(blocking=False):
+            if loop.time() >= prazo:
+                logging.error(f"[ERRO] Executor de análise sem vagas: {funcao.__name__} não foi executada.")
+                raise asyncio.TimeoutError
+            await asyncio.sleep(INTERVALO_ESPERA_VAGA)
+        timeout = max(0, prazo - loop.time())
+        chamada = functools.partial(executar_liberando_vaga, chamada)
+    futuro = loop.run_in_executor(_executor_analise_assincrona, chamada)
+    return await asyncio.wait_for(futuro, timeout)
+
+
+def criterios_pagina_indisponivel(motivo):
+    """
+    Critérios de página zerados, como quando a página não carrega; o motivo aparece no resultado.
+    """
+    return {
+        "qualidade_pagina": 0,
+        "copywriting": 0,
+        "beneficios_ofertas": 0,
+        "preco_valor_percebido": (0, [motivo]),
+        "faixa_precos": 0,
+        "seo_basico": 0,
+        "pagina_inacessivel": motivo,
+    }
+
+
+async def coletar_entradas_produto(produto):
+    """
+    Dispara juntas a coleta da página e a consulta de sazonalidade do produto.
+    Retorna (criterios_pagina, sazonalidade, pontuado_em); produtos acompanhados com
+    pré-pontuação válida voltam direto da lista de acompanhamento, sem rede.
+    """
+    pre_pontuacao = await executar_em_thread(
+        pre_pontuacao_acompanhada, produto["url"], produto["nome"], produto["categoria"]
+    )
+    if pre_pontuacao:
+        return pre_pontuacao["criterios_pagina"], pre_pontuacao["sazonalidade"], pre_pontuacao["pontuado_em"]
+
+    async def pagina():
+        try:
+            return await executar_em_thread(
+                obter_criterios_pagina, produto["url"], produto["nome"], produto["categoria"],
+                timeout=TIMEOUT_COLETA_PAGINA
+            )
+        except asyncio.TimeoutError:
+            logging.error(f"[ERRO] Tempo esgotado ao coletar a página {produto['url']}.")
+            return criterios_pagina_indisponivel("Tempo esgotado ao acessar a página.")
+
+    async def sazonalidade():
+        try:
+            return await executar_em_thread(analisar_sazonalidade, produto["nome"], timeout=TIMEOUT_TRENDS)
+        except asyncio.TimeoutError:
+            logging.error(f"[ERRO] Tempo esgotado ao consultar a sazonalidade de {produto['nome']}.")
+            return 0, "Não foi possível consultar o Google Trends a tempo."
+
+    return (*await asyncio.gather(pagina(), sazonalidade()), None)
+
+
+async def processar_nicho_async(form_data, arquivos=None, exigir_url=True):
+    """
+    Versão assíncrona de processar_nicho: primeiro todas as esperas de rede, depois a
+    pontuação de cada produto, ambas em paralelo. Sem `exigir_url`, produtos sem URL
+    também são pontuados (comportamento da rota /analisar).
+    """
+    nicho = form_data.get("nicho", "")
+    entradas = []
+    for i in range(1, 6):
+        nome_produto = form_data.get(f"nome_produto_{i}", "").strip()
+        url_produto = form_data.get(f"url_produto_{i}", "").strip()
+        if not nome_produto or (exigir_url and not url_produto):
+            continue
+        print(f"Produto {i} - Nome: {nome_produto}")
+        entradas.append({
+            "indice": i,
+            "nome": nome_produto,
+            "url": url_produto,
+            "categoria": form_data.get(f"categoria_produto_{i}", "").strip()
+        })
+
+    coletas = await asyncio.gather(*(coletar_entradas_produto(produto) for produto in entradas))
+
+    async def pontuar(produto, criterios_pagina, sazonalidade, pontuado_em):
+        try:
+            return await executar_em_thread(
+                processar_produto,
+                index=produto["indice"],
+                nome_produto=produto["nome"],
+                url_produto=produto["url"],
+                permissao_trafego_pago=True,
+                permissao_fundo_funil=True,
+                form_data=form_data,
+                categoria_produto=produto["categoria"],
+                tabela_ctr=tabela_ctr,
+                pontuacao_redes_sociais=calcular_redes_sociais(form_data, produto["indice"]),
+                arquivos=arquivos,
+                criterios_pagina=criterios_pagina,
+                sazonalidade=sazonalidade,
+                pontuado_em=pontuado_em,
+                timeout=TIMEOUT_PONTUACAO_PRODUTO
+            )
+        except asyncio.TimeoutError:
+            logging.error(f"[ERRO] Tempo esgotado ao pontuar o produto {produto['indice']} ({produto['nome']}).")
+            return None
+
+    produtos = await asyncio.gather(*(
+        pontuar(produto, *coleta) for produto, coleta in zip(entradas, coletas)
+    ))
+
+    produtos = [produto for produto in produtos if produto and produto.nome]
+    produtos = sorted(produtos, key=lambda x: x.pontuacao_total, reverse=True)
+    lote = await executar_em_thread(gravar_no_catalogo, produtos, nicho)
+    return {"nicho": nicho, "produtos": produtos, "lote": lote}
+
+# FIM ANÁLISE ASSÍNCRONA
+
+
+@app.route("/", methods=["GET", "POST"])
+async def home():
+    if request.method == "POST":
+        # Renderiza a página de resultados com os produtos processados
+        return renderizar_resultado_nicho(
+            await processar_nicho_async(request.form, request.files), form_data=request.form, arquivos=request.files
+        )
+
+    # Exibe a página inicial se o método for GET
+    return render_template("index.html")
+
+
+# INÍCIO CLASSIFICAÇÃO DE INTENÇÃO EM LOTE
+# Valores aceitos para campos booleanos vindos de JSON ou CSV (mesma regra de pontuar_catalogo.py)
+VALORES_VERDADEIROS = ("1", "true", "sim", "yes", "s", "y")
+VALORES_FALSOS = ("0", "false", "nao", "não", "no", "n", "")
+
+
+def ler_booleano(valor, nome, padrao=True):
+    """
+    Converte um campo booleano de JSON: aceita true/false, 1/0 e sim/não (texto).
+    Levanta ValueError para qualquer outro valor, em vez de tratar "false" como verdadeiro.
+    """
+    if valor is None:
+        return padrao
+    if isinstance(valor, bool):
+        return valor
+    if isinstance(valor, int) and valor in (0, 1):
+        return bool(valor)
+    if isinstance(valor, str):
+        texto = valor.strip().lower()
+        if texto in VALORES_VERDADEIROS:
+            return True
+        if texto in VALORES_FALSOS:
+            return False
+    raise ValueError(f"'{nome}' deve ser booleano (true/false).")
+
+
+@app.route("/classificar_intencao", methods=["POST"])
+def classificar_intencao_lote():
+    """
+    Classifica a intenção de uma lista de palavras-chave (textos ou objetos com "palavra").
+    Aceita "nome_produto" e "permissao_fundo_funil" para a regra de fundo de funil.
+    """
+    dados = request.get_json(silent=True) or {}
+    palavras_chave = dados.get("palavras_chave")
+    if not isinstance(palavras_chave, list):
+        return jsonify({"erro": "Envie 'palavras_chave' como uma lista."}), 400
+
+    try:
+        permissao_fundo_funil = ler_booleano(dados.get("permissao_fundo_funil"), "permissao_fundo_funil")
+    except ValueError as e:
+        return jsonify({"erro": str(e)}), 400
+
+    termos = [
+        palavra.get("palavra", "") if isinstance(palavra, dict) else str(palavra)
+        for palavra in palavras_chave
+    ]
+    intencoes, pesos = classificar_intencoes(termos, dados.get("nome_produto"), permissao_fundo_funil)
+
+    resumo = {}
+    for intencao in intencoes:
+        resumo[intencao] = resumo.get(intencao, 0) + 1
+
+    return jsonify({
+        "total": len(termos),
+        "resumo": resumo,
+        "palavras_chave": [
+            {"palavra": termo, "intencao": intencao, "peso": peso}
+            for termo, intencao, peso in zip(termos, intencoes, pesos.tolist())
+        ]
+    })
+
+# FIM CLASSIFICAÇÃO DE INTENÇÃO EM LOTE
+
+
+# INÍCIO SIMULAÇÃO DE PESOS
+# Reordena um nicho já analisado com outros pesos por critério usando as pontuações
+# guardadas, sem baixar as páginas de novo. Os pesos são multiplicadores sobre cada
+# critério: 1.0 em todos reproduz a pontuação total e a nota final originais.
+# As pontuações vêm do catálogo (o id da análise é o lote gravado), então qualquer
+# worker responde /reponderar, inclusive para resultados de jobs.
+import uuid
+
+LIMITE_VETORES_VARREDURA = 20000
+
+ROTULOS_CRITERIOS = {
+    "pontuacao_qualidade_pagina": "Qualidade da Página",
+    "pontuacao_copywriting": "Copywriting",
+    "pontuacao_beneficios_ofertas": "Benefícios e Ofertas",
+    "pontuacao_preco_valor_percebido": "Preço e Valor Percebido",
+    "pontuacao_faixa_precos": "Faixa de Preço",
+    "pontuacao_sazonalidade": "Sazonalidade",
+    "pontuacao_seo_palavras": "SEO e Palavras-Chave",
+    "pontuacao_ctr": "CTR",
+    "pontuacao_redes_sociais": "Redes Sociais"
+}
+
+_PESOS_NOTA_CRITERIOS = np.array([PESOS_NOTA_FINAL[criterio] for criterio in CRITERIOS_PONTUACAO_TOTAL])
+
+def obter_analise(analise_id):
+    """
+    Lê do catálogo as pontuações dos produtos de uma análise, na ordem em que foram gravados.
+    Retorna None se o lote não existir.
+    """
+    if not analise_id or not isinstance(analise_id, str):
+        return None
+    colunas = CRITERIOS_PONTUACAO_TOTAL + CAMPOS_DETALHES_SEO
+    linhas = conexao_catalogo().execute(
+        f"SELECT nicho, nome, {', '.join(colunas)} FROM produtos WHERE lote = ? ORDER BY id",
+        (analise_id,)
+    ).fetchall()
+    if not linhas:
+        return None
+
+    valores = np.array([linha[2:] for linha in linhas], dtype=float).reshape(len(linhas), len(colunas))
+    # Os detalhes de SEO também entram na nota final
+    pesos_extras = np.array([PESOS_NOTA_FINAL.get(campo, 1.0) for campo in CAMPOS_DETALHES_SEO])
+    return {
+        "nicho": linhas[0][0],
+        "nomes": [linha[1] for linha in linhas],
+        "criterios": valores[:, :len(CRITERIOS_PONTUACAO_TOTAL)],
+        "extras": valores[:, len(CRITERIOS_PONTUACAO_TOTAL):] @ pesos_extras
+    }
+
+
+def vetor_pesos(pesos):
+    """
+    Converte {critério: multiplicador} em vetor na ordem de CRITERIOS_PONTUACAO_TOTAL.
+    Critérios ausentes ficam com 1.0.
+    """
+    desconhecidos = set(pesos) - set(CRITERIOS_PONTUACAO_TOTAL)
+    if desconhecidos:
+        raise ValueError(f"Critério(s) desconhecido(s): {', '.join(sorted(desconhecidos))}")
+    vetor = np.array([float(pesos.get(criterio, 1.0)) for criterio in CRITERIOS_PONTUACAO_TOTAL])
+    if not np.all(np.isfinite(vetor)) or np.any(vetor < 0):
+        raise ValueError("Os pesos devem ser números não negativos.")
+    return vetor
+
+
+def reponderar_analise(analise, multiplicadores):
+    """
+    Recalcula pontuação total e nota final para cada vetor de pesos (linhas de `multiplicadores`).
+    Retorna (totais, notas, posicoes), todas com forma (produtos x vetores).
+    """
+    criterios = analise["criterios"]
+    totais_brutos = criterios @ multiplicadores.T
+    notas_brutas = criterios @ (multiplicadores * _PESOS_NOTA_CRITERIOS).T + totais_brutos + analise["extras"][:, None]
+    totais = np.round(totais_brutos, 2)
+    notas = np.round(np.clip(notas_brutas / 10, 0, 10), 2)  # mesma escala de normalizar_valor(x, 0, 100)
+
+    # Posição de cada produto (1 = primeiro) ordenando pela pontuação total, como na análise
+    ordem = np.argsort(-totais_brutos, axis=0, kind="stable")
+    posicoes = np.empty_like(ordem)
+    np.put_along_axis(posicoes, ordem, np.arange(1, len(criterios) + 1)[:, None], axis=0)
+    return totais, notas, posicoes
+
+
+@app.route("/reponderar", methods=["POST"])
+def reponderar():
+    """
+    Reordena uma análise guardada com novos pesos ("pesos") e, opcionalmente, roda uma
+    varredura de sensibilidade sobre vários vetores ("varredura" e/ou "amostras").
+    """
+    dados = request.get_json(silent=True) or {}
+    analise = obter_analise(dados.get("analise_id"))
+    if not analise:
+        return jsonify({"erro": "Análise não encontrada ou expirada. Refaça a análise."}), 404
+
+    try:
+        pesos = vetor_pesos(dados.get("pesos") or {})
+        totais, notas, posicoes = reponderar_analise(analise, pesos[None, :])
+        resposta = {
+            "analise_id": dados["analise_id"],
+            "pesos": dict(zip(CRITERIOS_PONTUACAO_TOTAL, pesos.tolist())),
+            "produtos": sorted([
+                {
+                    "nome": nome,
+                    "pontuacao_total": float(totais[i, 0]),
+                    "nota_final": float(notas[i, 0]),
+                    "posicao": int(posicoes[i, 0])
+                }
+                for i, nome in enumerate(analise["nomes"])
+            ], key=lambda produto: produto["posicao"])
+        }
+
+        # Varredura: vetores informados e/ou sorteados em torno dos pesos atuais
+        vetores = [vetor_pesos(vetor) for vetor in dados.get("varredura") or []]
+        amostras = int(dados.get("amostras") or 0)
+        if len(vetores) + amostras > LIMITE_VETORES_VARREDURA:
+            raise ValueError(f"A varredura aceita no máximo {LIMITE_VETORES_VARREDURA} vetores.")
+        if amostras > 0:
+            variacao = float(dados.get("variacao", 0.5))
+            gerador = np.random.default_rng(dados.get("semente"))
+            vetores.extend(pesos * gerador.uniform(max(0.0, 1 - variacao), 1 + variacao, (amostras, len(pesos))))
+
+        if vetores:
+            totais, notas, posicoes = reponderar_analise(analise, np.vstack(vetores))
+            resposta["varredura"] = {
+                "vetores": len(vetores),
+                "produtos": [
+                    {
+                        "nome": nome,
+                        "frequencia_primeiro_lugar": round(float(np.mean(posicoes[i] == 1)), 4),
+                        "posicao_media": round(float(np.mean(posicoes[i])), 2),
+                        "posicao_minima": int(posicoes[i].min()),
+                        "posicao_maxima": int(posicoes[i].max()),
+                        "nota_final_media": round(float(np.mean(notas[i])), 2)
+                    }
+                    for i, nome in enumerate(analise["nomes"])
+                ]
+            }
+            if dados.get("varredura"):
+                # Ranking de cada vetor informado explicitamente
+                resposta["varredura"]["rankings"] = [
+                    [analise["nomes"][i] for i in np.argsort(posicoes[:, j])]
+                    for j in range(len(dados["varredura"]))
+                ]
+    except (TypeError, ValueError, AttributeError) as e:
+        return jsonify({"erro": f"Pesos inválidos: {e}"}), 400
+
+    return jsonify(resposta)
+
+# FIM SIMULAÇÃO DE PESOS
+
+
+# INÍCIO FILA DE ANÁLISES (JOBS)
+# Análises longas rodam fora da requisição: o formulário vira um job persistente no
+# SQLite, workers em threads processam os produtos e o cliente acompanha o progresso
+# por /jobs/<id> até o resultado ficar disponível em /jobs/<id>/resultado.
+from flask import Response, stream_with_context
+from werkzeug.datastructures import MultiDict
+
+CAMINHO_FILA_ANALISES = os.environ.get(
+    "FILA_ANALISES_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "fila_analises.sqlite3")
+)
+WORKERS_FILA_ANALISES = int(os.environ.get("WORKERS_FILA_ANALISES", 2))
+# Desligado em scripts que só importam o módulo (ex.: pontuar_catalogo.py) e nos testes
+FILA_ANALISES_ATIVA = os.environ.get("FILA_ANALISES_ATIVA", "1") == "1"
+INTERVALO_CONSULTA_FILA = 1.0
+# Job em execução sem sinal de vida por esse tempo volta para a fila (worker reiniciado ou morto)
+TEMPO_JOB_ABANDONADO = 300
+MAXIMO_TENTATIVAS_JOB = 3
+# Streaming dos eventos (SSE): intervalo de consulta, ping para proxies e duração máxima da conexão.
+# Cada conexão ocupa um worker síncrono do gunicorn, então ela fecha antes do timeout padrão
+# dele (30 s) e o navegador reconecta sozinho, continuando pelo Last-Event-ID.
+INTERVALO_CONSULTA_SSE = 0.3
+INTERVALO_PING_SSE = 15
+DURACAO_MAXIMA_SSE = int(os.environ.get("DURACAO_MAXIMA_SSE", 25))
+RECONEXAO_SSE_MS = 1000
+
+ESQUEMA_FILA_ANALISES = (
+    "CREATE TABLE IF NOT EXISTS jobs ("
+    "id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT NOT NULL, resultado TEXT, erro TEXT, "
+    "total_produtos INTEGER NOT NULL DEFAULT 0, produtos_concluidos INTEGER NOT NULL DEFAULT 0, "
+    "tentativas INTEGER NOT NULL DEFAULT 0, dono TEXT, "
+    "criado_em REAL NOT NULL, atualizado_em REAL NOT NULL, concluido_em REAL)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, criado_em)",
+    "CREATE TABLE IF NOT EXISTS job_eventos ("
+    "id INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, tipo TEXT NOT NULL, "
+    "dados TEXT NOT NULL, criado_em REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_job_eventos_job ON job_eventos (job_id, id)",
+)
+
+_sinal_fila = threading.Event()
+_trava_workers_fila = threading.Lock()
+_workers_fila = {"pid": None, "threads": []}
+
+
+def conexao_fila():
+    return conexao_sqlite(CAMINHO_FILA_ANALISES, ESQUEMA_FILA_ANALISES)
+
+
+def registrar_evento_job(job_id, tipo, dados=None):
+    """
+    Registra um evento de progresso do job (também serve de sinal de vida do worker).
+    """
+    agora = time.time()
+    with transacao_imediata(conexao_fila()) as conexao:
+        conexao.execute(
+            "INSERT INTO job_eventos (job_id, tipo, dados, criado_em) VALUES (?, ?, ?, ?)",
+            (job_id, tipo, json.dumps(dados or {}), agora)
+        )
+        conexao.execute("UPDATE jobs SET atualizado_em = ? WHERE id = ?", (agora, job_id))
+
+
+def enfileirar_analise(form_data, arquivos=None):
+    """
+    Cria o job com os campos do formulário. Arquivos de palavras-chave são lidos aqui,
+    já que o upload não sobrevive à requisição, e seguem como campo de palavras importadas.
+    """
+    campos = MultiDict(form_data)
+    for i in range(1, 6):
+        arquivo = arquivos.get(f"arquivo_palavras_chave_{i}") if arquivos else None
+        if arquivo and arquivo.filename:
+            campos.setlist(
+                f"palavras_chave_importadas_{i}",
+                [serializar_palavras_chave(ler_palavras_chave_arquivo(arquivo.stream))]
+            )
+
+    total_produtos = sum(1 for i in range(1, 6) if campos.get(f"nome_produto_{i}", "").strip())
+    job_id = uuid.uuid4().hex
+    agora = time.time()
+    with transacao_imediata(conexao_fila()) as conexao:
+        conexao.execute(
+            "INSERT INTO jobs (id, status, payload, total_produtos, criado_em, atualizado_em) "
+            "VALUES (?, 'pendente', ?, ?, ?, ?)",
+            (job_id, json.dumps(list(campos.items(multi=True))), total_produtos, agora, agora)
+        )
+    registrar_evento_job(job_id, "criado", {"total_produtos": total_produtos})
+    _sinal_fila.set()
+    return job_id
+
+
+def reservar_proximo_job(dono):
+    """
+    Reserva o job pendente mais antigo. Antes, devolve à fila jobs abandonados por
+    workers que pararam de dar sinal de vida (ou os marca com erro após várias tentativas).
+    """
+    agora = time.time()
+    with transacao_imediata(conexao_fila()) as conexao:
+        conexao.execute(
+            "UPDATE jobs SET status = 'erro', erro = 'Job abandonado após várias tentativas.', concluido_em = ? "
+            "WHERE status = 'executando' AND atualizado_em < ? AND tentativas >= ?",
+            (agora, agora - TEMPO_JOB_ABANDONADO, MAXIMO_TENTATIVAS_JOB)
+        )
+        abandonados = [
+            linha[0] for linha in conexao.execute(
+                "SELECT id FROM jobs WHERE status = 'executando' AND atualizado_em < ?",
+                (agora - TEMPO_JOB_ABANDONADO,)
+            )
+        ]
+        for job_id in abandonados:
+            # A nova tentativa refaz todos os produtos: descarta os eventos da anterior
+            # para o progresso não aparecer duplicado e avisa quem está acompanhando.
+            conexao.execute("DELETE FROM job_eventos WHERE job_id = ?", (job_id,))
+            conexao.execute(
+                "INSERT INTO job_eventos (job_id, tipo, dados, criado_em) VALUES (?, 'reiniciado', '{}', ?)",
+                (job_id, agora)
+            )
+            conexao.execute(
+                "UPDATE jobs SET status = 'pendente', dono = NULL, produtos_concluidos = 0 WHERE id = ?",
+                (job_id,)
+            )
+        linha = conexao.execute(
+            "SELECT id, payload FROM jobs WHERE status = 'pendente' ORDER BY criado_em LIMIT 1"
+        ).fetchone()
+        if not linha:
+            return None
+        conexao.execute(
+            "UPDATE jobs SET status = 'executando', dono = ?, tentativas = tentativas + 1, atualizado_em = ? "
+            "WHERE id = ?",
+            (dono, agora, linha[0])
+        )
+    return linha[0], json.loads(linha[1])
+
+
+def executar_job(job_id, payload):
+    """
+    Processa o nicho do job, registrando o progresso por produto e o resultado final.
+    """
+    registrar_evento_job(job_id, "iniciado")
+
+    def ao_concluir_produto(indice, nome, produto):
+        conexao_fila().execute(
+            "UPDATE jobs SET produtos_concluidos = produtos_concluidos + 1 WHERE id = ?", (job_id,)
+        )
+        registrar_evento_job(job_id, "produto_concluido", {
+            "indice": indice,
+            "nome": nome,
+            "valido": produto is not None,
+            "pontuacao_total": round(produto.pontuacao_total, CASAS_DECIMAIS_PONTUACAO) if produto else None
+        })
+
+    def ao_concluir_criterio(indice, nome, criterio, pontuacao):
+        registrar_evento_job(job_id, "criterio_concluido", {
+            "indice": indice,
+            "nome": nome,
+            "criterio": criterio,
+            "pontuacao": round(float(pontuacao), 2)
+        })
+
+    try:
+        resultado = processar_nicho(
+            MultiDict(payload),
+            ao_concluir_produto=ao_concluir_produto,
+            ao_concluir_criterio=ao_concluir_criterio
+        )
+    except Exception as e:
+        logging.error(f"[ERRO] Falha ao processar o job {job_id}: {e}")
+        conexao_fila().execute(
+            "UPDATE jobs SET status = 'erro', erro = ?, concluido_em = ?, atualizado_em = ? WHERE id = ?",
+            (str(e), time.time(), time.time(), job_id)
+        )
+        registrar_evento_job(job_id, "erro", {"mensagem": str(e)})
+        return
+
+    conexao_fila().execute(
+        "UPDATE jobs SET status = 'concluido', resultado = ?, concluido_em = ?, atualizado_em = ? WHERE id = ?",
+        (json.dumps({
+            "nicho": resultado["nicho"],
+            "produtos": [produto.para_dict(casas_decimais=None) for produto in resultado["produtos"]],
+            "lote": resultado["lote"]
+        }), time.time(), time.time(), job_id)
+    )
+    registrar_evento_job(job_id, "concluido", {"produtos": len(resultado["produtos"])})
+
+
+def loop_worker_fila():
+    dono = f"{os.getpid()}:{threading.get_ident()}"
+    while True:
+        try:
+            job = reservar_proximo_job(dono)
+            if not job:
+                _sinal_fila.wait(INTERVALO_CONSULTA_FILA)
+                _sinal_fila.clear()
+                continue
+            executar_job(*job)
+        except Exception as e:
+            logging.error(f"[ERRO] Worker da fila de análises: {e}")
+            time.sleep(INTERVALO_CONSULTA_FILA)
+
+
+def iniciar_workers_fila():
+    """
+    Inicia (uma vez por processo) as threads que consomem a fila de análises.
+    Processos filhos do pool de critérios não consomem a fila.
+    """
+    if not FILA_ANALISES_ATIVA or multiprocessing.parent_process() is not None:
+        return
+    with _trava_workers_fila:
+        if _workers_fila["pid"] == os.getpid():
+            return
+        _workers_fila["pid"] = os.getpid()
+        _workers_fila["threads"] = [
+            threading.Thread(target=loop_worker_fila, name=f"fila-analises-{i}", daemon=True)
+            for i in range(WORKERS_FILA_ANALISES)
+        ]
+        for thread in _workers_fila["threads"]:
+            thread.start()
+
+
+def status_job(job_id):
+    """
+    Retorna o estado do job e seus eventos de progresso, ou None se não existir.
+    """
+    conexao = conexao_fila()
+    linha = conexao.execute(
+        "SELECT status, erro, total_produtos, produtos_concluidos, criado_em, concluido_em FROM jobs WHERE id = ?",
+        (job_id,)
+    ).fetchone()
+    if not linha:
+        return None
+    eventos = conexao.execute(
+        "SELECT tipo, dados, criado_em FROM job_eventos WHERE job_id = ? ORDER BY id", (job_id,)
+    ).fetchall()
+    return {
+        "job_id": job_id,
+        "status": linha[0],
+        "erro": linha[1],
+        "total_produtos": linha[2],
+        "produtos_concluidos": linha[3],
+        "criado_em": linha[4],
+        "concluido_em": linha[5],
+        "eventos": [{"tipo": tipo, "dados": json.loads(dados), "criado_em": criado_em} for tipo, dados, criado_em in eventos]
+    }
+
+
+# Os workers sobem na importação do módulo (ver o fim do arquivo); o gancho cobre o
+# processo filho de um fork feito depois da importação (ex.: gunicorn --preload),
+# onde as threads não existem e o pid registrado é o do pai.
+@app.before_request
+def garantir_workers_fila():
+    iniciar_workers_fila()
+
+
+@app.route("/jobs", methods=["POST"])
+def criar_job():
+    """
+    Enfileira a análise do formulário e responde na hora com o id do job.
+    """
+    try:
+        job_id = enfileirar_analise(request.form, request.files)
+    except (ValueError, pd.errors.ParserError, UnicodeError) as e:
+        return jsonify({"erro": f"Arquivo de palavras-chave inválido: {e}"}), 400
+    return jsonify({
+        "job_id": job_id,
+        "status_url": url_for("consultar_job", job_id=job_id),
+        "eventos_url": url_for("eventos_job", job_id=job_id),
+        "acompanhar_url": url_for("acompanhar_job", job_id=job_id),
+        "resultado_url": url_for("resultado_job", job_id=job_id)
+    }), 202
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def consultar_job(job_id):
+    status = status_job(job_id)
+    if not status:
+        return jsonify({"erro": "Job não encontrado."}), 404
+    return jsonify(status)
+
+
+@app.route("/jobs/<job_id>/resultado", methods=["GET"])
+def resultado_job(job_id):
+    linha = conexao_fila().execute(
+        "SELECT status, resultado, erro, payload FROM jobs WHERE id = ?", (job_id,)
+    ).fetchone()
+    if not linha:
+        return render_template("erro.html", mensagem="Análise não encontrada."), 404
+    status, resultado, erro, payload = linha
+    if status == "erro":
+        return render_template("erro.html", mensagem=f"A análise falhou: {erro}"), 500
+    if status != "concluido":
+        return jsonify(status_job(job_id)), 202
+    resultado = json.loads(resultado)
+    resultado["produtos"] = [PontuacaoProduto.de_dict(produto) for produto in resultado["produtos"]]
+    # O payload guarda as palavras-chave importadas (os uploads já viraram texto ao enfileirar)
+    return renderizar_resultado_nicho(resultado, com_frases=True, form_data=MultiDict(json.loads(payload)))
+
+
+@app.route("/jobs/<job_id>/acompanhar", methods=["GET"])
+def acompanhar_job(job_id):
+    """
+    Página de resultados em modo progressivo: as pontuações chegam por SSE e,
+    ao final, a página completa (ranking e frases) é carregada.
+    """
+    status = status_job(job_id)
+    if not status:
+        return render_template("erro.html", mensagem="Análise não encontrada."), 404
+    if status["status"] == "concluido":
+        return redirect(url_for("resultado_job", job_id=job_id))
+    return render_template(
+        "analisar.html",
+        nicho="",
+        produtos=[],
+        job_id=job_id,
+        rotulos_criterios=ROTULOS_CRITERIOS
+    )
+
+
+@app.route("/jobs/<job_id>/eventos", methods=["GET"])
+def eventos_job(job_id):
+    """
+    Transmite os eventos do job por Server-Sent Events até o job terminar ou a conexão
+    atingir DURACAO_MAXIMA_SSE. Reconexões continuam a partir do cabeçalho Last-Event-ID.
+    """
+    if not status_job(job_id):
+        return jsonify({"erro": "Job não encontrado."}), 404
+    try:
+        ultimo_id = int(request.headers.get("Last-Event-ID") or request.args.get("desde") or 0)
+    except ValueError:
+        # Cabeçalho ou parâmetro malformado: transmite desde o início
+        ultimo_id = 0
+
+    def transmitir(ultimo_id):
+        # Intervalo de reconexão do EventSource quando a conexão fecha no prazo
+        yield f"retry: {RECONEXAO_SSE_MS}\n\n"
+        ultimo_envio = time.time()
+        prazo = time.time() + DURACAO_MAXIMA_SSE
+        while time.time() < prazo:
+            eventos = conexao_fila().execute(
+                "SELECT id, tipo, dados FROM job_eventos WHERE job_id = ? AND id > ? ORDER BY id",
+                (job_id, ultimo_id)
+            ).fetchall()
+            for evento_id, tipo, dados in eventos:
+                ultimo_id = evento_id
+                yield f"id: {evento_id}\nevent: {tipo}\ndata: {dados}\n\n"
+                if tipo in ("concluido", "erro"):
+                    return
+            if eventos:
+                ultimo_envio = time.time()
+            elif time.time() - ultimo_envio > INTERVALO_PING_SSE:
+                # Comentário SSE para manter a conexão aberta em proxies
+                ultimo_envio = time.time()
+                yield ": ping\n\n"
+            time.sleep(INTERVALO_CONSULTA_SSE)
+
+    return Response(
+        stream_with_context(transmitir(ultimo_id)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# FIM FILA DE ANÁLISES (JOBS)
+
+
+# INÍCIO PONTUAÇÃO EM LOTE (NDJSON)
+# Pontua catálogos inteiros: recebe uma lista JSON de produtos e devolve uma linha
+# NDJSON por produto assim que ele termina, com concorrência limitada.
+CONCORRENCIA_LOTE = int(os.environ.get("CONCORRENCIA_LOTE", 8))
+LIMITE_PRODUTOS_LOTE = int(os.environ.get("LIMITE_PRODUTOS_LOTE", 1000))
+CAMPOS_REDES_SOCIAIS = (
+    "instagram_presente", "facebook_presente", "youtube_presente",
+    "instagram_postagem", "facebook_postagem", "youtube_postagem"
+)
+# Campos de entrada que não voltam na resposta
+CAMPOS_OMITIDOS_LOTE = ("palavras_chave", "indice_formulario")
+
+
+def formulario_de_produto_json(produto, indice=1):
+    """
+    Converte um produto em JSON para os campos do formulário esperados por processar_produto.
+    Palavras-chave: lista de {"palavra", "volume", "cpc"}; redes sociais: booleanos e "engajamento".
+    """
+    formulario = MultiDict({
+        f"nome_produto_{indice}": str(produto.get("nome") or "").strip(),
+        f"url_produto_{indice}": str(produto.get("url") or "").strip(),
+        f"categoria_produto_{indice}": str(produto.get("categoria") or "").strip(),
+        f"engajamento_{indice}": str(produto.get("engajamento") or "baixo"),
+    })
+    for campo in CAMPOS_REDES_SOCIAIS:
+        formulario[f"{campo}_{indice}"] = "sim" if produto.get(campo) else "nao"
+
+    palavras_chave = produto.get("palavras_chave") or []
+    if not isinstance(palavras_chave, list):
+        raise ValueError("'palavras_chave' deve ser uma lista.")
+    formulario.setlist(f"palavra-chave_{indice}[]", [str(palavra.get("palavra", "")) for palavra in palavras_chave])
+    formulario.setlist(f"volume_{indice}[]", [str(palavra.get("volume", "")) for palavra in palavras_chave])
+    formulario.setlist(f"cpc_{indice}[]", [str(palavra.get("cpc", "")) for palavra in palavras_chave])
+    return formulario
+
+
+def pontuar_produto_json(produto, criterios_pagina=None, sazonalidade=None):
+    """
+    Roda o pipeline completo de pontuação para um produto em JSON.
+    """
+    formulario = formulario_de_produto_json(produto)
+    if not formulario["nome_produto_1"] or not formulario["url_produto_1"]:
+        raise ValueError("Produto sem nome ou URL.")
+
+    resultado = processar_produto(
+        index=1,
+        nome_produto=formulario["nome_produto_1"],
+        url_produto=formulario["url_produto_1"],
+        permissao_trafego_pago=ler_booleano(produto.get("permissao_trafego_pago"), "permissao_trafego_pago"),
+        permissao_fundo_funil=ler_booleano(produto.get("permissao_fundo_funil"), "permissao_fundo_funil"),
+        form_data=formulario,
+        categoria_produto=formulario["categoria_produto_1"],
+        tabela_ctr=tabela_ctr,
+        pontuacao_redes_sociais=calcular_redes_sociais(formulario, 1),
+        criterios_pagina=criterios_pagina,
+        sazonalidade=sazonalidade
+    )
+    if not resultado:
+        raise ValueError("Categoria inválida.")
+    gravar_no_catalogo([resultado], str(produto.get("nicho") or ""))
+    return {chave: valor for chave, valor in resultado.para_dict().items() if chave not in CAMPOS_OMITIDOS_LOTE}
+
+
+def pontuar_pagina_html(produto, conteudo, content_type=""):
+    """
+    Pontua um produto em JSON a partir do HTML já baixado (bytes), sem acesso à rede
+    para os critérios de página. Função de módulo para poder rodar num ProcessPoolExecutor.
+    """
+    url = str(produto.get("url") or "").strip()
+    criterios_pagina = calcular_criterios_pagina(
+        url,
+        str(produto.get("nome") or "").strip(),
+        str(produto.get("categoria") or "").strip(),
+        download_de_bytes(url, conteudo, content_type)
+    )
+    return pontuar_produto_json(produto, criterios_pagina)
+
+
+@app.route("/pontuar_lote", methods=["POST"])
+def pontuar_lote():
+    """
+    Pontua uma lista de produtos ({"produtos": [...], "concorrencia": n}) e transmite
+    uma linha NDJSON por produto, na ordem em que terminam.
+    Com "frases": true, uma última linha traz as frases comparativas dos produtos pontuados
+    ("semente" deixa o texto reproduzível).
+    """
+    dados = request.get_json(silent=True) or {}
+    produtos = dados.get("produtos")
+    if not isinstance(produtos, list) or not produtos:
+        return jsonify({"erro": "Envie 'produtos' como uma lista não vazia."}), 400
+    if len(produtos) > LIMITE_PRODUTOS_LOTE:
+        return jsonify({"erro": f"O lote aceita no máximo {LIMITE_PRODUTOS_LOTE} produtos."}), 400
+    try:
+        concorrencia = max(1, min(int(dados.get("concorrencia") or CONCORRENCIA_LOTE), CONCORRENCIA_LOTE))
+    except (TypeError, ValueError):
+        return jsonify({"erro": "'concorrencia' deve ser um número inteiro."}), 400
+    com_frases = bool(dados.get("frases"))
+    semente = dados.get("semente")
+
+    def transmitir():
+        pontuados = []
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=concorrencia)
+        try:
+            futuros = {
+                executor.submit(pontuar_produto_json, produto if isinstance(produto, dict) else {}): indice
+                for indice, produto in enumerate(produtos)
+            }
+            for futuro in concurrent.futures.as_completed(futuros):
+                indice = futuros[futuro]
+                nome = produtos[indice].get("nome") if isinstance(produtos[indice], dict) else None
+                try:
+                    linha = {"indice": indice, "nome": nome, "status": "ok", "produto": futuro.result()}
+                    pontuados.append(linha["produto"])
+                except Exception as e:
+                    logging.error(f"[ERRO] Falha ao pontuar o produto {indice} do lote: {e}")
+                    linha = {"indice": indice, "nome": nome, "status": "erro", "erro": str(e)}
+                yield json.dumps(linha, ensure_ascii=False) + "\n"
+
+            if com_frases and pontuados:
+                # Uma rotação para o lote inteiro: sem repetir frases entre os produtos
+                rotacao = nova_rotacao_frases(semente)
+                yield json.dumps({
+                    "status": "frases",
+                    "frases_custo_beneficio": gerar_frases_custo_beneficio(pontuados, rotacao),
+                    "frases_pontuacao_total": gerar_frases_pontuacao_total(pontuados, rotacao),
+                    "frases_conclusao": gerar_frases_conclusao(pontuados, rotacao)
+                }, ensure_ascii=False) + "\n"
+        finally:
+            # Cliente desconectado ou lote concluído: descarta o que ainda não começou
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return Response(transmitir(), mimetype="application/x-ndjson")
+
+# FIM PONTUAÇÃO EM LOTE (NDJSON)
+
+
+# INÍCIO CATÁLOGO DE PRODUTOS PONTUADOS
+# Todo produto pontuado (formulário, jobs, lote e CLI) é gravado num SQLite com índices por
+# categoria, pontuação total, nota final, CPC médio e data da análise. A rota /ranking
+# compara candidatos com tudo que já foi pontuado, sem reanalisar nada.
+from datetime import datetime
+
+CAMINHO_CATALOGO_PRODUTOS = os.environ.get(
+    "CATALOGO_PRODUTOS_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalogo_produtos.sqlite3")
+)
+POR_PAGINA_RANKING = 50
+LIMITE_POR_PAGINA_RANKING = 500
+
+# Colunas numéricas do catálogo (na ordem de gravação) e ordenações aceitas pelo /ranking
+COLUNAS_NUMERICAS_CATALOGO = (
+    CRITERIOS_PONTUACAO_TOTAL + CAMPOS_DETALHES_SEO
+    + ["pontuacao_total", "nota_final", "avg_cpc", "total_palavras_chave"]
+)
+ORDENACOES_RANKING = ("nota_final", "pontuacao_total", "avg_cpc", "analisado_em")
+
+ESQUEMA_CATALOGO_PRODUTOS = (
+    "CREATE TABLE IF NOT EXISTS produtos ("
+    "id INTEGER PRIMARY KEY AUTOINCREMENT, lote TEXT NOT NULL, nicho TEXT NOT NULL DEFAULT '', "
+    "nome TEXT NOT NULL, url TEXT NOT NULL, categoria TEXT NOT NULL, "
+    + "".join(f"{coluna} REAL NOT NULL DEFAULT 0, " for coluna in COLUNAS_NUMERICAS_CATALOGO)
+    + "mais_recente INTEGER NOT NULL DEFAULT 1, analisado_em REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_produtos_categoria_nota ON produtos (categoria, nota_final)",
+    "CREATE INDEX IF NOT EXISTS idx_produtos_categoria_total ON produtos (categoria, pontuacao_total)",
+    "CREATE INDEX IF NOT EXISTS idx_produtos_categoria_cpc ON produtos (categoria, avg_cpc)",
+    "CREATE INDEX IF NOT EXISTS idx_produtos_categoria_data ON produtos (categoria, analisado_em)",
+    "CREATE INDEX IF NOT EXISTS idx_produtos_nota ON produtos (nota_final)",
+    "CREATE INDEX IF NOT EXISTS idx_produtos_total ON produtos (pontuacao_total)",
+    "CREATE INDEX IF NOT EXISTS idx_produtos_cpc ON produtos (avg_cpc)",
+    "CREATE INDEX IF NOT EXISTS idx_produtos_data ON produtos (analisado_em)",
+    "CREATE INDEX IF NOT EXISTS idx_produtos_url ON produtos (url, nome, mais_recente)",
+    "CREATE INDEX IF NOT EXISTS idx_produtos_lote ON produtos (lote)",
+)
+
+
+def conexao_catalogo():
+    # O histórico compacto e o índice de duplicatas (seções abaixo) moram no mesmo arquivo
+    return conexao_sqlite(
+        CAMINHO_CATALOGO_PRODUTOS,
+        ESQUEMA_CATALOGO_PRODUTOS + ESQUEMA_HISTORICO_PONTUACAO + ESQUEMA_INDICE_DUPLICATAS
+    )
+
+
+def gravar_no_catalogo(produtos, nicho=""):
+    """
+    Grava os produtos pontuados (PontuacaoProduto) no catálogo e retorna o id do lote.
+    A versão anterior de cada produto (mesma URL e nome) deixa de ser a mais recente.
+    Falhas de gravação só são registradas no log: a análise não depende do catálogo.
+    """
+    if not produtos:
+        return None
+    lote = uuid.uuid4().hex
+    agora = time.time()
+    colunas = ["lote", "nicho", "nome", "url", "categoria"] + COLUNAS_NUMERICAS_CATALOGO + ["analisado_em"]
+    linhas = [
+        [lote, nicho or "", produto.nome, produto.url, produto.categoria]
+        + [float(getattr(produto, coluna) or 0) for coluna in COLUNAS_NUMERICAS_CATALOGO]
+        + [agora]
+        for produto in produtos
+    ]
+    try:
+        with transacao_imediata(conexao_catalogo()) as conexao:
+            conexao.executemany(
+                "UPDATE produtos SET mais_recente = 0 WHERE url = ? AND nome = ? AND mais_recente = 1",
+                [(produto.url, produto.nome) for produto in produtos]
+            )
+            conexao.executemany(
+                f"INSERT INTO produtos ({', '.join(colunas)}) VALUES ({', '.join('?' * len(colunas))})",
+                linhas
+            )
+            anexar_ao_historico(conexao, produtos, agora)
+    except sqlite3.Error as e:
+        logging.error(f"[ERRO] Falha ao gravar {len(produtos)} produto(s) no catálogo: {e}")
+        return None
+    logging.debug(f"[DEBUG] {len(produtos)} produto(s) gravado(s) no catálogo (lote {lote}).")
+    return lote
+
+
+def ler_numero_filtro(argumentos, nome):
+    """
+    Lê um filtro numérico da query string (None se ausente); ValueError se inválido.
+    """
+    valor = argumentos.get(nome, "").strip().replace(",", ".")
+    if not valor:
+        return None
+    try:
+        return float(valor)
+    except ValueError:
+        raise ValueError(f"'{nome}' deve ser numérico.")
+
+
+def ler_data_filtro(argumentos, nome, fim_do_dia=False):
+    """
+    Lê uma data AAAA-MM-DD da query string como timestamp (início ou fim do dia).
+    """
+    valor = argumentos.get(nome, "").strip()
+    if not valor:
+        return None
+    try:
+        data = datetime.strptime(valor, "%Y-%m-%d")
+    except ValueError:
+        raise ValueError(f"'{nome}' deve estar no formato AAAA-MM-DD.")
+    return data.timestamp() + (86400 if fim_do_dia else 0)
+
+
+def consultar_ranking(categoria=None, ordenar="nota_final", crescente=False, cpc_min=None, cpc_max=None,
+                      nota_min=None, total_min=None, desde=None, ate=None, nicho=None, historico=False,
+                      pagina=1, por_pagina=POR_PAGINA_RANKING):
+    """
+    Consulta o catálogo com filtros e paginação. Retorna (linhas, tem_mais).
+    A ordenação usa os índices (categoria, coluna) ou (coluna); o id desempata.
+    """
+    condicoes, parametros = [], []
+    filtros = (
+        ("categoria = ?", categoria),
+        ("avg_cpc >= ?", cpc_min),
+        ("avg_cpc < ?", cpc_max),
+        ("nota_final >= ?", nota_min),
+        ("pontuacao_total >= ?", total_min),
+        ("analisado_em >= ?", desde),
+        ("analisado_em < ?", ate),
+        ("nicho = ?", nicho),
+    )
+    for condicao, valor in filtros:
+        if valor is not None:
+            condicoes.append(condicao)
+            parametros.append(valor)
+    if not historico:
+        condicoes.append("mais_recente = 1")
+
+    direcao = "ASC" if crescente else "DESC"
+    consulta = (
+        "SELECT id, lote, nicho, nome, url, categoria, "
+        + ", ".join(COLUNAS_NUMERICAS_CATALOGO)
+        + ", analisado_em FROM produtos"
+        + (" WHERE " + " AND ".join(condicoes) if condicoes else "")
+        + f" ORDER BY {ordenar} {direcao}, id {direcao} LIMIT ? OFFSET ?"
+    )
+    # Uma linha a mais indica se existe próxima página (sem COUNT no catálogo inteiro)
+    cursor = conexao_catalogo().execute(consulta, parametros + [por_pagina + 1, (pagina - 1) * por_pagina])
+    nomes = [coluna[0] for coluna in cursor.description]
+    linhas = [dict(zip(nomes, linha)) for linha in cursor.fetchall()]
+    return linhas[:por_pagina], len(linhas) > por_pagina
+
+
+@app.route("/ranking", methods=["GET"])
+def ranking():
+    """
+    Ranking paginado do catálogo. Ex.: /ranking?categoria=saúde e bem-estar&cpc_max=2&ordenar=nota_final
+    Filtros: categoria, cpc_min, cpc_max, nota_min, total_min, desde, ate (AAAA-MM-DD), nicho;
+    historico=1 inclui as versões antigas de cada produto; pagina e por_pagina paginam.
+    """
+    argumentos = request.args
+    inicio = time.perf_counter()
+    try:
+        categoria = None
+        if argumentos.get("categoria", "").strip():
+            categoria = validar_categoria(argumentos["categoria"].strip(), tabela_ctr)
+            if not categoria:
+                raise ValueError(f"Categoria desconhecida: '{argumentos['categoria']}'.")
+        ordenar = argumentos.get("ordenar", "nota_final")
+        if ordenar not in ORDENACOES_RANKING:
+            raise ValueError(f"'ordenar' deve ser um de: {', '.join(ORDENACOES_RANKING)}.")
+        ordem = argumentos.get("ordem", "desc").lower()
+        if ordem not in ("asc", "desc"):
+            raise ValueError("'ordem' deve ser 'asc' ou 'desc'.")
+        pagina = int(argumentos.get("pagina", 1))
+        por_pagina = int(argumentos.get("por_pagina", POR_PAGINA_RANKING))
+        if pagina < 1 or not 1 <= por_pagina <= LIMITE_POR_PAGINA_RANKING:
+            raise ValueError(f"'pagina' deve ser >= 1 e 'por_pagina' entre 1 e {LIMITE_POR_PAGINA_RANKING}.")
+        filtros = {
+            "cpc_min": ler_numero_filtro(argumentos, "cpc_min"),
+            "cpc_max": ler_numero_filtro(argumentos, "cpc_max"),
+            "nota_min": ler_numero_filtro(argumentos, "nota_min"),
+            "total_min": ler_numero_filtro(argumentos, "total_min"),
+            "desde": ler_data_filtro(argumentos, "desde"),
+            "ate": ler_data_filtro(argumentos, "ate", fim_do_dia=True),
+        }
+    except ValueError as e:
+        return jsonify({"erro": str(e)}), 400
+
+    try:
+        linhas, tem_mais = consultar_ranking(
+            categoria=categoria,
+            ordenar=ordenar,
+            crescente=ordem == "asc",
+            nicho=argumentos.get("nicho") or None,
+            historico=argumentos.get("historico") in ("1", "true", "sim"),
+            pagina=pagina,
+            por_pagina=por_pagina,
+            **filtros
+        )
+    except sqlite3.Error as e:
+        logging.error(f"[ERRO] Falha ao consultar o catálogo: {e}")
+        return jsonify({"erro": "Catálogo indisponível."}), 503
+
+    for posicao, linha in enumerate(linhas, start=(pagina - 1) * por_pagina + 1):
+        linha["posicao"] = posicao
+        linha["analisado_em"] = datetime.fromtimestamp(linha["analisado_em"]).isoformat(timespec="seconds")
+        for coluna in COLUNAS_NUMERICAS_CATALOGO:
+            linha[coluna] = round(linha[coluna], CASAS_DECIMAIS_PONTUACAO)
+        linha["total_palavras_chave"] = int(linha["total_palavras_chave"])
+
+    return jsonify({
+        "produtos": linhas,
+        "pagina": pagina,
+        "por_pagina": por_pagina,
+        "tem_mais": tem_mais,
+        "tempo_ms": round((time.perf_counter() - inicio) * 1000, 2)
+    })
+
+# FIM CATÁLOGO DE PRODUTOS PONTUADOS
+
+
+# INÍCIO HISTÓRICO COMPACTO DE PONTUAÇÕES
+# Uma linha por produto (URL + nome) com uma coluna BLOB por critério. Cada série guarda os
+# valores em centésimos, codificados como diferenças em relação ao ponto anterior e
+# comprimidos com zlib (páginas que não mudam viram sequências de zeros). As consultas leem
+# só as colunas pedidas: "tempos" e a série de cada critério consultado.
+import zlib
+from array import array
+from heapq import nlargest
+from itertools import accumulate
+
+SERIES_HISTORICO = CRITERIOS_PONTUACAO_TOTAL + ["pontuacao_total", "nota_final", "avg_cpc"]
+ESCALA_HISTORICO = 100  # valores guardados em centésimos
+DIAS_VARIACOES = 7
+LIMITE_VARIACOES = 20
+
+ESQUEMA_HISTORICO_PONTUACAO = (
+    "CREATE TABLE IF NOT EXISTS historico_pontuacao ("
+    "url TEXT NOT NULL, nome TEXT NOT NULL, categoria TEXT NOT NULL, "
+    "pontos INTEGER NOT NULL, primeiro_em REAL NOT NULL, ultimo_em REAL NOT NULL, tempos BLOB NOT NULL, "
+    + "".join(f"{serie} BLOB NOT NULL, " for serie in SERIES_HISTORICO)
+    + "PRIMARY KEY (url, nome)) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS idx_historico_ultimo ON historico_pontuacao (ultimo_em)",
+    "CREATE INDEX IF NOT EXISTS idx_historico_categoria ON historico_pontuacao (categoria, ultimo_em)",
+)
+
+
+def codificar_serie(valores):
+    """
+    Inteiros -> diferenças sucessivas -> bytes (int64) comprimidos com zlib.
+    """
+    deltas = array("q", (atual - anterior for anterior, atual in zip([0] + valores[:-1], valores)))
+    return zlib.compress(deltas.tobytes(), 9)
+
+
+def decodificar_serie(blob):
+    deltas = array("q")
+    deltas.frombytes(zlib.decompress(blob))
+    return list(accumulate(deltas))
+
+
+def anexar_ao_historico(conexao, produtos, agora):
+    """
+    Acrescenta um ponto às séries de cada produto (chamada dentro da transação do catálogo).
+    """
+    colunas = ["tempos"] + SERIES_HISTORICO
+    instante = int(agora)
+    for produto in produtos:
+        linha = conexao.execute(
+            f"SELECT pontos, primeiro_em, {', '.join(colunas)} FROM historico_pontuacao WHERE url = ? AND nome = ?",
+            (produto.url, produto.nome)
+        ).fetchone()
+        if linha:
+            pontos, primeiro_em, series = linha[0], linha[1], [decodificar_serie(blob) for blob in linha[2:]]
+        else:
+            pontos, primeiro_em, series = 0, agora, [[] for _ in colunas]
+
+        series[0].append(instante)
+        for serie, coluna in zip(series[1:], SERIES_HISTORICO):
+            serie.append(round(float(getattr(produto, coluna) or 0) * ESCALA_HISTORICO))
+
+        conexao.execute(
+            f"INSERT OR REPLACE INTO historico_pontuacao (url, nome, categoria, pontos, primeiro_em, ultimo_em, "
+            f"{', '.join(colunas)}) VALUES ({', '.join('?' * (len(colunas) + 6))})",
+            [produto.url, produto.nome, produto.categoria, pontos + 1, primeiro_em, agora]
+            + [codificar_serie(serie) for serie in series]
+        )
+
+
+def trajetoria_produto(url, criterios, nome=None, desde=None):
+    """
+    Séries dos critérios pedidos para os produtos da URL (opcionalmente de um nome só).
+    """
+    consulta = f"SELECT nome, categoria, tempos, {', '.join(criterios)} FROM historico_pontuacao WHERE url = ?"
+    parametros = [url]
+    if nome:
+        consulta += " AND nome = ?"
+        parametros.append(nome)
+
+    trajetorias = []
+    for linha in conexao_catalogo().execute(consulta, parametros):
+        tempos = decodificar_serie(linha[2])
+        series = [decodificar_serie(blob) for blob in linha[3:]]
+        inicio = 0 if desde is None else next((i for i, t in enumerate(tempos) if t >= desde), len(tempos))
+        trajetorias.append({
+            "nome": linha[0],
+            "url": url,
+            "categoria": linha[1],
+            "pontos": [
+                dict(
+                    {"analisado_em": datetime.fromtimestamp(tempos[i]).isoformat(timespec="seconds")},
+                    **{criterio: serie[i] / ESCALA_HISTORICO for criterio, serie in zip(criterios, series)}
+                )
+                for i in range(inicio, len(tempos))
+            ]
+        })
+    return trajetorias
+
+
+def maiores_variacoes(criterio="pontuacao_total", dias=DIAS_VARIACOES, categoria=None, direcao="ambos",
+                      limite=LIMITE_VARIACOES):
+    """
+    Produtos cujo critério mais variou na janela: compara o último valor com o último ponto
+    anterior à janela (ou com o primeiro ponto dela, para produtos novos).
+    Só são lidos os produtos analisados na janela, e deles só "tempos" e a série do critério.
+    """
+    desde = time.time() - dias * 86400
+    consulta = f"SELECT nome, url, categoria, tempos, {criterio} FROM historico_pontuacao WHERE ultimo_em >= ? AND pontos > 1"
+    parametros = [desde]
+    if categoria:
+        consulta += " AND categoria = ?"
+        parametros.append(categoria)
+
+    variacoes = []
+    for nome, url, categoria_produto, blob_tempos, blob_serie in conexao_catalogo().execute(consulta, parametros):
+        tempos = decodificar_serie(blob_tempos)
+        serie = decodificar_serie(blob_serie)
+        base = max(0, next((i for i, t in enumerate(tempos) if t >= desde), len(tempos)) - 1)
+        if base == len(serie) - 1:
+            continue
+        variacoes.append({
+            "nome": nome,
+            "url": url,
+            "categoria": categoria_produto,
+            "de": serie[base] / ESCALA_HISTORICO,
+            "para": serie[-1] / ESCALA_HISTORICO,
+            "variacao": (serie[-1] - serie[base]) / ESCALA_HISTORICO,
+            "desde": datetime.fromtimestamp(tempos[base]).isoformat(timespec="seconds"),
+            "analisado_em": datetime.fromtimestamp(tempos[-1]).isoformat(timespec="seconds")
+        })
+
+    chaves = {
+        "alta": lambda item: item["variacao"],
+        "queda": lambda item: -item["variacao"],
+        "ambos": lambda item: abs(item["variacao"])
+    }
+    # Em "alta" só entram subidas, em "queda" só quedas; produtos estáveis ficam de fora
+    return [item for item in nlargest(limite, variacoes, key=chaves[direcao]) if chaves[direcao](item) > 0]
+
+
+def ler_criterios_historico(argumentos, padrao):
+    """
+    Lista de critérios da query string (separados por vírgula), validada contra SERIES_HISTORICO.
+    """
+    criterios = [c.strip() for c in argumentos.get("criterios", padrao).split(",") if c.strip()]
+    invalidos = [c for c in criterios if c not in SERIES_HISTORICO]
+    if invalidos or not criterios:
+        raise ValueError(f"Critérios inválidos: {', '.join(invalidos) or '(nenhum)'}. Use: {', '.join(SERIES_HISTORICO)}.")
+    return criterios
+
+
+@app.route("/historico", methods=["GET"])
+def historico():
+    """
+    Trajetória de um produto. Ex.: /historico?url=...&nome=...&criterios=pontuacao_total,pontuacao_copywriting&desde=2024-05-01
+    """
+    argumentos = request.args
+    url = argumentos.get("url", "").strip()
+    try:
+        if not url:
+            raise ValueError("Informe a 'url' do produto.")
+        criterios = ler_criterios_historico(argumentos, "pontuacao_total,nota_final")
+        desde = ler_data_filtro(argumentos, "desde")
+    except ValueError as e:
+        return jsonify({"erro": str(e)}), 400
+
+    try:
+        trajetorias = trajetoria_produto(url, criterios, argumentos.get("nome", "").strip() or None, desde)
+    except sqlite3.Error as e:
+        logging.error(f"[ERRO] Falha ao consultar o histórico: {e}")
+        return jsonify({"erro": "Histórico indisponível."}), 503
+    if not trajetorias:
+        return jsonify({"erro": "Produto sem histórico."}), 404
+    return jsonify({"produtos": trajetorias})
+
+
+@app.route("/historico/variacoes", methods=["GET"])
+def historico_variacoes():
+    """
+    Maiores variações recentes. Ex.: /historico/variacoes?criterio=pontuacao_qualidade_pagina&dias=7&direcao=queda
+    """
+    argumentos = request.args
+    try:
+        criterio = ler_criterios_historico({"criterios": argumentos.get("criterio", "pontuacao_total")}, "")[0]
+        direcao = argumentos.get("direcao", "ambos")
+        if direcao not in ("ambos", "alta", "queda"):
+            raise ValueError("'direcao' deve ser 'ambos', 'alta' ou 'queda'.")
+        dias = float(argumentos.get("dias", DIAS_VARIACOES))
+        limite = int(argumentos.get("limite", LIMITE_VARIACOES))
+        if dias <= 0 or not 1 <= limite <= LIMITE_POR_PAGINA_RANKING:
+            raise ValueError(f"'dias' deve ser positivo e 'limite' entre 1 e {LIMITE_POR_PAGINA_RANKING}.")
+        categoria = None
+        if argumentos.get("categoria", "").strip():
+            categoria = validar_categoria(argumentos["categoria"].strip(), tabela_ctr)
+            if not categoria:
+                raise ValueError(f"Categoria desconhecida: '{argumentos['categoria']}'.")
+    except ValueError as e:
+        return jsonify({"erro": str(e)}), 400
+
+    inicio = time.perf_counter()
+    try:
+        variacoes = maiores_variacoes(criterio, dias, categoria, direcao, limite)
+    except sqlite3.Error as e:
+        logging.error(f"[ERRO] Falha ao consultar o histórico: {e}")
+        return jsonify({"erro": "Histórico indisponível."}), 503
+    return jsonify({
+        "criterio": criterio,
+        "dias": dias,
+        "produtos": variacoes,
+        "tempo_ms": round((time.perf_counter() - inicio) * 1000, 2)
+    })
+
+# FIM HISTÓRICO COMPACTO DE PONTUAÇÕES
+
+
+# INÍCIO LISTA DE ACOMPANHAMENTO (PRÉ-PONTUAÇÃO AGENDADA)
+# Produtos consultados com frequência entram numa lista de acompanhamento. Um agendador
+# (biblioteca schedule) roda numa thread de cada processo e, a cada rodada, reserva os
+# produtos vencidos, baixa a página e consulta a sazonalidade fora da requisição, respeitando
+# um intervalo mínimo por domínio e entre consultas ao Google Trends. Os horários de acesso
+# ficam no SQLite, então o intervalo vale para todos os processos juntos; domínios com falhas
+# seguidas ficam a cargo do disjuntor dos downloads. As rotas / e /analisar
+# usam essa coleta pronta (as palavras-chave do formulário continuam valendo) e o resultado
+# mostra há quanto tempo cada produto foi pontuado.
+import schedule
+from itertools import zip_longest
+
+CAMINHO_ACOMPANHAMENTO = os.environ.get(
+    "ACOMPANHAMENTO_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "acompanhamento.sqlite3")
+)
+ACOMPANHAMENTO_ATIVO = os.environ.get("ACOMPANHAMENTO_ATIVO", "1") == "1"
+INTERVALO_PADRAO_ACOMPANHAMENTO = float(os.environ.get("INTERVALO_ACOMPANHAMENTO_HORAS", 6)) * 3600
+INTERVALO_MINIMO_ACOMPANHAMENTO = 15 * 60
+INTERVALO_RODADA_ACOMPANHAMENTO = int(os.environ.get("INTERVALO_RODADA_ACOMPANHAMENTO", 60))
+LIMITE_RODADA_ACOMPANHAMENTO = int(os.environ.get("LIMITE_RODADA_ACOMPANHAMENTO", 50))
+# Produto reservado por um worker que morreu volta para a fila depois desse tempo
+TEMPO_RESERVA_ACOMPANHAMENTO = 30 * 60
+# Boas maneiras com os servidores: intervalo entre páginas do mesmo domínio e entre consultas ao Trends
+INTERVALO_MINIMO_DOMINIO = float(os.environ.get("INTERVALO_MINIMO_DOMINIO", 5))
+INTERVALO_MINIMO_TRENDS = float(os.environ.get("INTERVALO_MINIMO_TRENDS", 2))
+# Pré-pontuações mais antigas que isso não são usadas; acima de IDADE_PONTUACAO_DESATUALIZADA o selo fica de alerta
+VALIDADE_PRE_PONTUACAO = float(os.environ.get("VALIDADE_PRE_PONTUACAO_HORAS", 24)) * 3600
+IDADE_PONTUACAO_DESATUALIZADA = float(os.environ.get("IDADE_PONTUACAO_DESATUALIZADA_HORAS", 12)) * 3600
+
+ESQUEMA_ACOMPANHAMENTO = (
+    "CREATE TABLE IF NOT EXISTS acompanhamento ("
+    "url TEXT NOT NULL, nome TEXT NOT NULL, categoria TEXT NOT NULL, dados TEXT NOT NULL, "
+    "intervalo REAL NOT NULL, proxima_em REAL NOT NULL, pontuado_em REAL, criterios_pagina TEXT, "
+    "sazonalidade TEXT, resultado TEXT, erro TEXT, falhas INTEGER NOT NULL DEFAULT 0, criado_em REAL NOT NULL, "
+    "PRIMARY KEY (url, nome))",
+    "CREATE INDEX IF NOT EXISTS idx_acompanhamento_proxima ON acompanhamento (proxima_em)",
+    # Próximo horário livre por domínio ("dominio:<host>") e para o Google Trends ("trends")
+    "CREATE TABLE IF NOT EXISTS proximos_acessos (chave TEXT PRIMARY KEY, proximo_em REAL NOT NULL)",
+)
+
+_sinal_acompanhamento = threading.Event()
+_trava_agendador_acompanhamento = threading.Lock()
+_agendador_acompanhamento = {"pid": None, "thread": None}
+
+
+def conexao_acompanhamento():
+    return conexao_sqlite(CAMINHO_ACOMPANHAMENTO, ESQUEMA_ACOMPANHAMENTO)
+
+
+def aguardar_vez(chave, intervalo):
+    """
+    Reserva, entre todos os processos, o próximo horário livre para a chave (domínio ou Trends)
+    e dorme até ele. Se o SQLite falhar, espera o intervalo inteiro por precaução.
+    """
+    agora = time.time()
+    try:
+        with transacao_imediata(conexao_acompanhamento()) as conexao:
+            linha = conexao.execute("SELECT proximo_em FROM proximos_acessos WHERE chave = ?", (chave,)).fetchone()
+            vez = max(agora, linha[0] if linha else 0)
+            conexao.execute(
+                "INSERT OR REPLACE INTO proximos_acessos (chave, proximo_em) VALUES (?, ?)", (chave, vez + intervalo)
+            )
+    except sqlite3.Error as e:
+        logging.error(f"[ERRO] Falha ao reservar horário de acesso para {chave}: {e}")
+        vez = agora + intervalo
+    if vez > agora:
+        time.sleep(vez - agora)
+
+
+def pre_pontuacao_acompanhada(url, nome, categoria):
+    """
+    Coleta agendada do produto ({"criterios_pagina", "sazonalidade", "pontuado_em"}),
+    ou None se ele não é acompanhado, ainda não foi pontuado ou a coleta venceu.
+    """
+    if not url:
+        return None
+    try:
+        linha = conexao_acompanhamento().execute(
+            "SELECT categoria, pontuado_em, criterios_pagina, sazonalidade FROM acompanhamento "
+            "WHERE url = ? AND nome = ? AND pontuado_em > ?",
+            (url, nome, time.time() - VALIDADE_PRE_PONTUACAO)
+        ).fetchone()
+    except sqlite3.Error as e:
+        logging.error(f"[ERRO] Lista de acompanhamento indisponível: {e}")
+        return None
+    if not linha or linha[0].lower() != categoria.strip().lower():
+        return None
+    logging.debug(f"[DEBUG] Pré-pontuação do acompanhamento usada para {url}")
+    return {"criterios_pagina": json.loads(linha[2]), "sazonalidade": json.loads(linha[3]), "pontuado_em": linha[1]}
+
+
+def descrever_idade_pontuacao(pontuado_em):
+    """
+    Texto do selo de idade da pontuação ("agora", "há 5 min", "há 3 h", "há 2 dias").
+    """
+    segundos = max(0, time.time() - (pontuado_em or time.time()))
+    if segundos < 60:
+        return "agora"
+    if segundos < 3600:
+        return f"há {int(segundos // 60)} min"
+    if segundos < 86400:
+        return f"há {int(segundos // 3600)} h"
+    dias = int(segundos // 86400)
+    return f"há {dias} dia{'s' if dias > 1 else ''}"
+
+
+def acompanhar_produtos(produtos, intervalo=None):
+    """
+    Inclui (ou atualiza) produtos na lista de acompanhamento. Produtos novos são pontuados
+    na próxima rodada. Retorna (quantidade gravada, lista de erros por posição).
+    """
+    intervalo = max(INTERVALO_MINIMO_ACOMPANHAMENTO, intervalo or INTERVALO_PADRAO_ACOMPANHAMENTO)
+    agora = time.time()
+    linhas, erros = [], []
+    for posicao, produto in enumerate(produtos):
+        if not isinstance(produto, dict):
+            erros.append({"indice": posicao, "erro": "Produto deve ser um objeto JSON."})
+            continue
+        nome = str(produto.get("nome") or "").strip()
+        url = str(produto.get("url") or "").strip()
+        categoria = str(produto.get("categoria") or "").strip()
+        if not nome or not url:
+            erros.append({"indice": posicao, "erro": "Produto sem nome ou URL."})
+        elif not validar_categoria(categoria, tabela_ctr):
+            erros.append({"indice": posicao, "erro": f"Categoria inválida: '{categoria}'."})
+        else:
+            linhas.append((url, nome, categoria, json.dumps(produto), intervalo, agora, agora))
+
+    with transacao_imediata(conexao_acompanhamento()) as conexao:
+        conexao.executemany(
+            "INSERT INTO acompanhamento (url, nome, categoria, dados, intervalo, proxima_em, criado_em) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (url, nome) DO UPDATE SET "
+            "categoria = excluded.categoria, dados = excluded.dados, intervalo = excluded.intervalo, "
+            "proxima_em = MIN(proxima_em, COALESCE(pontuado_em, 0) + excluded.intervalo)",
+            linhas
+        )
+    _sinal_acompanhamento.set()
+    return len(linhas), erros
+
+
+def reservar_acompanhamentos_vencidos(limite=LIMITE_RODADA_ACOMPANHAMENTO):
+    """
+    Reserva os produtos vencidos para este worker, adiando-os por TEMPO_RESERVA_ACOMPANHAMENTO
+    (assim outro processo não pega os mesmos produtos na mesma rodada).
+    """
+    agora = time.time()
+    with transacao_imediata(conexao_acompanhamento()) as conexao:
+        linhas = conexao.execute(
+            "SELECT url, nome, categoria, dados, intervalo, falhas FROM acompanhamento "
+            "WHERE proxima_em <= ? ORDER BY proxima_em LIMIT ?",
+            (agora, limite)
+        ).fetchall()
+        conexao.executemany(
+            "UPDATE acompanhamento SET proxima_em = ? WHERE url = ? AND nome = ?",
+            [(agora + TEMPO_RESERVA_ACOMPANHAMENTO, linha[0], linha[1]) for linha in linhas]
+        )
+    colunas = ("url", "nome", "categoria", "dados", "intervalo", "falhas")
+    return [dict(zip(colunas, linha)) for linha in linhas]
+
+
+def repontuar_acompanhado(entrada):
+    """
+    Coleta a página e a sazonalidade de um produto acompanhado e grava a nova pré-pontuação
+    (o produto completo também vai para o catálogo e o histórico).
+    """
+    url, nome, categoria = entrada["url"], entrada["nome"], entrada["categoria"]
+    agora = time.time()
+
+    # Com o disjuntor do domínio aberto, falha na hora sem ocupar a vez do domínio
+    criterios_pagina = None
+    bloqueio = motivo_falha_recente(url) or motivo_disjuntor_aberto(dominio_url(url))
+    if not bloqueio:
+        aguardar_vez(f"dominio:{dominio_url(url)}", INTERVALO_MINIMO_DOMINIO)
+        try:
+            criterios_pagina = coletar_criterios_pagina(url, nome, categoria)
+        except Exception as e:
+            logging.error(f"[ERRO] Acompanhamento: falha ao coletar {url}: {e}")
+
+    erro = None
+    if criterios_pagina is None:
+        erro = bloqueio or motivo_falha_recente(url) or "Página não carregou."
+    else:
+        aguardar_vez("trends", INTERVALO_MINIMO_TRENDS)
+        sazonalidade = analisar_sazonalidade(nome)
+        try:
+            resultado = pontuar_produto_json(json.loads(entrada["dados"]), criterios_pagina, sazonalidade)
+        except Exception as e:
+            erro = str(e)
+
+    conexao = conexao_acompanhamento()
+    if erro:
+        # Mantém a última pré-pontuação boa e tenta de novo antes do intervalo normal
+        falhas = entrada["falhas"] + 1
+        espera = min(entrada["intervalo"], INTERVALO_MINIMO_ACOMPANHAMENTO * 2 ** (falhas - 1))
+        logging.error(f"[ERRO] Acompanhamento: {url} ({nome}) não foi pontuado: {erro}")
+        conexao.execute(
+            "UPDATE acompanhamento SET erro = ?, falhas = ?, proxima_em = ? WHERE url = ? AND nome = ?",
+            (erro, falhas, agora + espera, url, nome)
+        )
+        return False
+
+    try:
+        gravar_cache_compartilhado(chave_criterios_pagina(url, nome, categoria), criterios_pagina)
+    except sqlite3.Error as e:
+        logging.error(f"[ERRO] Falha ao gravar no cache compartilhado: {e}")
+    conexao.execute(
+        "UPDATE acompanhamento SET pontuado_em = ?, criterios_pagina = ?, sazonalidade = ?, resultado = ?, "
+        "erro = NULL, falhas = 0, proxima_em = ? WHERE url = ? AND nome = ?",
+        (agora, json.dumps(criterios_pagina), json.dumps(sazonalidade), json.dumps(resultado),
+         agora + entrada["intervalo"], url, nome)
+    )
+    logging.debug(f"[DEBUG] Acompanhamento: {url} ({nome}) pontuado.")
+    return True
+
+
+def executar_rodada_acompanhamento():
+    """
+    Repontua os produtos vencidos, intercalando os domínios para que a espera entre
+    páginas do mesmo site não segure as demais.
+    """
+    try:
+        entradas = reservar_acompanhamentos_vencidos()
+        conexao_acompanhamento().execute("DELETE FROM proximos_acessos WHERE proximo_em < ?", (time.time(),))
+    except sqlite3.Error as e:
+        logging.error(f"[ERRO] Lista de acompanhamento indisponível: {e}")
+        return
+    por_dominio = {}
+    for entrada in entradas:
+        por_dominio.setdefault(dominio_url(entrada["url"]), []).append(entrada)
+    for grupo in zip_longest(*por_dominio.values()):
+        for entrada in grupo:
+            if entrada is None:
+                continue
+            try:
+                repontuar_acompanhado(entrada)
+            except Exception as e:
+                logging.error(f"[ERRO] Acompanhamento de {entrada['url']}: {e}")
+
+
+def loop_agendador_acompanhamento():
+    agendador = schedule.Scheduler()
+    agendador.every(INTERVALO_RODADA_ACOMPANHAMENTO).seconds.do(executar_rodada_acompanhamento)
+    executar_rodada_acompanhamento()
+    while True:
+        # Produtos recém-incluídos acordam o agendador antes da próxima rodada
+        if _sinal_acompanhamento.wait(max(1, agendador.idle_seconds or 1)):
+            _sinal_acompanhamento.clear()
+            agendador.run_all()
+        else:
+            agendador.run_pending()
+
+
+def iniciar_agendador_acompanhamento():
+    """
+    Inicia (uma vez por processo) a thread do agendador da lista de acompanhamento.
+    Processos filhos do pool de critérios não rodam o agendador.
+    """
+    if not ACOMPANHAMENTO_ATIVO or multiprocessing.parent_process() is not None:
+        return
+    with _trava_agendador_acompanhamento:
+        if _agendador_acompanhamento["pid"] == os.getpid():
+            return
+        _agendador_acompanhamento["pid"] = os.getpid()
+        _agendador_acompanhamento["thread"] = threading.Thread(
+            target=loop_agendador_acompanhamento, name="acompanhamento", daemon=True
+        )
+        _agendador_acompanhamento["thread"].start()
+
+
+# Mesmo esquema dos workers da fila: sobe na importação e o gancho cobre processos
+# criados por fork depois dela.
+@app.before_request
+def garantir_agendador_acompanhamento():
+    iniciar_agendador_acompanhamento()
+
+
+@app.route("/acompanhamento", methods=["GET"])
+def listar_acompanhamento():
+    """
+    Produtos acompanhados com a idade e o resumo da última pontuação.
+    """
+    linhas = conexao_acompanhamento().execute(
+        "SELECT url, nome, categoria, intervalo, pontuado_em, proxima_em, resultado, erro, falhas "
+        "FROM acompanhamento ORDER BY nome"
+    ).fetchall()
+    produtos = []
+    for url, nome, categoria, intervalo, pontuado_em, proxima_em, resultado, erro, falhas in linhas:
+        resultado = json.loads(resultado) if resultado else {}
+        produtos.append({
+            "url": url,
+            "nome": nome,
+            "categoria": categoria,
+            "intervalo_horas": round(intervalo / 3600, 2),
+            "pontuado_em": datetime.fromtimestamp(pontuado_em).isoformat(timespec="seconds") if pontuado_em else None,
+            "idade_pontuacao": descrever_idade_pontuacao(pontuado_em) if pontuado_em else None,
+            "proxima_em": datetime.fromtimestamp(proxima_em).isoformat(timespec="seconds"),
+            "pontuacao_total": resultado.get("pontuacao_total"),
+            "nota_final": resultado.get("nota_final"),
+            "erro": erro,
+            "falhas": falhas
+        })
+    return jsonify({"produtos": produtos})
+
+
+@app.route("/acompanhamento", methods=["POST"])
+def incluir_acompanhamento():
+    """
+    Inclui produtos na lista: {"produtos": [...mesmos campos de /pontuar_lote...], "intervalo_horas": 6}.
+    """
+    dados = request.get_json(silent=True) or {}
+    produtos = dados.get("produtos")
+    if not isinstance(produtos, list) or not produtos:
+        return jsonify({"erro": "Envie {'produtos': [...]} com ao menos um produto."}), 400
+    try:
+        intervalo = float(dados["intervalo_horas"]) * 3600 if dados.get("intervalo_horas") else None
+    except (TypeError, ValueError):
+        return jsonify({"erro": "'intervalo_horas' deve ser numérico."}), 400
+    gravados, erros = acompanhar_produtos(produtos, intervalo)
+    return jsonify({"gravados": gravados, "erros": erros}), 200 if gravados else 400
+
+
+@app.route("/acompanhamento", methods=["DELETE"])
+def remover_acompanhamento():
+    """
+    Remove um produto da lista: {"url": ..., "nome": ...}.
+    """
+    dados = request.get_json(silent=True) or {}
+    cursor = conexao_acompanhamento().execute(
+        "DELETE FROM acompanhamento WHERE url = ? AND nome = ?",
+        (str(dados.get("url") or "").strip(), str(dados.get("nome") or "").strip())
+    )
+    if not cursor.rowcount:
+        return jsonify({"erro": "Produto não está na lista de acompanhamento."}), 404
+    return jsonify({"removido": True})
+
+# FIM LISTA DE ACOMPANHAMENTO (PRÉ-PONTUAÇÃO AGENDADA)
+
+
+# INÍCIO ÍNDICE DE PÁGINAS QUASE DUPLICADAS
+# Ofertas do mesmo nicho costumam sair do mesmo funil de template. Cada página analisada
+# entra num índice LSH no catálogo: a assinatura MinHash (64 valores) é dividida em
+# BANDAS_MINHASH bandas e cada banda vira uma chave indexada. Páginas com alguma banda igual
+# são candidatas, e a similaridade estimada (fração de valores iguais) decide quem é
+# duplicata, sem comparar com o catálogo inteiro. Com 16 bandas de 4 valores, páginas com
+# ~80% dos trechos em comum quase sempre colidem e páginas com menos de ~30% quase nunca.
+BANDAS_MINHASH = 16
+LINHAS_POR_BANDA = PERMUTACOES_MINHASH // BANDAS_MINHASH
+SIMILARIDADE_MINIMA_DUPLICATA = float(os.environ.get("SIMILARIDADE_MINIMA_DUPLICATA", 0.8))
+LIMITE_CANDIDATOS_DUPLICATAS = 500
+LIMITE_DUPLICATAS_EXIBIDAS = 5
+# Critérios de texto (os mais caros) compartilhados entre páginas de conteúdo idêntico
+CRITERIOS_POR_CONTEUDO = ("copywriting", "beneficios_ofertas")
+TTL_CRITERIOS_POR_CONTEUDO = 7 * 24 * 60 * 60
+
+ESQUEMA_INDICE_DUPLICATAS = (
+    "CREATE TABLE IF NOT EXISTS paginas_indexadas ("
+    "url TEXT PRIMARY KEY, nome TEXT NOT NULL, hash TEXT NOT NULL, assinatura BLOB NOT NULL, indexado_em REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS bandas_paginas ("
+    "banda INTEGER NOT NULL, chave INTEGER NOT NULL, url TEXT NOT NULL, PRIMARY KEY (banda, chave, url)) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS idx_bandas_paginas_url ON bandas_paginas (url)",
+)
+
+
+def chaves_bandas(assinatura):
+    """
+    Uma chave inteira (64 bits com sinal, como o SQLite guarda) por banda da assinatura.
+    """
+    return [
+        int.from_bytes(
+            hashlib.blake2b(assinatura[banda * LINHAS_POR_BANDA:(banda + 1) * LINHAS_POR_BANDA].tobytes(), digest_size=8).digest(),
+            "big", signed=True
+        )
+        for banda in range(BANDAS_MINHASH)
+    ]
+
+
+def indexar_pagina(url, nome, impressao):
+    """
+    Grava (ou atualiza) a página no índice de duplicatas. Páginas sem assinatura
+    (quase vazias) ficam de fora; falhas só vão para o log.
+    """
+    if impressao["assinatura"] is None:
+        return
+    try:
+        with transacao_imediata(conexao_catalogo()) as conexao:
+            conexao.execute("DELETE FROM bandas_paginas WHERE url = ?", (url,))
+            conexao.execute(
+                "INSERT OR REPLACE INTO paginas_indexadas (url, nome, hash, assinatura, indexado_em) VALUES (?, ?, ?, ?, ?)",
+                (url, nome, impressao["hash"], impressao["assinatura"].tobytes(), time.time())
+            )
+            conexao.executemany(
+                "INSERT OR IGNORE INTO bandas_paginas (banda, chave, url) VALUES (?, ?, ?)",
+                [(banda, chave, url) for banda, chave in enumerate(chaves_bandas(impressao["assinatura"]))]
+            )
+    except sqlite3.Error as e:
+        logging.error(f"[ERRO] Falha ao indexar {url} no índice de duplicatas: {e}")
+
+
+def paginas_semelhantes(url, limite=LIMITE_DUPLICATAS_EXIBIDAS):
+    """
+    Páginas do catálogo quase idênticas à da URL, da mais parecida para a menos:
+    [{"url", "nome", "similaridade", "identica"}]. Lista vazia se a URL não foi indexada.
+    """
+    try:
+        conexao = conexao_catalogo()
+        linha = conexao.execute("SELECT hash, assinatura FROM paginas_indexadas WHERE url = ?", (url,)).fetchone()
+        if not linha:
+            return []
+        hash_pagina, assinatura = linha[0], np.frombuffer(linha[1], dtype=np.uint64)
+
+        # Candidatas: páginas com ao menos uma banda igual (cada termo do OR usa a chave primária)
+        chaves = chaves_bandas(assinatura)
+        candidatas = [
+            candidata for (candidata,) in conexao.execute(
+                "SELECT DISTINCT url FROM bandas_paginas WHERE ("
+                + " OR ".join(["(banda = ? AND chave = ?)"] * len(chaves))
+                + ") AND url != ? LIMIT ?",
+                [valor for banda, chave in enumerate(chaves) for valor in (banda, chave)]
+                + [url, LIMITE_CANDIDATOS_DUPLICATAS]
+            )
+        ]
+        if not candidatas:
+            return []
+        linhas = conexao.execute(
+            f"SELECT url, nome, hash, assinatura FROM paginas_indexadas WHERE url IN ({', '.join('?' * len(candidatas))})",
+            candidatas
+        ).fetchall()
+    except sqlite3.Error as e:
+        logging.error(f"[ERRO] Índice de duplicatas indisponível: {e}")
+        return []
+
+    semelhantes = []
+    for url_candidata, nome, hash_candidata, assinatura_candidata in linhas:
+        similaridade = float(np.mean(np.frombuffer(assinatura_candidata, dtype=np.uint64) == assinatura))
+        if similaridade >= SIMILARIDADE_MINIMA_DUPLICATA:
+            semelhantes.append({
+                "url": url_candidata,
+                "nome": nome,
+                "similaridade": round(similaridade, 2),
+                "identica": hash_candidata == hash_pagina
+            })
+    semelhantes.sort(key=lambda item: (item["identica"], item["similaridade"]), reverse=True)
+    return semelhantes[:limite]
+
+
+def chave_criterio_por_conteudo(criterio, hash_conteudo):
+    return f"conteudo|{criterio}={VERSOES_CRITERIOS[criterio]}|{hash_conteudo}"
+
+
+def ler_criterio_por_conteudo(criterio, hash_conteudo):
+    try:
+        return ler_cache_compartilhado(chave_criterio_por_conteudo(criterio, hash_conteudo))
+    except sqlite3.Error as e:
+        logging.error(f"[ERRO] Cache compartilhado indisponível: {e}")
+        return None
+
+
+def gravar_criterio_por_conteudo(criterio, hash_conteudo, resultado):
+    try:
+        gravar_cache_compartilhado(
+            chave_criterio_por_conteudo(criterio, hash_conteudo), resultado, TTL_CRITERIOS_POR_CONTEUDO
+        )
+    except sqlite3.Error as e:
+        logging.error(f"[ERRO] Falha ao gravar no cache compartilhado: {e}")
+
+
+@app.route("/duplicatas", methods=["GET"])
+def duplicatas():
+    """
+    Páginas quase idênticas à de uma URL já analisada. Ex.: /duplicatas?url=https://...&limite=20
+    """
+    url = request.args.get("url", "").strip()
+    if not url:
+        return jsonify({"erro": "Informe a 'url' da página."}), 400
+    try:
+        limite = int(request.args.get("limite", LIMITE_DUPLICATAS_EXIBIDAS))
+    except ValueError:
+        return jsonify({"erro": "'limite' deve ser um número inteiro."}), 400
+    return jsonify({"url": url, "duplicatas": paginas_semelhantes(url, max(1, min(limite, LIMITE_CANDIDATOS_DUPLICATAS)))})
+
+# FIM ÍNDICE DE PÁGINAS QUASE DUPLICADAS
+
+
+# INÍCIO TRABALHO EM SEGUNDO PLANO
+# Sobe os workers da fila e o agendador assim que o módulo termina de carregar (todas as
+# funções já definidas), sem esperar a primeira requisição: um worker do gunicorn que
+# acabou de reiniciar já retoma os jobs pendentes e o acompanhamento.
+iniciar_workers_fila()
+iniciar_agendador_acompanhamento()
+# FIM TRABALHO EM SEGUNDO PLANO
 
 
 if __name__ == "__main__":
@@ -0,0 +1,279 @@
+"""
+Pontuação de catálogos fora do servidor web.
+
+Lê produtos de um CSV ou JSONL (mesmos campos de /pontuar_lote), baixa as páginas
+num pool de threads e roda a pontuação (interpretação do HTML e comparações) num
+pool de processos. Os resultados são gravados em CSV, JSONL ou Parquet, e o
+arquivo de checkpoint permite retomar uma execução interrompida. Só produtos pontuados
+com sucesso entram no checkpoint: os que falharam (página fora do ar, disjuntor do
+domínio aberto etc.) são tentados de novo na próxima execução.
+
+Exemplo:
+    python pontuar_catalogo.py produtos.jsonl -o resultados.parquet --processos 4 --threads 16
+"""
+import argparse
+import concurrent.futures
+import csv
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import sys
+
+import pandas as pd
+
+# O script só usa as funções de pontuação: sem workers da fila nem agendador
+os.environ.setdefault("FILA_ANALISES_ATIVA", "0")
+os.environ.setdefault("ACOMPANHAMENTO_ATIVO", "0")
+
+import app
+
+FORMATOS_SAIDA = ("csv", "jsonl", "parquet")
+CAMPOS_BOOLEANOS = ("permissao_trafego_pago", "permissao_fundo_funil") + app.CAMPOS_REDES_SOCIAIS
+VALORES_VERDADEIROS = app.VALORES_VERDADEIROS
+
+# Colunas da saída em CSV/Parquet (listas e dicionários ficam de fora)
+COLUNAS_SAIDA = [
+    "id", "status", "erro", "nome", "url", "categoria",
+    "pontuacao_qualidade_pagina", "pontuacao_copywriting", "pontuacao_beneficios_ofertas",
+    "pontuacao_preco_valor_percebido", "pontuacao_faixa_precos", "pontuacao_sazonalidade",
+    "pontuacao_seo_palavras", "pontuacao_permissao", "pontuacao_volume_busca",
+    "pontuacao_concorrencia_cpc", "pontuacao_keyword", "pontuacao_seo_basico",
+    "pontuacao_ctr", "pontuacao_redes_sociais", "pontuacao_total", "nota_final",
+    "avg_cpc", "total_palavras_chave", "feedback_preco_valor", "descricao_ctr", "descricao_sazonalidade"
+]
+
+
+def ler_produtos(caminho):
+    """
+    Lê os produtos do CSV ou JSONL. No CSV, "palavras_chave" é uma lista JSON
+    e os campos booleanos aceitam sim/não, true/false ou 1/0.
+    """
+    with open(caminho, encoding="utf-8-sig", newline="") as arquivo:
+        if caminho.lower().endswith((".jsonl", ".ndjson")):
+            produtos = [json.loads(linha) for linha in arquivo if linha.strip()]
+        else:
+            produtos = []
+            for linha in csv.DictReader(arquivo):
+                produto = dict(linha)
+                palavras_chave = (produto.get("palavras_chave") or "").strip()
+                produto["palavras_chave"] = json.loads(palavras_chave) if palavras_chave else []
+                for campo in CAMPOS_BOOLEANOS:
+                    if campo in produto:
+                        produto[campo] = str(produto[campo]).strip().lower() in VALORES_VERDADEIROS
+                produtos.append(produto)
+
+    # Sem "id" na entrada, a posição no arquivo identifica o produto no checkpoint
+    for posicao, produto in enumerate(produtos):
+        produto.setdefault("id", str(posicao))
+        produto["id"] = str(produto["id"])
+    return produtos
+
+
+def ler_checkpoint(caminho):
+    if not os.path.exists(caminho):
+        return set()
+    with open(caminho, encoding="utf-8") as arquivo:
+        return {linha.strip() for linha in arquivo if linha.strip()}
+
+
+def baixar_pagina(produto):
+    """
+    Etapa de rede (pool de threads): baixa o HTML do produto.
+    """
+    url = str(produto.get("url") or "").strip()
+    download = app.baixar_html(url, timeout=10)
+    if not download:
+        raise ValueError(app.motivo_falha_recente(url) or "Página não carregou ou não é HTML.")
+    return download["conteudo"], download["content_type"]
+
+
+def abrir_gravador(caminho, formato, caminho_checkpoint):
+    """
+    Prepara a gravação incremental: cada resultado é gravado assim que fica pronto e,
+    se deu certo, seu id vai para o checkpoint. Em Parquet, os resultados vão para um
+    JSONL parcial que só é convertido quando o catálogo termina.
+    """
+    caminho_parcial = caminho + ".parcial.jsonl" if formato == "parquet" else caminho
+    novo = not os.path.exists(caminho_parcial) or os.path.getsize(caminho_parcial) == 0
+    gravador = {
+        "caminho": caminho,
+        "formato": formato,
+        "caminho_parcial": caminho_parcial,
+        "arquivo": open(caminho_parcial, "a", encoding="utf-8", newline=""),
+        "checkpoint": open(caminho_checkpoint, "a", encoding="utf-8"),
+        "escritor_csv": None,
+        # Retomando, a saída pode ter linhas de erro de produtos que serão tentados de novo
+        "retomado": not novo
+    }
+    if formato == "csv":
+        gravador["escritor_csv"] = csv.DictWriter(gravador["arquivo"], fieldnames=COLUNAS_SAIDA, extrasaction="ignore")
+        if novo:
+            gravador["escritor_csv"].writeheader()
+    return gravador
+
+
+def gravar_resultado(gravador, resultado):
+    if gravador["escritor_csv"]:
+        gravador["escritor_csv"].writerow(resultado)
+    else:
+        gravador["arquivo"].write(json.dumps(resultado, ensure_ascii=False, default=str) + "\n")
+    gravador["arquivo"].flush()
+    if resultado["status"] == "ok":
+        gravador["checkpoint"].write(resultado["id"] + "\n")
+        gravador["checkpoint"].flush()
+
+
+def fechar_gravador(gravador, completo):
+    """
+    Fecha os arquivos; em Parquet, converte o JSONL parcial apenas se a execução terminou
+    (interrompida, o parcial fica para a próxima execução continuar). Numa execução
+    retomada que terminou, cada produto fica só com o resultado mais recente.
+    """
+    gravador["arquivo"].close()
+    gravador["checkpoint"].close()
+    if not completo:
+        return
+    if gravador["formato"] == "parquet":
+        resultados = pd.read_json(gravador["caminho_parcial"], lines=True, dtype=False)
+        resultados = resultados.drop_duplicates(subset="id", keep="last")
+        resultados.reindex(columns=COLUNAS_SAIDA).to_parquet(gravador["caminho"], index=False)
+        os.remove(gravador["caminho_parcial"])
+    elif gravador["retomado"]:
+        manter_ultimo_resultado(gravador["caminho"], gravador["formato"])
+
+
+def manter_ultimo_resultado(caminho, formato):
+    """
+    Reescreve a saída CSV/JSONL deixando uma linha por id (a última gravada).
+    """
+    with open(caminho, encoding="utf-8", newline="") as arquivo:
+        if formato == "csv":
+            linhas = list(csv.DictReader(arquivo))
+        else:
+            linhas = [json.loads(linha) for linha in arquivo if linha.strip()]
+    ultimas = {}
+    for linha in linhas:
+        ultimas.pop(str(linha["id"]), None)
+        ultimas[str(linha["id"])] = linha
+    if len(ultimas) == len(linhas):
+        return
+
+    temporario = caminho + ".tmp"
+    with open(temporario, "w", encoding="utf-8", newline="") as arquivo:
+        if formato == "csv":
+            escritor = csv.DictWriter(arquivo, fieldnames=COLUNAS_SAIDA, extrasaction="ignore")
+            escritor.writeheader()
+            escritor.writerows(ultimas.values())
+        else:
+            for linha in ultimas.values():
+                arquivo.write(json.dumps(linha, ensure_ascii=False, default=str) + "\n")
+    os.replace(temporario, caminho)
+
+
+def montar_resultado(produto, pontuacao=None, erro=None):
+    resultado = {
+        "id": produto["id"],
+        "status": "erro" if erro else "ok",
+        "erro": erro,
+        "nome": produto.get("nome"),
+        "url": produto.get("url"),
+        "categoria": produto.get("categoria")
+    }
+    if pontuacao:
+        resultado.update(pontuacao)
+    return resultado
+
+
+def pontuar_catalogo(produtos, gravador, processos, threads, limite_em_andamento):
+    """
+    Encadeia download (threads) e pontuação (processos), mantendo no máximo
+    `limite_em_andamento` produtos em memória ao mesmo tempo.
+    """
+    pendentes = iter(produtos)
+    concluidos = 0
+    # Mesmo contexto do pool do servidor: com "fork" os filhos herdariam travas presas
+    # pelas threads de download
+    metodos = multiprocessing.get_all_start_methods()
+    contexto = app.CONTEXTO_PROCESSOS_CRITERIOS if app.CONTEXTO_PROCESSOS_CRITERIOS in metodos else None
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as rede, \
+            concurrent.futures.ProcessPoolExecutor(
+                max_workers=processos, mp_context=multiprocessing.get_context(contexto)
+            ) as cpu:
+        em_andamento = {}
+
+        def agendar_download():
+            produto = next(pendentes, None)
+            if produto is not None:
+                em_andamento[rede.submit(baixar_pagina, produto)] = ("download", produto)
+
+        for _ in range(limite_em_andamento):
+            agendar_download()
+
+        while em_andamento:
+            prontos, _ = concurrent.futures.wait(em_andamento, return_when=concurrent.futures.FIRST_COMPLETED)
+            for futuro in prontos:
+                etapa, produto = em_andamento.pop(futuro)
+                try:
+                    if etapa == "download":
+                        conteudo, content_type = futuro.result()
+                        em_andamento[cpu.submit(app.pontuar_pagina_html, produto, conteudo, content_type)] = ("pontuacao", produto)
+                        continue
+                    resultado = montar_resultado(produto, pontuacao=futuro.result())
+                except Exception as e:
+                    resultado = montar_resultado(produto, erro=str(e))
+
+                gravar_resultado(gravador, resultado)
+                concluidos += 1
+                if concluidos % 50 == 0:
+                    print(f"[CATALOGO] {concluidos} produto(s) pontuado(s)...", file=sys.stderr)
+                agendar_download()
+    return concluidos
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Pontua um catálogo de produtos sem passar pelo servidor web.")
+    parser.add_argument("entrada", help="Arquivo CSV ou JSONL com os produtos")
+    parser.add_argument("-o", "--saida", required=True, help="Arquivo de saída (.csv, .jsonl ou .parquet)")
+    parser.add_argument("--formato", choices=FORMATOS_SAIDA, help="Formato da saída (padrão: pela extensão)")
+    parser.add_argument("--checkpoint", help="Arquivo de checkpoint (padrão: <saida>.checkpoint)")
+    parser.add_argument("--processos", type=int, default=os.cpu_count() or 1, help="Processos para a pontuação")
+    parser.add_argument("--threads", type=int, default=16, help="Threads para os downloads")
+    parser.add_argument("--verboso", action="store_true", help="Mantém os logs de depuração do app")
+    args = parser.parse_args(argumentos)
+
+    formato = args.formato or os.path.splitext(args.saida)[1].lstrip(".").lower()
+    if formato == "ndjson":
+        formato = "jsonl"
+    if formato not in FORMATOS_SAIDA:
+        parser.error(f"Formato de saída não reconhecido: '{formato}'. Use --formato {{{','.join(FORMATOS_SAIDA)}}}.")
+    if formato == "parquet" and not (importlib.util.find_spec("pyarrow") or importlib.util.find_spec("fastparquet")):
+        print("[ERRO] A saída em Parquet precisa do pacote 'pyarrow' (pip install pyarrow). "
+              "Use .csv ou .jsonl ou instale o pacote.", file=sys.stderr)
+        return 2
+
+    if not args.verboso:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    caminho_checkpoint = args.checkpoint or args.saida + ".checkpoint"
+    feitos = ler_checkpoint(caminho_checkpoint)
+    produtos = [produto for produto in ler_produtos(args.entrada) if produto["id"] not in feitos]
+    print(f"[CATALOGO] {len(produtos)} produto(s) a pontuar ({len(feitos)} já no checkpoint).", file=sys.stderr)
+
+    gravador = abrir_gravador(args.saida, formato, caminho_checkpoint)
+    completo = False
+    try:
+        concluidos = pontuar_catalogo(
+            produtos, gravador, max(1, args.processos), max(1, args.threads),
+            limite_em_andamento=max(1, args.threads) + 2 * max(1, args.processos)
+        )
+        completo = True
+    finally:
+        fechar_gravador(gravador, completo)
+    print(f"[CATALOGO] Concluído: {concluidos} produto(s) gravado(s) em {args.saida}.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,19 @@
+import os
+import sys
+import tempfile
+
+# Bancos SQLite em diretório temporário, sem workers da fila, sem agendador de
+# acompanhamento e sem pool de processos (os critérios de página são calculados no próprio processo) durante os testes
+_diretorio_bancos = tempfile.mkdtemp(prefix="produto-testes-")
+for variavel, arquivo in (
+    ("CACHE_COMPARTILHADO_DB", "cache_resultados.sqlite3"),
+    ("FILA_ANALISES_DB", "fila_analises.sqlite3"),
+    ("CATALOGO_PRODUTOS_DB", "catalogo_produtos.sqlite3"),
+    ("ACOMPANHAMENTO_DB", "acompanhamento.sqlite3"),
+):
+    os.environ.setdefault(variavel, os.path.join(_diretorio_bancos, arquivo))
+os.environ.setdefault("FILA_ANALISES_ATIVA", "0")
+os.environ.setdefault("ACOMPANHAMENTO_ATIVO", "0")
+os.environ.setdefault("PROCESSOS_CRITERIOS", "0")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,131 @@
+"""
+Estado por requisição e clientes de API sob workers com threads.
+"""
+import asyncio
+import threading
+
+import pytest
+
+import app
+
+THREADS = 16
+
+
+def rodar_em_threads(funcao, quantidade=THREADS):
+    """
+    Roda `funcao(indice)` em `quantidade` threads novas, liberadas juntas por uma barreira.
+    Retorna os resultados na ordem dos índices e repassa a primeira exceção.
+    """
+    barreira = threading.Barrier(quantidade)
+    resultados = [None] * quantidade
+    erros = []
+
+    def alvo(indice):
+        try:
+            barreira.wait()
+            resultados[indice] = funcao(indice)
+        except Exception as e:
+            erros.append(e)
+
+    threads = [threading.Thread(target=alvo, args=(indice,)) for indice in range(quantidade)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if erros:
+        raise erros[0]
+    return resultados
+
+
+def test_rotacao_de_frases_nao_e_compartilhada_entre_requisicoes():
+    total_frases = len(app.FRASES_COMPILADAS["custo_beneficio"]["cenario1"])
+
+    def analisar(indice):
+        with app.app.test_request_context("/"):
+            rotacao = app.obter_rotacao_frases()
+            assert app.obter_rotacao_frases() is rotacao
+            frases = [
+                app.selecionar_comparacao("custo_beneficio", "cenario1", nome=f"Produto {indice}", cpcs="$1.00")
+                for _ in range(total_frases)
+            ]
+            return rotacao, frases
+
+    resultados = rodar_em_threads(analisar)
+
+    rotacoes = [rotacao for rotacao, _ in resultados]
+    assert len({id(rotacao) for rotacao in rotacoes}) == THREADS
+    assert len({id(rotacao["sacos"]) for rotacao in rotacoes}) == THREADS
+    for indice, (_, frases) in enumerate(resultados):
+        # Cada análise esgota o seu próprio saco: nenhuma frase repetida nem perdida para outra thread
+        assert len(set(frases)) == total_frases
+        assert all(f"Produto {indice}" in frase for frase in frases)
+
+
+def test_mesma_semente_gera_a_mesma_sequencia_em_paralelo():
+    def sortear(_):
+        with app.app.test_request_context("/?semente_frases=7"):
+            rotacao = app.obter_rotacao_frases()
+            return [app.sortear_frase(rotacao, "conclusao", "cenario1") for _ in range(25)]
+
+    sequencias = rodar_em_threads(sortear)
+    assert all(sequencia == sequencias[0] for sequencia in sequencias)
+
+
+class ClienteFalso:
+    def __init__(self, *args, **kwargs):
+        self.kwargs = kwargs
+
+
+def test_um_cliente_trends_por_thread(monkeypatch):
+    monkeypatch.setattr(app, "TrendReq", ClienteFalso)
+    monkeypatch.setattr(app, "_clientes_trends", threading.local())
+
+    def obter(_):
+        cliente = app.obter_cliente_trends()
+        assert app.obter_cliente_trends() is cliente
+        return cliente
+
+    clientes = rodar_em_threads(obter)
+    assert len({id(cliente) for cliente in clientes}) == THREADS
+    assert all(cliente.kwargs == app.CONFIG_TRENDS for cliente in clientes)
+
+
+def test_um_cliente_reddit_por_thread(monkeypatch):
+    monkeypatch.setattr(app.praw, "Reddit", ClienteFalso)
+    monkeypatch.setattr(app, "_clientes_reddit", threading.local())
+
+    def obter(_):
+        cliente = app.obter_cliente_reddit()
+        assert app.obter_cliente_reddit() is cliente
+        return cliente
+
+    clientes = rodar_em_threads(obter)
+    assert len({id(cliente) for cliente in clientes}) == THREADS
+
+
+def test_chamadas_presas_nao_ocupam_o_executor_inteiro(monkeypatch):
+    monkeypatch.setattr(app, "_vagas_chamadas_com_prazo", threading.BoundedSemaphore(1))
+    liberar = threading.Event()
+    chamadas = []
+
+    def presa():
+        chamadas.append("presa")
+        liberar.wait(5)
+
+    def rapida():
+        chamadas.append("rapida")
+        return "ok"
+
+    async def cenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await app.executar_em_thread(presa, timeout=0.1)
+        # A chamada presa ainda ocupa a única vaga: a próxima nem chega ao executor
+        with pytest.raises(asyncio.TimeoutError):
+            await app.executar_em_thread(rapida, timeout=0.1)
+        # Chamadas sem prazo não dependem das vagas
+        assert await app.executar_em_thread(rapida) == "ok"
+        liberar.set()
+        assert await app.executar_em_thread(rapida, timeout=2) == "ok"
+
+    asyncio.run(cenario())
+    assert chamadas == ["presa", "rapida", "rapida"]
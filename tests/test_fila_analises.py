@@ -0,0 +1,83 @@
+"""
+Fila de análises: reenfileiramento, streaming dos eventos e resultado guardado do job.
+"""
+import json
+import time
+
+import pytest
+
+import app
+
+
+@pytest.fixture(autouse=True)
+def fila_vazia():
+    # Cada teste reserva o próximo job pendente: começa sem jobs de outros testes
+    conexao = app.conexao_fila()
+    conexao.execute("DELETE FROM jobs")
+    conexao.execute("DELETE FROM job_eventos")
+
+
+def test_job_reenfileirado_descarta_eventos_da_tentativa_anterior():
+    job_id = app.enfileirar_analise({"nome_produto_1": "Produto A", "nome_produto_2": "Produto B"})
+    reservado, _ = app.reservar_proximo_job("worker-morto")
+    assert reservado == job_id
+    app.registrar_evento_job(job_id, "iniciado")
+    app.registrar_evento_job(job_id, "produto_concluido", {"indice": 1, "nome": "Produto A", "valido": True})
+
+    # Worker parou de dar sinal de vida
+    app.conexao_fila().execute(
+        "UPDATE jobs SET atualizado_em = ?, produtos_concluidos = 1 WHERE id = ?",
+        (time.time() - app.TEMPO_JOB_ABANDONADO - 1, job_id)
+    )
+    reservado, _ = app.reservar_proximo_job("worker-novo")
+    assert reservado == job_id
+    app.registrar_evento_job(job_id, "iniciado")
+    app.registrar_evento_job(job_id, "produto_concluido", {"indice": 1, "nome": "Produto A", "valido": True})
+
+    status = app.status_job(job_id)
+    assert [evento["tipo"] for evento in status["eventos"]] == ["reiniciado", "iniciado", "produto_concluido"]
+    assert status["produtos_concluidos"] == 0
+
+
+def test_stream_fecha_no_prazo_e_reconexao_continua_pelo_last_event_id(monkeypatch):
+    monkeypatch.setattr(app, "DURACAO_MAXIMA_SSE", 0.5)
+    job_id = app.enfileirar_analise({"nome_produto_1": "Produto A"})
+    cliente = app.app.test_client()
+
+    inicio = time.time()
+    primeira = cliente.get(f"/jobs/{job_id}/eventos").get_data(as_text=True)
+    assert time.time() - inicio < 5
+    assert primeira.startswith(f"retry: {app.RECONEXAO_SSE_MS}\n\n")
+    ultimo_id = [linha for linha in primeira.splitlines() if linha.startswith("id: ")][-1][4:]
+
+    app.registrar_evento_job(job_id, "iniciado")
+    app.registrar_evento_job(job_id, "erro", {"mensagem": "falhou"})
+    segunda = cliente.get(f"/jobs/{job_id}/eventos", headers={"Last-Event-ID": ultimo_id}).get_data(as_text=True)
+    assert "event: criado" not in segunda
+    assert "event: iniciado" in segunda and "event: erro" in segunda
+
+
+def test_resultado_do_job_guarda_so_a_contagem_das_palavras_importadas(monkeypatch):
+    monkeypatch.setattr(app, "obter_criterios_pagina", lambda *args: app.criterios_pagina_indisponivel("Sem rede."))
+    monkeypatch.setattr(app, "analisar_sazonalidade", lambda nome: (0, "Sem dados."))
+    total = app.LIMITE_PALAVRAS_CHAVE_EDITAVEIS + 70
+    arquivo = "palavra\tvolume\tcpc\n" + "".join(f"termo{i:03d}\t{1000 - i}\t0.5\n" for i in range(total))
+    job_id = app.enfileirar_analise({
+        "nicho": "Saúde",
+        "nome_produto_1": "Produto A",
+        "url_produto_1": "http://exemplo.invalid/a",
+        "categoria_produto_1": "Saúde e Bem-Estar",
+        "palavras_chave_importadas_1": arquivo,
+    })
+    app.executar_job(*app.reservar_proximo_job("worker-teste"))
+
+    resultado = app.conexao_fila().execute("SELECT resultado FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+    produto = json.loads(resultado)["produtos"][0]
+    assert "palavras_chave_importadas" not in produto
+    assert produto["total_palavras_chave"] == total
+    assert len(produto["palavras_chave"]) == app.LIMITE_PALAVRAS_CHAVE_EDITAVEIS
+
+    # A página de resultado relê as excedentes do payload para o campo oculto de reenvio
+    pagina = app.app.test_client().get(f"/jobs/{job_id}/resultado").get_data(as_text=True)
+    assert 'name="palavras_chave_importadas_1"' in pagina
+    assert f"termo{total - 1:03d}" in pagina
@@ -0,0 +1,113 @@
+"""
+Reaproveitamento dos critérios de página pela impressão digital do conteúdo.
+"""
+import json
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+import app
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PALAVRAS = (
+    "method results guarantee bonus access lifetime members support video module lesson training "
+    "complete simple proven system daily routine energy health weight body mind focus plan step guide "
+    "exclusive offer today discount secure checkout instant download community coaching expert"
+).split()
+CRITERIOS_DE_PRECO = {"preco_valor_percebido", "faixa_precos"}
+
+
+def pagina_de_vendas(preco, semente=3):
+    """
+    Página com ~1500 palavras em que só o preço varia.
+    """
+    gerador = random.Random(semente)
+    paragrafos = "".join(
+        "<p>" + " ".join(gerador.choice(PALAVRAS) for _ in range(50)) + "</p>" for _ in range(30)
+    )
+    return (
+        "<html><head><title>Produto Teste</title><meta name='description' content='Guia completo'></head>"
+        f"<body><h1>Produto Teste</h1>{paragrafos}<div class='preco'>Por apenas R${preco} à vista</div>"
+        "<button>Comprar agora</button></body></html>"
+    ).encode("utf-8")
+
+
+@pytest.fixture
+def criterios_calculados(monkeypatch):
+    """
+    Registra os critérios que precisaram ser calculados a cada chamada.
+    """
+    chamadas = []
+    original = app.calcular_criterios_faltando
+
+    def espiar(url, nome_produto, categoria, download, faltando):
+        chamadas.append(set(faltando))
+        return original(url, nome_produto, categoria, download, faltando)
+
+    monkeypatch.setattr(app, "calcular_criterios_faltando", espiar)
+    return chamadas
+
+
+def pontuar(url, preco):
+    download = app.download_de_bytes(url, pagina_de_vendas(preco), "text/html; charset=utf-8")
+    return app.calcular_criterios_pagina(url, "Produto Teste", "Saúde e Bem-Estar", download)
+
+
+def test_pagina_identica_nao_recalcula_nada(criterios_calculados):
+    url = "http://exemplo.test/identica"
+    pontuar(url, 197)
+    pontuar(url, 197)
+    assert len(criterios_calculados) == 1
+
+
+@pytest.mark.parametrize("novo_preco", [97, 497, 1997])
+def test_mudanca_so_de_preco_recalcula_criterios_de_preco(criterios_calculados, novo_preco):
+    url = f"http://exemplo.test/preco-{novo_preco}"
+    original = app.impressao_digital_pagina(app.download_de_bytes(url, pagina_de_vendas(197), "text/html"))
+    alterada = app.impressao_digital_pagina(app.download_de_bytes(url, pagina_de_vendas(novo_preco), "text/html"))
+    # Premissa: a troca de preço fica dentro da distância de "página quase igual"
+    assert original["hash"] != alterada["hash"]
+    assert app.distancia_hamming(original["simhash"], alterada["simhash"]) <= app.DISTANCIA_MAXIMA_SIMHASH
+
+    pontuar(url, 197)
+    pontuar(url, novo_preco)
+
+    recalculados = criterios_calculados[-1]
+    assert CRITERIOS_DE_PRECO <= recalculados
+    assert not recalculados & set(app.CRITERIOS_REAPROVEITADOS_SIMHASH)
+
+
+def test_outro_worker_usa_a_mesma_referencia_e_nao_reindexa(monkeypatch):
+    indexadas = []
+    monkeypatch.setattr(app, "indexar_pagina", lambda url, nome, impressao: indexadas.append(url))
+    url = "http://exemplo.test/compartilhada"
+    pontuar(url, 197)
+    pontuar(url, 197)
+    assert indexadas == [url]
+
+    # Outro processo (outro worker do gunicorn) baixa a versão com o preço novo
+    codigo = (
+        "import json, sys, app; "
+        "download = app.download_de_bytes(sys.argv[1], sys.stdin.buffer.read(), 'text/html'); "
+        "print(json.dumps(app.chave_conteudo_pagina(sys.argv[1], app.impressao_digital_pagina(download))))"
+    )
+    saida = subprocess.run(
+        [sys.executable, "-c", codigo, url], input=pagina_de_vendas(97), capture_output=True, check=True, cwd=RAIZ
+    )
+    referencia = app.impressao_digital_pagina(app.download_de_bytes(url, pagina_de_vendas(197), "text/html"))
+    assert json.loads(saida.stdout.decode().splitlines()[-1]) == [referencia["hash"], False]
+
+
+def test_sem_download_zera_criterios_sem_baixar_a_pagina(monkeypatch):
+    def proibido(*args, **kwargs):
+        raise AssertionError("critério tentou baixar a página sozinho")
+
+    monkeypatch.setattr(app, "carregar_pagina", proibido)
+    monkeypatch.setattr(app, "baixar_html", proibido)
+    criterios = app.calcular_criterios_pagina("http://exemplo.test/fora", "Produto Teste", "Saúde e Bem-Estar", None)
+    assert criterios["pagina_inacessivel"]
+    assert all(criterios[criterio] == 0 for criterio in ("qualidade_pagina", "copywriting", "faixa_precos", "seo_basico"))